@@ -0,0 +1,146 @@
+"""
+Compare the previous post-processing of scraped announcements, which
+set the amenity flags, USD price and price per square metre one
+announcement at a time and rewrote the dates with a regex `replace`
+over the frame, with `derive_columns`, which computes them for a whole
+section at once. Both must give the same values.
+
+The records are copies of the recorded announcement with varied dates,
+prices and amenities. Sections of announcements carried forward from the
+ad index, whose dates are already datetimes, alone and mixed with newly
+scraped ones, must give the same values as well.
+
+Run from the repository root with ``python -m benchmarks.bench_derive``.
+"""
+from copy import copy
+from os import path
+from re import compile
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from numpy import allclose, array_equal, nan, random
+from pandas import to_datetime
+
+from scraper.derive import MONTHS, derive_columns
+from scraper.index import AdIndex
+from scraper.parser import AMENITIES, parse_announcement
+from scraper.records import RAW_COLUMNS, ListingCard, records_to_frame
+
+
+FIXTURES = path.join(path.dirname(__file__), 'fixtures')
+SECTION_SIZES = [100, 500, 1000, 5000]
+REPEAT = 5
+TODAY, YESTERDAY = '18-10-2021', '17-10-2021'
+USD_TO_UZS = 10650.0
+MONTH_DICT = {
+    ' г.': '', **{f' {name} ': f'-{number:02d}-' for name, number in MONTHS.items()},
+    compile('^Сегодня.*'): TODAY, compile('^Вчера.*'): YESTERDAY
+}
+
+
+def make_records(size, seed=0):
+    """Return `size` records parsed from the recorded announcement with varied fields."""
+    with open(path.join(FIXTURES, 'ad.html'), encoding='utf-8') as file:
+        template = parse_announcement(file.read(), 'ad.html')
+    rng = random.default_rng(seed)
+    amenities = list(AMENITIES.values())
+    months = list(MONTHS)
+    records = []
+    for number in range(size):
+        record = copy(template)
+        record.link = f'https://www.olx.uz/obyavlenie/kvartira-ID{number}.html'
+        kind = rng.integers(4)
+        if kind == 0:
+            record.date = 'Сегодня в 10:15'
+        elif kind == 1:
+            record.date = 'Вчера в 18:40'
+        else:
+            record.date = f'{rng.integers(1, 29)} {months[rng.integers(12)]} 2021 г.'
+        record.currency = 'UZS' if rng.random() < 0.3 else 'USD'
+        record.raw_price = float(rng.integers(15, 250) * 1000)
+        if record.currency == 'UZS':
+            record.raw_price *= USD_TO_UZS
+        record.area = int(rng.integers(0, 200))
+        chosen = rng.random(len(amenities)) < 0.5
+        record.close_things = ', '.join(name for name, keep in zip(amenities, chosen) if keep)
+        records.append(record)
+    return records
+
+
+def legacy_post_processing(records):
+    """Post-processing as it ran in `scrape_announcement` and `_scrape_and_save`."""
+    for record in records:
+        for column, amenity in AMENITIES.items():
+            setattr(record, column, amenity in record.close_things)
+        price = record.raw_price
+        if record.currency == 'UZS':
+            price = price / USD_TO_UZS
+        elif record.currency != 'USD':
+            price = nan
+        record.price = price
+        try:
+            record.price_m2 = record.price / record.area
+        except ZeroDivisionError:
+            pass
+    df = records_to_frame(records).drop(columns=RAW_COLUMNS)
+    df.loc[:, 'date'] = df.loc[:, 'date'].replace(MONTH_DICT, regex=True)
+    return df
+
+
+def batched_post_processing(records):
+    return derive_columns(records_to_frame(records), TODAY, USD_TO_UZS)
+
+
+def carried_records(frame):
+    """Return the records of `frame` as carried forward from an ad index."""
+    with TemporaryDirectory() as folder:
+        index = AdIndex(path.join(folder, 'ad-index.pkl'), TODAY, YESTERDAY)
+        cards = [ListingCard(link, price=1.0, currency='у.е.') for link in frame['link']]
+        for card in cards:
+            index.observe(card)
+        index.update(frame)
+        return [index.carry_forward(card) for card in cards]
+
+
+def assert_same_values(expected, derived):
+    for column in AMENITIES:
+        assert array_equal(expected[column].to_numpy(bool), derived[column].to_numpy(bool))
+    for column in ['price', 'price_m2']:
+        assert allclose(expected[column].to_numpy(float), derived[column].to_numpy(float),
+                        equal_nan=True), column
+    assert (expected['date'] == derived['date']).all()
+
+
+def check_carried_forward(size):
+    """Derive sections carried forward from the ad index, alone and mixed with new records."""
+    batched = batched_post_processing(make_records(size))
+    carried = carried_records(batched)
+    assert_same_values(batched, batched_post_processing(carried))
+    fresh = make_records(size)
+    mixed = [carried[number] if number % 2 else fresh[number] for number in range(size)]
+    assert_same_values(batched, batched_post_processing(mixed))
+
+
+def main():
+    for size in SECTION_SIZES:
+        seconds = {}
+        frames = {}
+        for name, post_process in (('legacy', legacy_post_processing),
+                                   ('batched', batched_post_processing)):
+            seconds[name] = float('inf')
+            for _ in range(REPEAT):
+                records = make_records(size)
+                begin = perf_counter()
+                frames[name] = post_process(records)
+                seconds[name] = min(seconds[name], perf_counter() - begin)
+
+        legacy = frames['legacy'].assign(
+            date=to_datetime(frames['legacy']['date'], format='%d-%m-%Y'))
+        assert_same_values(legacy, frames['batched'])
+        check_carried_forward(size)
+        print(f'{size:>5} announcements, best of {REPEAT}: legacy {seconds["legacy"] * 1000:.1f} ms,'
+              f' batched {seconds["batched"] * 1000:.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
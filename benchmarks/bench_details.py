@@ -0,0 +1,105 @@
+"""
+Check that the table-driven `parse_details` gives the same fields as the
+previous per-field regex parser on the recorded announcement, and
+compare the time both take per announcement. The amenities are now
+derived for a whole section by `derive_columns` and are compared in
+`bench_derive`.
+
+Run from the repository root with ``python -m benchmarks.bench_details``.
+"""
+from os import path
+from re import compile, sub
+from timeit import timeit
+
+from scraper.backends import get_backend
+from scraper.parser import AMENITIES, parse_details
+from scraper.records import COLUMN_NAMES, Announcement
+
+
+FIXTURES = path.join(path.dirname(__file__), 'fixtures')
+REPEAT = 2000
+COMPARED = [name for name in COLUMN_NAMES if name not in AMENITIES]
+
+
+def legacy_parse_details(other_details, record):
+    """Previous parser: one freshly compiled regex and one scan per field."""
+    fields = [
+        (r'Тип жилья: (.*)', 'home_type', str),
+        (r'Количество комнат: (\d+).*', 'num_rooms', int),
+        (r'Общая площадь: (\d+).*', 'area', int),
+        (r'Этаж: (\d+).*', 'apart_floor', int),
+        (r'Этажность дома: (\d+).*', 'home_floor', int),
+        (r'Тип строения: (.*)', 'build_type', str),
+        (r'Планировка: (.*)', 'build_plan', str),
+        (r'Год постройки.*(\d{4})', 'build_year', int),
+        (r'Санузел: (.*)', 'bathroom', str),
+        (r'Меблирована: (.*)', 'furnished', {'Да': True, 'Нет': False}.get),
+        (r'Ремонт: (.*)', 'condition', str),
+        (r'Комиссионные: (.*)', 'commission', {'Да': True, 'Нет': False}.get),
+    ]
+    for pattern, column, converter in fields:
+        try:
+            pattern = compile(pattern)
+            value = list(filter(pattern.match, other_details))[0]
+            setattr(record, column, converter(sub(pattern, r'\1', value)))
+        except:
+            pass
+
+    try:
+        height_pattern = compile(r'Высота потолков: (.*)')
+        height = list(filter(height_pattern.match, other_details))[0]
+        height = float(sub(height_pattern, r'\1', height))
+        if height > 150:
+            height /= 100
+        elif height >= 20:
+            height /= 10
+        record.ceil_height = height
+    except:
+        pass
+
+    try:
+        close_things_pattern = compile(r'Рядом есть:')
+        close_things = list(filter(close_things_pattern.match, other_details))[0]
+    except:
+        close_things = ''
+
+    amenities = {
+        'hospital': 'Больница', 'playground': 'Детская площадка',
+        'kindergarten': 'Детский сад', 'park': 'Парк',
+        'recreation': 'Развлекательные заведения', 'restaurant': 'Рестораны',
+        'school': 'Школа', 'supermarket': 'Супермаркет'
+    }
+    for column, amenity in amenities.items():
+        setattr(record, column, amenity in close_things)
+
+
+def load_details():
+    """Return the details list of the recorded announcement and variants of it."""
+    with open(path.join(FIXTURES, 'ad.html'), encoding='utf-8') as file:
+        html = file.read()
+    parser = get_backend('lxml')
+    details = parser.strings(parser.parse(html), 'details')
+    variants = [details, [], details[::-1], details[:5]]
+    variants.append([item.replace('280', '2.75').replace('Да', 'Нет') for item in details])
+    variants.append([item.replace('280', '27') for item in details] + ['Этаж: 7'])
+    variants.append(['Количество комнат: много', 'Количество комнат: 2', 'Санузел: '])
+    return variants
+
+
+def main():
+    variants = load_details()
+    for details in variants:
+        legacy, record = Announcement(''), Announcement('')
+        legacy_parse_details(details, legacy)
+        parse_details(details, record)
+        assert (repr([getattr(legacy, name) for name in COMPARED])
+                == repr([getattr(record, name) for name in COMPARED])), details
+
+    print(f'Outputs are identical on {len(variants)} detail lists.')
+    for name, parse in (('legacy', legacy_parse_details), ('table-driven', parse_details)):
+        seconds = timeit(lambda: parse(variants[0], Announcement('')), number=REPEAT)
+        print(f'{name:>12}: {seconds / REPEAT * 1e6:.1f} us per announcement')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Scrape all sections of the local stand-in with a coordinator and 1, 2
+and 4 worker processes sharing a task queue, and compare the time each
+takes. Every worker has its own limit of connections, as a machine with
+its own address would, so the time should fall about linearly with the
+number of workers. The partial files of the workers are merged with
+`merge_district_pickles` and the day must hold every announcement once.
+
+Run from the repository root with ``python -m benchmarks.bench_distributed``.
+"""
+from argparse import ArgumentParser
+from multiprocessing import Process
+from os import chdir, getcwd, listdir, path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from scraper import ScraperOLX
+from scraper.policy import RequestPolicy
+from util import gui_helpers, merge_district_pickles
+from util.snapshots import SNAPSHOT_FOLDER, SnapshotStore
+from util.storage import iso_date
+from benchmarks.bench_scrape import wait_for_port
+from benchmarks.standin import section_size, serve
+
+
+DISTRICT_CODES = [20, 18, 13, 12, 19, 21, 23, 24, 25, 26, 22]
+
+
+def make_scraper(args):
+    base_url = f'http://127.0.0.1:{args.port}'
+    return ScraperOLX(concurrency=args.concurrency, use_cache=False, incremental=False,
+                      policy=RequestPolicy(backoff_base=0.1, backoff_cap=2),
+                      olx_url=base_url, fx_rate_url=f'{base_url}/oz/')
+
+
+def work(args, name):
+    make_scraper(args).work('queue.sqlite', name=name)
+
+
+def run_workers(args, num_workers):
+    """Return the seconds the workers take and the number of merged ads."""
+    working_directory = getcwd()
+    with TemporaryDirectory() as folder:
+        chdir(folder)
+        try:
+            make_scraper(args).enqueue_everything('queue.sqlite')
+            workers = [Process(target=work, args=(args, f'worker-{number}'))
+                       for number in range(num_workers)]
+            begin = perf_counter()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            seconds = perf_counter() - begin
+
+            date = make_scraper(args).today
+            merge_district_pickles(date)
+            store = SnapshotStore(path.join('Database', SNAPSHOT_FOLDER))
+            merged = store.view(iso_date(date))
+            num_parts = len([name for name in listdir('temporary_files') if '-part-' in name])
+        finally:
+            chdir(working_directory)
+    return seconds, len(merged), merged['link'].nunique(), num_parts
+
+
+def main():
+    parser = ArgumentParser(description='Scale a distributed scrape of the stand-in.')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--ads-per-section', type=int, default=40)
+    parser.add_argument('--latency', type=float, default=0.1, help='mean delay in seconds')
+    parser.add_argument('--concurrency', type=int, default=4,
+                        help='connections of every worker')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    args = parser.parse_args()
+
+    gui_helpers.use_messagebox = False
+    expected = 8 * sum(section_size(args.ads_per_section, code) for code in DISTRICT_CODES)
+    server = Process(target=serve, daemon=True,
+                     args=(args.port, args.ads_per_section, args.latency, args.latency / 4, 0.0))
+    server.start()
+    try:
+        wait_for_port(args.port)
+        first = None
+        for num_workers in args.workers:
+            seconds, rows, links, num_parts = run_workers(args, num_workers)
+            first = first or seconds * num_workers
+            assert rows == links == expected, (rows, links, expected)
+            print(f'{num_workers} workers: {rows} ads from {num_parts} partial files'
+                  f' in {seconds:.1f} s, {rows / seconds:.0f} ads/s,'
+                  f' {first / seconds / num_workers:.0%} of linear scaling')
+    finally:
+        server.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+Compare the time and peak memory of writing the master table to Excel
+with `DataFrame.to_excel` on the concatenated table, as `create_excel`
+did before, and with `export_chunks`, which writes one part of the
+table at a time in constant memory.
+
+The daily `dd-mm-yyyy-merged.pkl` files are synthetic, as in
+`bench_storage`.
+
+Run from the repository root with ``python -m benchmarks.bench_export``.
+"""
+from argparse import ArgumentParser
+from datetime import date, timedelta
+from os import chdir, getcwd, mkdir
+from tempfile import TemporaryDirectory
+
+from pandas import concat
+
+from util.export import export_chunks
+from util.master import MasterTable
+from benchmarks.bench_merge import measure
+from benchmarks.bench_storage import History
+
+
+def main():
+    parser = ArgumentParser(description='Compare in-memory and streaming Excel export.')
+    parser.add_argument('--days', type=int, default=20)
+    parser.add_argument('--ads-per-section', type=int, default=60)
+    parser.add_argument('--turnover', type=float, default=0.1,
+                        help='share of announcements replaced between two scrape days')
+    args = parser.parse_args()
+
+    history = History(args.ads_per_section, args.turnover)
+    working_directory = getcwd()
+    with TemporaryDirectory() as folder:
+        chdir(folder)
+        try:
+            mkdir('Database')
+            chdir('Database')
+            master = MasterTable()
+            for number in range(args.days):
+                day = (date(2021, 1, 1) + timedelta(days=7 * number)).strftime('%d-%m-%Y')
+                concat(history.day(day).values()).to_pickle(f'{day}-merged.pkl')
+                # one part per day, as when `Make Excel` is clicked after every scrape
+                master.ingest()
+
+            in_memory = measure(lambda: master.read().to_excel('in-memory.xlsx', index=False,
+                                                               engine='xlsxwriter'))
+            streaming = measure(lambda: export_chunks(master.iter_parts(), 'streaming.xlsx'))
+            print(f'{args.days} daily files, {master.num_rows} rows:'
+                  f' to_excel {in_memory[0]:.2f} s, {in_memory[1]:.0f} MiB peak;'
+                  f' export_chunks {streaming[0]:.2f} s, {streaming[1]:.0f} MiB peak')
+        finally:
+            chdir(working_directory)
+
+
+if __name__ == '__main__':
+    main()
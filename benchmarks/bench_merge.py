@@ -0,0 +1,95 @@
+"""
+Compare the peak memory and time of `merge_month_pickles`, which reads
+one daily file at a time and drops duplicates by their hashes, with the
+previous version, which concatenated every file before
+`drop_duplicates`. Both must return the same rows.
+
+The daily `dd-mm-yyyy-merged.pkl` files are synthetic, as in
+`bench_storage`.
+
+Run from the repository root with ``python -m benchmarks.bench_merge``.
+"""
+from argparse import ArgumentParser
+from datetime import date, timedelta
+from os import chdir, getcwd
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from tracemalloc import get_traced_memory, start, stop
+
+from pandas import DataFrame, concat, read_pickle
+
+import util.gui_helpers as gui_helpers
+from util.merge import FILTER_CONDITIONS
+from util.storage import iso_date
+from benchmarks.bench_storage import History
+
+
+def legacy_merge_month_pickles():
+    """`merge_month_pickles` before streaming, with the files in date order."""
+    filenames_pattern = r'\d{2}-\d{2}-\d{4}-merged\.pkl$'
+    all_filenames = sorted(gui_helpers.find_files(filenames_pattern),
+                           key=lambda name: iso_date(name[:10]))
+    if not all_filenames:
+        return DataFrame()
+
+    merged_data = concat([read_pickle(file) for file in all_filenames])
+    merged_data.drop_duplicates(
+        subset=['price', 'num_rooms', 'area', 'home_type', 'district', 'post_text'],
+        inplace=True
+    )
+    merged_data = merged_data.query(FILTER_CONDITIONS)
+    merged_data[['day', 'month', 'year']] = merged_data.date.str.split(
+        pat="-", expand=True)
+    return merged_data
+
+
+def measure(function):
+    """
+    Return the seconds of a run of `function()`, and the peak traced MiB
+    and result of a second run under tracemalloc.
+    """
+    begin = perf_counter()
+    function()
+    elapsed = perf_counter() - begin
+    start()
+    try:
+        result = function()
+        peak = get_traced_memory()[1]
+    finally:
+        stop()
+    return elapsed, peak / 2 ** 20, result
+
+
+def main():
+    parser = ArgumentParser(description='Compare streaming and in-memory month merges.')
+    parser.add_argument('--days', type=int, nargs='+', default=[10, 30, 60])
+    parser.add_argument('--ads-per-section', type=int, default=60)
+    parser.add_argument('--turnover', type=float, default=0.1,
+                        help='share of announcements replaced between two scrape days')
+    args = parser.parse_args()
+
+    gui_helpers.create_messagebox = lambda text, is_error=True: None
+    history = History(args.ads_per_section, args.turnover)
+    working_directory = getcwd()
+    with TemporaryDirectory() as folder:
+        chdir(folder)
+        try:
+            written = 0
+            for num_days in sorted(args.days):
+                for number in range(written, num_days):
+                    day = (date(2021, 1, 1) + timedelta(days=7 * number)).strftime('%d-%m-%Y')
+                    concat(history.day(day).values()).to_pickle(f'{day}-merged.pkl')
+                written = num_days
+
+                legacy = measure(legacy_merge_month_pickles)
+                streaming = measure(gui_helpers.merge_month_pickles)
+                assert sorted(legacy[2].link) == sorted(streaming[2].link)
+                print(f'{num_days} daily files, {len(streaming[2])} merged rows:'
+                      f' in memory {legacy[0]:.2f} s, {legacy[1]:.0f} MiB peak;'
+                      f' streaming {streaming[0]:.2f} s, {streaming[1]:.0f} MiB peak')
+        finally:
+            chdir(working_directory)
+
+
+if __name__ == '__main__':
+    main()
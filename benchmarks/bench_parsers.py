@@ -0,0 +1,79 @@
+"""
+Compare the `lxml` and `scrapy` parser backends on the recorded
+announcement and listing pages: time and peak memory per page, and the
+time it takes to import each backend in a fresh interpreter.
+
+Run from the repository root with ``python -m benchmarks.bench_parsers``.
+"""
+from os import path
+from subprocess import run
+from sys import executable
+from time import perf_counter
+from tracemalloc import get_traced_memory, start, stop
+
+from scraper.parser import parse_announcement, parse_listing
+
+
+FIXTURES = path.join(path.dirname(__file__), 'fixtures')
+REPEAT = 300
+IMPORTS = {
+    'lxml': 'from lxml.etree import HTMLParser, XPath, fromstring',
+    'scrapy': 'from scrapy import Selector',
+}
+
+
+def read_fixture(name):
+    with open(path.join(FIXTURES, name), encoding='utf-8') as file:
+        return file.read()
+
+
+def fields(result):
+    """Return the fields of a parsed record, or of a list of them, as a string."""
+    records = result if isinstance(result, list) else [result]
+    return repr([[getattr(record, name) for name in record.__slots__] for record in records])
+
+
+def measure(parse):
+    """Return the mean seconds and the peak bytes allocated by one call of `parse`."""
+    parse()
+    start()
+    parse()
+    peak = get_traced_memory()[1]
+    stop()
+    begin = perf_counter()
+    for _ in range(REPEAT):
+        parse()
+    return (perf_counter() - begin) / REPEAT, peak
+
+
+def import_time(statement):
+    """Return the seconds a fresh interpreter needs to run `statement`."""
+    begin = perf_counter()
+    run([executable, '-c', statement], check=True)
+    return perf_counter() - begin
+
+
+def main():
+    ad_html = read_fixture('ad.html')
+    listing_html = read_fixture('listing.html')
+    pages = {
+        'ad': lambda backend: parse_announcement(ad_html, 'ad.html', backend),
+        'listing': lambda backend: parse_listing(listing_html, backend),
+    }
+    for page, parse in pages.items():
+        assert fields(parse('lxml')) == fields(parse('scrapy')), \
+            f'Backends disagree on the {page} page.'
+
+    print(f'{"page":>8} {"backend":>8} {"us/page":>10} {"peak KiB":>10}')
+    for page, parse in pages.items():
+        for backend in IMPORTS:
+            seconds, peak = measure(lambda: parse(backend))
+            print(f'{page:>8} {backend:>8} {seconds * 1e6:>10.1f} {peak / 1024:>10.1f}')
+
+    print()
+    for backend, statement in IMPORTS.items():
+        print(f'import {backend}: {import_time(statement) * 1000:.0f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Compare the cost per announcement of growing a DataFrame with
+`DataFrame.at` writes against collecting `Announcement` records and
+building the frame once per section.
+
+Run from the repository root with ``python -m benchmarks.bench_records``.
+"""
+from time import perf_counter
+
+from pandas import DataFrame
+
+from scraper.records import COLUMN_NAMES, Announcement, records_to_frame
+
+
+SECTION_SIZES = [100, 250, 500, 1000]
+SAMPLE = {
+    'date': '12-08-2021', 'price': 45000.0, 'home_type': 'Вторичный рынок',
+    'district': 'Чиланзарский', 'price_m2': 642.8, 'furnished': True,
+    'commission': False, 'num_rooms': 3, 'area': 70, 'apart_floor': 2,
+    'home_floor': 9, 'condition': 'Евроремонт', 'build_type': 'Кирпичный',
+    'build_plan': 'Раздельная', 'build_year': 1985, 'bathroom': 'Раздельный',
+    'ceil_height': 2.8, 'hospital': True, 'playground': False,
+    'kindergarten': True, 'park': False, 'recreation': False, 'school': True,
+    'restaurant': False, 'supermarket': True, 'title_text': 'Квартира',
+    'post_text': 'Продается квартира в хорошем состоянии.'
+}
+
+
+def fill_with_at(size):
+    """Grow a DataFrame one cell at a time, as the scraper used to."""
+    dataframe = DataFrame(columns=COLUMN_NAMES)
+    for number in range(size):
+        row = dataframe.shape[0]
+        dataframe.at[row, 'link'] = f'https://www.olx.uz/obyavlenie/{number}'
+        for column, value in SAMPLE.items():
+            dataframe.at[row, column] = value
+    return dataframe
+
+
+def fill_with_records(size):
+    """Collect records and build the DataFrame once."""
+    records = []
+    for number in range(size):
+        record = Announcement(f'https://www.olx.uz/obyavlenie/{number}')
+        for column, value in SAMPLE.items():
+            setattr(record, column, value)
+        records.append(record)
+    return records_to_frame(records)
+
+
+def main():
+    print(f'{"ads":>6} {"DataFrame.at, us/ad":>20} {"records, us/ad":>16}')
+    for size in SECTION_SIZES:
+        timings = []
+        for fill in (fill_with_at, fill_with_records):
+            start = perf_counter()
+            fill(size)
+            timings.append((perf_counter() - start) / size * 1e6)
+        print(f'{size:>6} {timings[0]:>20.1f} {timings[1]:>16.1f}')
+
+
+if __name__ == '__main__':
+    main()
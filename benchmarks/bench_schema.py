@@ -0,0 +1,68 @@
+"""
+Compare scraped history in the dtypes pandas infers with the compact
+schema of `util.schema.compact`: memory, pickle size, and the time of
+`drop_duplicates` and of the `query` of `merge_month_pickles`.
+
+The history is synthetic, as in `bench_storage`.
+
+Run from the repository root with ``python -m benchmarks.bench_schema``.
+"""
+from argparse import ArgumentParser
+from datetime import date, timedelta
+from io import BytesIO
+from time import perf_counter
+
+from pandas import concat
+
+from util.merge import DUPLICATE_SUBSET, FILTER_CONDITIONS
+from util.schema import compact
+from benchmarks.bench_storage import History
+
+
+def best_time(function, repeat=3):
+    seconds = float('inf')
+    for _ in range(repeat):
+        begin = perf_counter()
+        function()
+        seconds = min(seconds, perf_counter() - begin)
+    return seconds
+
+
+def pickle_size(df):
+    buffer = BytesIO()
+    df.to_pickle(buffer, compression=None)
+    return buffer.tell()
+
+
+def main():
+    parser = ArgumentParser(description='Compare inferred dtypes with the compact schema.')
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--ads-per-section', type=int, default=60)
+    parser.add_argument('--turnover', type=float, default=0.1,
+                        help='share of announcements replaced between two scrape days')
+    args = parser.parse_args()
+
+    history = History(args.ads_per_section, args.turnover)
+    frames = []
+    for number in range(args.days):
+        day = (date(2021, 1, 1) + timedelta(days=7 * number)).strftime('%d-%m-%Y')
+        frames.append(concat(history.day(day).values()))
+    inferred = concat(frames, ignore_index=True)
+    compacted = compact(inferred)
+    print(f'{args.days} scrape days, {len(inferred)} rows')
+
+    for name, df in (('inferred', inferred), ('compact', compacted)):
+        text = ['link', 'title_text', 'post_text']
+        memory = df.memory_usage(deep=True, index=False)
+        other = memory.drop(text).sum()
+        seconds_dedup = best_time(lambda: df.drop_duplicates(subset=DUPLICATE_SUBSET))
+        seconds_query = best_time(lambda: df.query(FILTER_CONDITIONS))
+        print(f'  {name:>8}: memory {memory.sum() / 2 ** 20:.1f} MiB'
+              f' ({other / 2 ** 20:.1f} MiB without the free text),'
+              f' pickle {pickle_size(df) / 2 ** 20:.1f} MiB,'
+              f' drop_duplicates {seconds_dedup * 1000:.0f} ms,'
+              f' query {seconds_query * 1000:.0f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+"""
+Run a full `scrape_everything` against the local stand-in and report
+throughput, fetch and parse latency percentiles and peak memory.
+
+Fetch latency is the time of every HTTP round trip. The time a request
+waits for a slot of the adaptive limiter is reported as queue wait;
+retry backoff and circuit breaker cooldowns are in neither.
+
+Nothing is fetched from olx.uz or cbu.uz. Results can be appended to a
+JSON lines file with ``--output`` to compare runs over time.
+
+Run from the repository root with ``python -m benchmarks.bench_scrape``.
+"""
+from argparse import ArgumentParser
+from glob import glob
+from json import dumps, loads
+from multiprocessing import Process
+from os import chdir, getcwd, path
+from socket import create_connection
+from tempfile import TemporaryDirectory
+from time import perf_counter, sleep, strftime
+
+from numpy import percentile
+from pandas import read_pickle
+
+import scraper.scraper as scraper_module
+from scraper import ScraperOLX
+from scraper.fetcher import AsyncFetcher
+from scraper.policy import AdaptiveLimiter, RequestPolicy
+from util import metrics
+from util.storage import dataset_exists, read_dataset
+from benchmarks.standin import serve
+
+
+FETCH_TIMES = []
+QUEUE_TIMES = []
+PARSE_TIMES = []
+
+
+def timed_requests(request):
+    """Wrap `AsyncFetcher._request` to record the latency of every HTTP round trip."""
+    async def timed_request(self, url, kind, headers):
+        begin = perf_counter()
+        try:
+            return await request(self, url, kind, headers)
+        finally:
+            FETCH_TIMES.append(perf_counter() - begin)
+    return timed_request
+
+
+def timed_waits(enter):
+    """Wrap `AdaptiveLimiter.__aenter__` to record how long every request waits for a slot."""
+    async def timed_enter(self):
+        begin = perf_counter()
+        try:
+            return await enter(self)
+        finally:
+            QUEUE_TIMES.append(perf_counter() - begin)
+    return timed_enter
+
+
+def timed_parses(parse):
+    """Wrap `parse_announcement` to record the time spent parsing every ad."""
+    def timed_parse(*args):
+        begin = perf_counter()
+        try:
+            return parse(*args)
+        finally:
+            PARSE_TIMES.append(perf_counter() - begin)
+    return timed_parse
+
+
+def peak_rss():
+    """Peak resident memory of this process in MiB, or None if unknown."""
+    try:
+        from resource import getrusage, RUSAGE_SELF
+    except ImportError:
+        return None
+    from sys import platform
+    rss = getrusage(RUSAGE_SELF).ru_maxrss
+    return round(rss / 1024 ** 2 if platform == 'darwin' else rss / 1024, 1)
+
+
+def latency_summary(times):
+    """p50/p95/p99 of `times` in milliseconds."""
+    if not times:
+        return None
+    return {f'p{q}': round(float(percentile(times, q)) * 1000, 2) for q in (50, 95, 99)}
+
+
+def wait_for_port(port, timeout=10):
+    deadline = perf_counter() + timeout
+    while perf_counter() < deadline:
+        try:
+            create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            sleep(0.1)
+    raise RuntimeError(f'Stand-in did not start on port {port}.')
+
+
+def run_benchmark(args):
+    server = Process(target=serve, daemon=True,
+                     args=(args.port, args.ads_per_section, args.latency, args.jitter,
+                           args.error_rate))
+    server.start()
+    try:
+        wait_for_port(args.port)
+        base_url = f'http://127.0.0.1:{args.port}'
+        AsyncFetcher._request = timed_requests(AsyncFetcher._request)
+        AdaptiveLimiter.__aenter__ = timed_waits(AdaptiveLimiter.__aenter__)
+        if args.parse_workers == 0:
+            scraper_module.parse_announcement = timed_parses(scraper_module.parse_announcement)
+
+        if args.metrics_log or args.profile_section:
+            metrics.enable(args.metrics_log, args.profile_section)
+        policy = RequestPolicy(backoff_base=0.1, backoff_cap=2, breaker_cooldown=2)
+        scraper = ScraperOLX(concurrency=args.concurrency, section_workers=args.section_workers,
+                             use_cache=False, incremental=False, policy=policy,
+                             parser_backend=args.backend, olx_url=base_url,
+                             fx_rate_url=f'{base_url}/oz/', parse_workers=args.parse_workers,
+                             storage=args.storage)
+        working_directory = getcwd()
+        with TemporaryDirectory() as folder:
+            chdir(folder)
+            try:
+                begin = perf_counter()
+                scraper.scrape_everything()
+                elapsed = perf_counter() - begin
+                files = glob(path.join('temporary_files', '*.pkl'))
+                num_ads = sum(len(read_pickle(file)) for file in files)
+                if dataset_exists('temporary_files'):
+                    files = glob(path.join('temporary_files', '**', '*.parquet'), recursive=True)
+                    num_ads += len(read_dataset('temporary_files', ['link']))
+            finally:
+                chdir(working_directory)
+    finally:
+        server.terminate()
+
+    return {
+        'time': strftime('%Y-%m-%d %H:%M:%S'), 'settings': vars(args),
+        'sections': len(files), 'ads': num_ads, 'seconds': round(elapsed, 2),
+        'ads_per_second': round(num_ads / elapsed, 1), 'requests': len(FETCH_TIMES),
+        'fetch_ms': latency_summary(FETCH_TIMES), 'queue_wait_ms': latency_summary(QUEUE_TIMES),
+        'parse_ms': latency_summary(PARSE_TIMES),
+        'peak_rss_mib': peak_rss()
+    }
+
+
+def main():
+    parser = ArgumentParser(description='Benchmark scrape_everything against a local stand-in.')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--ads-per-section', type=int, default=60)
+    parser.add_argument('--latency', type=float, default=0.05, help='mean delay in seconds')
+    parser.add_argument('--jitter', type=float, default=0.02, help='deviation of the delay')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of 503 answers')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--section-workers', type=int, default=4)
+    parser.add_argument('--parse-workers', type=int, default=0)
+    parser.add_argument('--backend', default='lxml', choices=['lxml', 'scrapy'])
+    parser.add_argument('--storage', default='pickle', choices=['pickle', 'parquet'])
+    parser.add_argument('--output', help='JSON lines file the result is appended to')
+    parser.add_argument('--metrics-log', help='JSON lines file for the per-stage metrics')
+    parser.add_argument('--profile-section', help='profile the first section containing this text')
+    args = parser.parse_args()
+
+    result = run_benchmark(args)
+    previous = None
+    if args.output and path.isfile(args.output):
+        with open(args.output, encoding='utf-8') as file:
+            lines = file.read().splitlines()
+        previous = loads(lines[-1]) if lines else None
+
+    print(f'{result["sections"]} sections, {result["ads"]} ads in {result["seconds"]} s:'
+          f' {result["ads_per_second"]} ads/s, {result["requests"]} requests')
+    print(f'fetch latency, ms: {result["fetch_ms"]}')
+    print(f'queue wait, ms: {result["queue_wait_ms"]}')
+    print(f'parse latency, ms: {result["parse_ms"] or "measured only with --parse-workers 0"}')
+    print(f'peak RSS: {result["peak_rss_mib"]} MiB')
+    if previous is not None:
+        change = result['ads_per_second'] / previous['ads_per_second'] - 1
+        print(f'throughput change since {previous["time"]}: {change:+.1%}')
+    if args.output:
+        with open(args.output, 'a', encoding='utf-8') as file:
+            file.write(dumps(result) + '\n')
+
+
+if __name__ == '__main__':
+    main()
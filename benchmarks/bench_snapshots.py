@@ -0,0 +1,124 @@
+"""
+Compare daily `dd-mm-yyyy-merged.pkl` files, each a full copy of the
+announcements online that day, with the `SnapshotStore`, which keeps a
+base and the changes of every day: disk footprint, time to write the
+days, time of `merge_month_pickles` and time to rebuild the view of the
+last day. The merges must return the same rows, and every view must
+hold the rows of its day.
+
+The history is synthetic, as in `bench_storage`, with one scrape a day:
+a share of the announcements is replaced every day, and some of the
+others change their price. Every announcement keeps the date it first
+appeared on.
+
+Run from the repository root with ``python -m benchmarks.bench_snapshots``.
+"""
+from argparse import ArgumentParser
+from datetime import date, timedelta
+from os import chdir, getcwd, mkdir, path
+from tempfile import TemporaryDirectory
+
+from pandas import concat, to_datetime
+
+import util.gui_helpers as gui_helpers
+from util.schema import compact
+from util.snapshots import SNAPSHOT_FOLDER, SnapshotStore, changed_fields
+from util.storage import iso_date
+from benchmarks.bench_storage import History, folder_size, timed
+
+
+def write_days(history, days, price_changes, first_seen):
+    """Write every day as a merged pickle file and into the snapshots."""
+    seconds = {'pickle': 0, 'snapshot': 0}
+    store = SnapshotStore(path.join('snapshots-db', SNAPSHOT_FOLDER))
+    frames = {}
+    for day in days:
+        for records in history.sections.values():
+            for record in records:
+                if history.random.random() < price_changes:
+                    record.price += 1000
+        frame = concat(history.day(day).values(), ignore_index=True)
+        for link in frame['link']:
+            first_seen.setdefault(link, day)
+        frame['date'] = to_datetime(frame['link'].map(first_seen), format='%d-%m-%Y')
+        frame = compact(frame)
+        seconds['pickle'] += timed(frame.to_pickle,
+                                   path.join('pickles-db', f'{day}-merged.pkl'))[0]
+        seconds['snapshot'] += timed(store.write, iso_date(day), frame)[0]
+        frames[iso_date(day)] = frame
+    return seconds, frames
+
+
+def same_rows(first, second):
+    first = first.sort_values('link', ignore_index=True)
+    second = second.sort_values('link', ignore_index=True)
+    return (list(first.columns) == list(second.columns) and len(first) == len(second)
+            and not any(changed_fields(first[column], second[column]).any()
+                        for column in first))
+
+
+def merge_time(folder):
+    chdir(folder)
+    try:
+        return timed(gui_helpers.merge_month_pickles)
+    finally:
+        chdir('..')
+
+
+def main():
+    parser = ArgumentParser(description='Compare full daily files with delta snapshots.')
+    parser.add_argument('--days', type=int, nargs='+', default=[7, 30, 60])
+    parser.add_argument('--ads-per-section', type=int, default=60)
+    parser.add_argument('--turnover', type=float, default=0.03,
+                        help='share of announcements replaced between two scrape days')
+    parser.add_argument('--price-changes', type=float, default=0.01,
+                        help='share of announcements whose price changes in a day')
+    args = parser.parse_args()
+
+    gui_helpers.create_messagebox = lambda text, is_error=True: None
+    history = History(args.ads_per_section, args.turnover)
+    first_seen = {}
+    written = 0
+    seconds = {'pickle': 0, 'snapshot': 0}
+    working_directory = getcwd()
+    with TemporaryDirectory() as folder:
+        chdir(folder)
+        try:
+            mkdir('pickles-db')
+            mkdir('snapshots-db')
+            for num_days in sorted(args.days):
+                days = [(date(2021, 1, 1) + timedelta(days=number)).strftime('%d-%m-%Y')
+                        for number in range(written, num_days)]
+                written = num_days
+                day_seconds, frames = write_days(history, days, args.price_changes, first_seen)
+                for name, value in day_seconds.items():
+                    seconds[name] += value
+
+                store = SnapshotStore(path.join('snapshots-db', SNAPSHOT_FOLDER))
+                assert all(same_rows(store.view(day), frame) for day, frame in frames.items())
+                last_day = store.days[-1]
+                view_time = timed(SnapshotStore(store.folder).view, last_day)[0]
+                pickle_merge, pickle_rows = merge_time('pickles-db')
+                snapshot_merge, snapshot_rows = merge_time('snapshots-db')
+                assert same_rows(pickle_rows, snapshot_rows)
+
+                pickle_size = folder_size('pickles-db')
+                snapshot_size = folder_size('snapshots-db')
+                num_bases = sum(entry['parent'] is None
+                                for entry in store.manifest['days'].values())
+                print(f'{num_days} days, {len(snapshot_rows)} merged rows,'
+                      f' {num_bases} bases')
+                print(f'  Database size, MiB: daily files {pickle_size / 2 ** 20:.1f},'
+                      f' snapshots {snapshot_size / 2 ** 20:.1f}'
+                      f' ({pickle_size / snapshot_size:.1f} times smaller)')
+                print(f'  write so far, s: daily files {seconds["pickle"]:.2f},'
+                      f' snapshots {seconds["snapshot"]:.2f}')
+                print(f'  merge_month_pickles, s: daily files {pickle_merge:.2f},'
+                      f' snapshots {snapshot_merge:.2f};'
+                      f' view of the last day {view_time:.2f}')
+        finally:
+            chdir(working_directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+"""
+Compare per-section pickles merged into the snapshots of `Database`
+with the partitioned Parquet dataset: disk footprint, time to write the
+sections and merge the districts, and time of `merge_month_pickles`
+with all columns and with a few projected columns.
+
+The history is synthetic: every scrape day has 88 sections, and most
+announcements stay online from one day to the next.
+
+Run from the repository root with ``python -m benchmarks.bench_storage``.
+"""
+from argparse import ArgumentParser
+from datetime import date, timedelta
+from os import chdir, getcwd, mkdir, path, rename, walk
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from numpy import nan, random
+
+import util.gui_helpers as gui_helpers
+from scraper.records import RAW_COLUMNS, Announcement, records_to_frame
+from util.snapshots import SNAPSHOT_FOLDER
+from util.storage import compact_partitions, partition_file, write_partition
+
+
+DISTRICTS = ['Olmazor', 'Bektemir', 'Mirobod', 'Mirzo-Ulugbek', 'Sergeli', 'Uchtepa',
+             'Chilonzor', 'Shayhontohur', 'Yunusobod', 'Yakkasaroy', 'Yashnobod']
+SECTIONS = [(commission, furnished, home_type, district)
+            for commission in ['yes', 'no'] for furnished in ['yes', 'no']
+            for home_type in ['novostroyki', 'vtorichnyy-rynok'] for district in DISTRICTS]
+CONDITIONS = ['Евроремонт', 'Авторский проект', 'Средний', 'Требует ремонта']
+BUILD_TYPES = ['Кирпичный', 'Панельный', 'Монолитный', 'Блочный']
+WORDS = ('продается квартира в хорошем состоянии рядом метро школа детский сад парк'
+         ' супермаркет документы готовы торг уместен срочно евроремонт').split()
+PROJECTED = ['price', 'area', 'district', 'num_rooms']
+
+
+class History:
+    """Announcements of every section, some of which are replaced every day."""
+    def __init__(self, ads_per_section, turnover, seed=0):
+        self.random = random.default_rng(seed)
+        self.turnover = turnover
+        self.next_id = 0
+        self.sections = {section: [self.announcement(section) for _ in range(ads_per_section)]
+                         for section in SECTIONS}
+
+    def announcement(self, section):
+        self.next_id += 1
+        rng = self.random
+        record = Announcement(f'https://www.olx.uz/obyavlenie/kvartira-ID{self.next_id}.html')
+        area = int(rng.integers(25, 200))
+        record.price = float(rng.integers(15, 250) * 1000)
+        record.area = area
+        record.price_m2 = record.price / area
+        record.num_rooms = int(rng.integers(1, 7))
+        record.home_floor = int(rng.integers(4, 17))
+        record.apart_floor = int(rng.integers(1, record.home_floor + 1))
+        record.build_year = int(rng.integers(1960, 2022)) if rng.random() < 0.6 else nan
+        record.ceil_height = 2.7 if rng.random() < 0.5 else nan
+        record.home_type = 'Новостройки' if section[2] == 'novostroyki' else 'Вторичный рынок'
+        record.district = section[3]
+        record.furnished = section[1] == 'yes'
+        record.commission = section[0] == 'yes'
+        record.condition = CONDITIONS[rng.integers(len(CONDITIONS))]
+        record.build_type = BUILD_TYPES[rng.integers(len(BUILD_TYPES))]
+        record.build_plan = 'Раздельная'
+        record.bathroom = 'Раздельный'
+        for amenity in ['hospital', 'playground', 'kindergarten', 'park', 'recreation',
+                        'school', 'restaurant', 'supermarket']:
+            setattr(record, amenity, bool(rng.random() < 0.5))
+        record.title_text = ' '.join(rng.choice(WORDS, 5))
+        record.post_text = ' '.join(rng.choice(WORDS, int(rng.integers(20, 80))))
+        return record
+
+    def day(self, day):
+        """Return the frames of all sections on `day` and replace some of their ads."""
+        frames = {}
+        for section, records in self.sections.items():
+            for record in records:
+                record.date = day
+            frames[section] = records_to_frame(records).drop(columns=RAW_COLUMNS)
+            for number in range(len(records)):
+                if self.random.random() < self.turnover:
+                    records[number] = self.announcement(section)
+        return frames
+
+
+def folder_size(folder):
+    return sum(path.getsize(path.join(root, name))
+               for root, _, names in walk(folder) for name in names)
+
+
+def timed(function, *args):
+    begin = perf_counter()
+    result = function(*args)
+    return perf_counter() - begin, result
+
+
+def write_history(history, days):
+    """Write the sections of every day in both formats and merge the districts."""
+    seconds = {'pickle write': 0, 'pickle merge districts': 0,
+               'parquet write': 0, 'parquet merge districts': 0}
+    for day in days:
+        frames = history.day(day)
+        for (commission, furnished, home_type, district), frame in frames.items():
+            name = f'{day}-{commission}-{furnished}-{home_type}-{district}.pkl'
+            filename = path.join('temporary_files', name)
+            seconds['pickle write'] += timed(frame.to_pickle, filename)[0]
+        # the dataset of the day is not written yet, so only pickle files are merged
+        seconds['pickle merge districts'] += timed(gui_helpers.merge_district_pickles, day)[0]
+
+        for (commission, furnished, home_type, district), frame in frames.items():
+            filename = partition_file('temporary_files', day, commission, furnished,
+                                      home_type, district)
+            seconds['parquet write'] += timed(write_partition, frame, filename)[0]
+        seconds['parquet merge districts'] += timed(compact_partitions, 'temporary_files',
+                                                    'Database', day)[0]
+    return seconds
+
+
+def merge_times(columns=None):
+    """Time `merge_month_pickles` on the pickle files and on the dataset separately."""
+    chdir('Database')
+    try:
+        dataset = path.join('..', 'dataset-aside')
+        rename('dataset', dataset)
+        pickle_time, pickle_rows = timed(gui_helpers.merge_month_pickles, columns)
+        rename(dataset, 'dataset')
+
+        snapshots = path.join('..', 'snapshots-aside')
+        rename(SNAPSHOT_FOLDER, snapshots)
+        parquet_time, parquet_rows = timed(gui_helpers.merge_month_pickles, columns)
+        rename(snapshots, SNAPSHOT_FOLDER)
+    finally:
+        chdir('..')
+    assert len(pickle_rows) == len(parquet_rows), (len(pickle_rows), len(parquet_rows))
+    return pickle_time, parquet_time, len(parquet_rows)
+
+
+def main():
+    parser = ArgumentParser(description='Compare pickle files with the Parquet dataset.')
+    parser.add_argument('--months', type=int, nargs='+', default=[1, 3, 6])
+    parser.add_argument('--days-per-month', type=int, default=4)
+    parser.add_argument('--ads-per-section', type=int, default=60)
+    parser.add_argument('--turnover', type=float, default=0.1,
+                        help='share of announcements replaced between two scrape days')
+    args = parser.parse_args()
+
+    gui_helpers.create_messagebox = lambda text, is_error=True: None
+    working_directory = getcwd()
+    with TemporaryDirectory() as folder:
+        chdir(folder)
+        try:
+            mkdir('temporary_files')
+            mkdir('Database')
+            history = History(args.ads_per_section, args.turnover)
+            start = date(2021, 1, 1)
+            written_days = 0
+            seconds = {}
+            for months in sorted(args.months):
+                num_days = months * args.days_per_month
+                step = 30 // args.days_per_month
+                days = [(start + timedelta(days=step * number)).strftime('%d-%m-%Y')
+                        for number in range(written_days, num_days)]
+                for name, value in write_history(history, days).items():
+                    seconds[name] = seconds.get(name, 0) + value
+                written_days = num_days
+
+                pickle_size = folder_size(path.join('Database', SNAPSHOT_FOLDER))
+                parquet_size = folder_size(path.join('Database', 'dataset'))
+                pickle_all, parquet_all, rows = merge_times()
+                pickle_some, parquet_some, _ = merge_times(PROJECTED)
+                print(f'{months} months, {num_days} scrape days, {rows} merged rows')
+                print(f'  Database size, MiB: pickle {pickle_size / 2 ** 20:.1f},'
+                      f' parquet {parquet_size / 2 ** 20:.1f}')
+                print(f'  write so far, s: pickle {seconds["pickle write"]:.2f}'
+                      f' + merge districts {seconds["pickle merge districts"]:.2f},'
+                      f' parquet {seconds["parquet write"]:.2f}'
+                      f' + merge districts {seconds["parquet merge districts"]:.2f}')
+                print(f'  merge_month_pickles, s: all columns pickle {pickle_all:.2f},'
+                      f' parquet {parquet_all:.2f}; {len(PROJECTED)} columns'
+                      f' pickle {pickle_some:.2f}, parquet {parquet_some:.2f}')
+        finally:
+            chdir(working_directory)
+
+
+if __name__ == '__main__':
+    main()
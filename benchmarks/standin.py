@@ -0,0 +1,127 @@
+"""
+Local stand-in for www.olx.uz and www.cbu.uz built from the recorded
+pages in `benchmarks/fixtures`.
+
+Every section has a fixed number of announcements derived from its
+district code, each with a fixed price in USD. Listing pages are
+assembled from the recorded listing cards, honour the price filter and,
+as on OLX, stop after 25 pages. Every announcement url serves the
+recorded announcement.
+Latency, jitter and error rate of the responses are configurable.
+
+Run from the repository root with ``python -m benchmarks.standin``.
+"""
+from argparse import ArgumentParser
+from asyncio import sleep
+from os import path
+from random import gauss, random
+from re import DOTALL, compile
+from zlib import crc32
+
+from aiohttp import web
+
+
+FIXTURES = path.join(path.dirname(__file__), 'fixtures')
+RECORDED_URL = 'https://www.olx.uz'
+CARD_PATTERN = compile(r'\s*<tr class="wrap">.*?</tr>\s*</tbody>\s*</table>\s*</div>\s*</td>\s*</tr>',
+                       DOTALL)
+AD_ID_PATTERN = compile(r'ID300000\d\d')
+NUMBER_ADS_PATTERN = compile(r'Найдено [\d ]+ объявлени\w+')
+PRICE_FROM = 'search[filter_float_price:from]'
+PRICE_TO = 'search[filter_float_price:to]'
+MAX_PAGES = 25
+
+
+def read_fixture(name):
+    with open(path.join(FIXTURES, name), encoding='utf-8') as file:
+        return file.read()
+
+
+def section_size(ads_per_section, district_code):
+    """Number of announcements of a section; districts differ by up to 4 times."""
+    return max(1, ads_per_section * (int(district_code) % 4 + 1) // 2)
+
+
+def ad_price(section_id, number):
+    """Price in USD of an announcement, between 15 000 and 300 000."""
+    return 15000 + crc32(f'{section_id}-{number}'.encode()) % 285000
+
+
+class StandIn:
+    """aiohttp application that imitates OLX and the central bank."""
+    def __init__(self, ads_per_section=100, latency=0.05, jitter=0.02, error_rate=0.0):
+        self.ads_per_section = ads_per_section
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        listing = read_fixture('listing.html')
+        self.cards = CARD_PATTERN.findall(listing)
+        first_card = listing.index(self.cards[0])
+        last_card = listing.index(self.cards[-1]) + len(self.cards[-1])
+        self.listing_head = listing[:first_card]
+        self.listing_tail = listing[last_card:]
+        self.ad = read_fixture('ad.html')
+        self.cbu = read_fixture('cbu.html')
+
+    def application(self):
+        app = web.Application()
+        app.router.add_get('/nedvizhimost/kvartiry/prodazha/{home_type}/tashkent/', self.listing)
+        app.router.add_get('/obyavlenie/{slug}', self.announcement)
+        app.router.add_get('/oz/', self.exchange_rate)
+        return app
+
+    async def respond(self, request, text):
+        """Answer after the configured delay, or with an error at the configured rate."""
+        await sleep(max(0.0, gauss(self.latency, self.jitter)))
+        if random() < self.error_rate:
+            return web.Response(status=503)
+        return web.Response(text=text, content_type='text/html')
+
+    async def listing(self, request):
+        query = dict(request.query)
+        page = int(query.pop('page', 1))
+        low = float(query.pop(PRICE_FROM, 0))
+        high = float(query.pop(PRICE_TO, 'inf'))
+        query.pop('currency', None)
+        section_id = crc32(f'{request.path}?{sorted(query.items())}'.encode())
+        number_ads = section_size(self.ads_per_section, query.get('search[district_id]', 0))
+        ads = [number for number in range(number_ads)
+               if low <= ad_price(section_id, number) <= high]
+        shown = ads[39 * (page - 1):39 * page] if page <= MAX_PAGES else []
+
+        base_url = f'{request.scheme}://{request.host}'
+        cards = []
+        for number in shown:
+            card = self.cards[number % len(self.cards)]
+            card = AD_ID_PATTERN.sub(f'ID{section_id:010d}{number:04d}', card)
+            cards.append(card.replace(RECORDED_URL, base_url))
+
+        head = NUMBER_ADS_PATTERN.sub(f'Найдено {len(ads)} объявлений', self.listing_head)
+        return await self.respond(request, head + ''.join(cards) + self.listing_tail)
+
+    async def announcement(self, request):
+        return await self.respond(request, self.ad)
+
+    async def exchange_rate(self, request):
+        return await self.respond(request, self.cbu)
+
+
+def serve(port, ads_per_section, latency, jitter, error_rate):
+    """Serve the stand-in on `port` of localhost until the process is stopped."""
+    stand_in = StandIn(ads_per_section, latency, jitter, error_rate)
+    web.run_app(stand_in.application(), host='127.0.0.1', port=port, print=None)
+
+
+def main():
+    parser = ArgumentParser(description='Serve a local stand-in for olx.uz and cbu.uz.')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--ads-per-section', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.05, help='mean delay in seconds')
+    parser.add_argument('--jitter', type=float, default=0.02, help='deviation of the delay')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of 503 answers')
+    args = parser.parse_args()
+    serve(args.port, args.ads_per_section, args.latency, args.jitter, args.error_rate)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+"""
+Command line interface of the program, for runs without a window, e.g.
+from cron or on a server.
+
+    python cli.py scrape [--storage parquet] [--request-budget N] [--shallow]
+    python cli.py deep-fill [--request-budget N]
+    python cli.py enqueue [--queue FILE]
+    python cli.py work [--queue FILE] [--name NAME]
+    python cli.py roll-dates
+    python cli.py merge [--date dd-mm-yyyy]
+    python cli.py pack
+    python cli.py export [--date dd-mm-yyyy] [--format xlsx csv parquet] [--rebuild]
+
+Every subcommand imports only the modules it needs, so `merge` and
+`export` do not import the scraper. `export` goes online only for the
+exchange rates of days it has not seen yet, and works offline with the
+rates it has. Messages are logged instead of being shown in message
+boxes.
+
+`enqueue` and `work` scrape the day on several machines: one
+coordinator puts the listing pages of all sections into a queue file,
+and workers on every machine scrape them into partial files that
+`merge` combines. The folder, and so the queue file, must be on a
+volume all machines share.
+"""
+from argparse import ArgumentParser
+from datetime import date, timedelta
+from os import chdir
+
+
+def make_scraper(args):
+    from scraper import ScraperOLX
+
+    return ScraperOLX(concurrency=args.concurrency, section_workers=args.section_workers,
+                      request_budget=args.request_budget, use_cache=not args.no_cache,
+                      replay_cache=args.replay_cache,
+                      incremental=not args.no_incremental, parse_workers=args.parse_workers,
+                      storage=args.storage, shallow=args.shallow)
+
+
+def scrape(args):
+    make_scraper(args).scrape_everything()
+
+
+def deep_fill(args):
+    make_scraper(args).deep_fill()
+
+
+def enqueue(args):
+    make_scraper(args).enqueue_everything(args.queue)
+
+
+def work(args):
+    make_scraper(args).work(args.queue, name=args.name, batch_size=args.batch_size)
+
+
+def roll_dates(args):
+    from util import update_yesterday
+
+    update_yesterday(args.yesterday, args.date)
+
+
+def merge(args):
+    from util import merge_district_pickles
+
+    merge_district_pickles(args.date)
+
+
+def pack(args):
+    from util import pack_merged_pickles
+
+    pack_merged_pickles()
+
+
+def export(args):
+    from util import create_excel
+
+    create_excel(args.date, rebuild=args.rebuild, formats=tuple(args.format),
+                 reprice=not args.no_reprice)
+
+
+def parse_args(argv=None):
+    today = date.today()
+    parser = ArgumentParser(description='Scrape apartment prices in Tashkent from OLX.')
+    parser.add_argument('--folder', help='working folder. Defaults to Desktop/Housing_Scrape'
+                                         ' in the home folder, as in the window.')
+    parser.add_argument('--metrics-log', help='JSON lines file of stage timings and counters')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    scraper_options = ArgumentParser(add_help=False)
+    scraper_options.add_argument('--concurrency', type=int, default=8)
+    scraper_options.add_argument('--section-workers', type=int, default=4)
+    scraper_options.add_argument('--request-budget', type=int)
+    scraper_options.add_argument('--parse-workers', type=int, default=0)
+    scraper_options.add_argument('--no-cache', action='store_true')
+    scraper_options.add_argument('--replay-cache', action='store_true',
+                                 help='use cached pages regardless of their age')
+    scraper_options.add_argument('--no-incremental', action='store_true')
+
+    parser_scrape = subparsers.add_parser('scrape', parents=[scraper_options],
+                                          help='scrape all 88 sections')
+    parser_scrape.add_argument('--shallow', action='store_true',
+                               help='take the announcements from the listing pages only')
+    parser_scrape.set_defaults(function=scrape)
+
+    parser_deep_fill = subparsers.add_parser(
+        'deep-fill', parents=[scraper_options],
+        help='fetch the announcements a shallow scrape took from the listing pages,'
+             ' at most --request-budget of them')
+    parser_deep_fill.set_defaults(function=deep_fill)
+
+    for subparser in [parser_scrape, parser_deep_fill]:
+        subparser.add_argument('--storage', choices=['pickle', 'parquet'], default='pickle')
+
+    queue_file = f'temporary_files/queue-{today.strftime("%d-%m-%Y")}.sqlite'
+    parser_enqueue = subparsers.add_parser(
+        'enqueue', parents=[scraper_options],
+        help='put the pages of all sections into a queue shared by workers')
+    parser_enqueue.set_defaults(function=enqueue)
+
+    parser_work = subparsers.add_parser('work', parents=[scraper_options],
+                                        help='scrape pages from the shared queue')
+    parser_work.add_argument('--name', help='name of the worker. Defaults to host-pid.')
+    parser_work.add_argument('--batch-size', type=int, default=2,
+                             help='number of pages leased at once')
+    parser_work.set_defaults(function=work)
+
+    for subparser in [parser_enqueue, parser_work]:
+        subparser.add_argument('--queue', default=queue_file,
+                               help=f'SQLite file of the queue. Defaults to {queue_file}.')
+        # partial files of the workers are pickle files
+        subparser.set_defaults(storage='pickle', shallow=False)
+
+    parser_roll = subparsers.add_parser(
+        'roll-dates', help="rename yesterday's section files to today's date")
+    parser_roll.add_argument('--yesterday',
+                             default=(today - timedelta(days=1)).strftime('%d-%m-%Y'))
+    parser_roll.set_defaults(function=roll_dates)
+
+    parser_merge = subparsers.add_parser('merge', help='merge the districts of one day')
+    parser_merge.set_defaults(function=merge)
+
+    parser_pack = subparsers.add_parser(
+        'pack', help='move the dd-mm-yyyy-merged.pkl files of Database into its snapshots')
+    parser_pack.set_defaults(function=pack)
+
+    parser_export = subparsers.add_parser('export', help='merge all days and export them')
+    parser_export.add_argument('--format', nargs='+', choices=['xlsx', 'csv', 'parquet'],
+                               default=['xlsx'])
+    parser_export.add_argument('--rebuild', action='store_true',
+                               help='build the master table again from all daily files')
+    parser_export.add_argument('--no-reprice', action='store_true',
+                               help='keep the prices converted at the rate of the scrape day')
+    parser_export.set_defaults(function=export)
+
+    for subparser in [parser_roll, parser_merge, parser_export]:
+        subparser.add_argument('--date', default=today.strftime('%d-%m-%Y'),
+                               help='date of the form dd-mm-yyyy. Defaults to today.')
+    parser_deep_fill.set_defaults(shallow=False)
+    # `scrape`, `deep-fill`, `enqueue` and `work` always work on today's files
+    for subparser in [parser_scrape, parser_deep_fill, parser_enqueue, parser_work]:
+        subparser.set_defaults(date=today.strftime('%d-%m-%Y'))
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    import util
+    import util.gui_helpers
+
+    util.main()
+    util.gui_helpers.use_messagebox = False
+    if args.folder:
+        chdir(args.folder)
+    else:
+        import controller
+
+        controller.main()
+    if args.metrics_log:
+        util.metrics.enable(args.metrics_log)
+    args.function(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,40 +1,131 @@
-from tkinter import Tk, Frame, Button, BOTH, TOP
+from queue import Empty
+from tkinter import Tk, Frame, Button, Label, BOTH, DISABLED, LEFT, NORMAL, TOP, messagebox
 
 import controller
 import util
+import util.gui_helpers
 from scraper import ScraperOLX
+from util.jobs import JobRunner
 
 
-scraper = ScraperOLX()
-root = Tk()
-root.title("Scraping Apartment Prices")
-root_width = root.winfo_screenwidth() - 15
-root_height = root.winfo_screenheight() - 70
-root.geometry("400x230")
-main_frame = Frame(root)
-main_frame.pack(fill=BOTH, expand=True, pady=10)
-
-button_scrape = Button(
-    main_frame, text="Scrape Info", width=30, bg='#3DC70D', fg='black',
-    command=scraper.scrape_everything)
-button_change_yesterday = Button(
-    main_frame, text="Change Yesterday's Files", width=30, bg='#3DC70D', fg='black',
-    command=lambda: util.update_yesterday(scraper.yesterday, scraper.today))
-button_merge_district = Button(
-    main_frame, text="Merge Districts", width=30, bg='#3DC70D', fg='black',
-    command=lambda: util.merge_district_pickles(scraper.today))
-button_make_excel = Button(
-    main_frame, text="Make Excel", width=30, bg='#3DC70D', fg='black',
-    command=lambda: util.create_excel(scraper.today))
-
-buttons = [button_scrape, button_change_yesterday,
-           button_merge_district, button_make_excel]
-for button in buttons:
-    button.pack(side=TOP, pady=10, padx=20)
-    button.bind("<Enter>", util.on_enter)
-    button.bind("<Leave>", util.on_leave)
-    button.configure(font=("Arial", 12))
-
-util.main()
-controller.main()
-root.mainloop()
+POLL_MS = 200  # how often the window reads the events of the running job
+SCRAPE_JOB = "Scrape Info"
+
+
+def main():
+    # jobs run in a background thread, so the window keeps responding;
+    # they report back through `runner.events`, which is polled below
+    runner = JobRunner()
+    util.gui_helpers.message_handler = runner.message
+    scraper = ScraperOLX(progress=runner.progress, control=runner.control)
+    root = Tk()
+    root.title("Scraping Apartment Prices")
+    root_width = root.winfo_screenwidth() - 15
+    root_height = root.winfo_screenheight() - 70
+    root.geometry("400x330")
+    main_frame = Frame(root)
+    main_frame.pack(fill=BOTH, expand=True, pady=10)
+
+    jobs = {
+        SCRAPE_JOB: scraper.scrape_everything,
+        "Change Yesterday's Files": lambda: util.update_yesterday(scraper.yesterday, scraper.today),
+        "Merge Districts": lambda: util.merge_district_pickles(scraper.today),
+        "Make Excel": lambda: util.create_excel(scraper.today),
+    }
+    buttons = []
+    for name, job in jobs.items():
+        button = Button(main_frame, text=name, width=30, bg='#3DC70D', fg='black',
+                        command=lambda name=name, job=job: runner.submit(name, job))
+        button.pack(side=TOP, pady=10, padx=20)
+        button.bind("<Enter>", util.on_enter)
+        button.bind("<Leave>", util.on_leave)
+        button.configure(font=("Arial", 12))
+        buttons.append(button)
+
+    status = Label(main_frame, text="Ready.", font=("Arial", 10))
+    status.pack(side=TOP, pady=5)
+    control_frame = Frame(main_frame)
+    control_frame.pack(side=TOP)
+
+    def toggle_pause():
+        if runner.control.paused:
+            runner.control.resume()
+            button_pause.configure(text="Pause")
+        else:
+            runner.control.pause()
+            button_pause.configure(text="Resume")
+            status.configure(text=f"{runner.running}: pausing after the current pages.")
+
+    def cancel():
+        runner.control.cancel()
+        button_pause.configure(text="Pause", state=DISABLED)
+        button_cancel.configure(state=DISABLED)
+        status.configure(text=f"{runner.running}: stopping after the current pages.")
+
+    button_pause = Button(control_frame, text="Pause", width=13, state=DISABLED,
+                          command=toggle_pause)
+    button_cancel = Button(control_frame, text="Cancel", width=13, state=DISABLED,
+                           command=cancel)
+    for button in [button_pause, button_cancel]:
+        button.pack(side=LEFT, padx=5)
+        button.configure(font=("Arial", 10))
+
+    def show_event(event):
+        kind = event[0]
+        if kind == 'started':
+            for button in buttons:
+                button.configure(state=DISABLED)
+            # only the scrape stops between pages
+            if event[1] == SCRAPE_JOB:
+                button_pause.configure(state=NORMAL)
+                button_cancel.configure(state=NORMAL)
+            status.configure(text=f"{event[1]} is running.")
+        elif kind == 'progress':
+            if not runner.control.paused and not runner.control.cancelled:
+                status.configure(text=f"{runner.running}: {event[1]}")
+        elif kind == 'message':
+            _, text, is_error = event
+            if is_error:
+                messagebox.showerror(title='Saving Request', message=text)
+            else:
+                messagebox.showinfo(title='Saving Request', message=text)
+        elif kind == 'finished':
+            _, name, error = event
+            runner.finish()
+            for button in buttons:
+                button.configure(state=NORMAL)
+            button_pause.configure(text="Pause", state=DISABLED)
+            button_cancel.configure(state=DISABLED)
+            if error is not None:
+                status.configure(text=f"{name} has stopped: {error}")
+            elif runner.control.cancelled:
+                status.configure(text=f"{name} has been cancelled.")
+            else:
+                status.configure(text=f"{name} has finished.")
+
+    def poll():
+        while True:
+            try:
+                event = runner.events.get_nowait()
+            except Empty:
+                break
+            show_event(event)
+        # scheduled after the events, so that an open message box does
+        # not start a second poll
+        root.after(POLL_MS, poll)
+
+    def close():
+        # a running scrape stops at the next page; other jobs are waited for
+        runner.control.cancel()
+        root.destroy()
+
+    root.protocol("WM_DELETE_WINDOW", close)
+    util.main()
+    controller.main()
+    root.after(POLL_MS, poll)
+    root.mainloop()
+    runner.shutdown()
+
+
+if __name__ == '__main__':
+    main()
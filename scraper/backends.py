@@ -0,0 +1,98 @@
+ANNOUNCEMENT_XPATH = '//*[@id="root"]/div[1]/div[3]/div[2]/div[1]/div[2]'
+AD_LINK_XPATH = 'a[@class="marginright5 link linkWithHash detailsLink"]'
+
+# name of the query -> XPath expression returning nodes or strings
+QUERIES = {
+    'district_links': '//*[@id="root"]//a/text()',
+    'date': ANNOUNCEMENT_XPATH + '/div[1]/span/span//text()',
+    'title': ANNOUNCEMENT_XPATH + '/div[2]/h1//text()',
+    'price': ANNOUNCEMENT_XPATH + '/div[3]/h3//text()',
+    'details': ANNOUNCEMENT_XPATH + '/ul/li/p//text()',
+    'content': ANNOUNCEMENT_XPATH + '/div[8]/div//text()',
+    'number_ads': '//*[@id="offers_table"]//div[@class="dontHasPromoted section clr rel"]/h2//text()',
+    'ad_links': f'//*[@id="offers_table"]//{AD_LINK_XPATH}/@href',
+    'listing_cards': '//*[@id="offers_table"]//div[@class="offer-wrapper"]',
+    'card_link': f'.//{AD_LINK_XPATH}/@href',
+    'card_title': f'.//{AD_LINK_XPATH}/strong/text()',
+    'card_location': './/i[@data-icon="location-filled"]/../text()',
+    'card_price': './/p[@class="price"]/strong/text()',
+    'card_date': './/i[@data-icon="clock"]/../text()',
+    'fx_rates': '//div[@class="exchange__content"]//div[@class="exchange__item_value"]/text()',
+}
+
+
+class LxmlBackend:
+    """Backend that evaluates precompiled XPath expressions with lxml."""
+    name = 'lxml'
+
+    def __init__(self):
+        from lxml.etree import HTMLParser, XPath, fromstring
+
+        self.parser = HTMLParser(recover=True, encoding='utf-8')
+        self.fromstring = fromstring
+        self.queries = {name: XPath(query) for name, query in QUERIES.items()}
+
+    def parse(self, html):
+        """Return the root node of the `html` document."""
+        document = self.fromstring(html.encode('utf-8'), parser=self.parser)
+        if document is None:
+            document = self.fromstring(b'<html/>', parser=self.parser)
+        return document
+
+    def nodes(self, node, name):
+        """Return the nodes selected by query `name` from `node`."""
+        return self.queries[name](node)
+
+    def strings(self, node, name):
+        """Return the strings selected by query `name` from `node`."""
+        return [str(value) for value in self.queries[name](node)]
+
+
+class SelectorBackend:
+    """
+    Backend that evaluates XPath expressions with a Scrapy Selector.
+    Scrapy is imported only when this backend is used.
+    """
+    name = 'scrapy'
+
+    def __init__(self):
+        from scrapy import Selector
+
+        self.selector = Selector
+
+    def parse(self, html):
+        """Return the root node of the `html` document."""
+        return self.selector(text=html)
+
+    def nodes(self, node, name):
+        """Return the nodes selected by query `name` from `node`."""
+        return node.xpath(QUERIES[name])
+
+    def strings(self, node, name):
+        """Return the strings selected by query `name` from `node`."""
+        return node.xpath(QUERIES[name]).extract()
+
+
+BACKENDS = {LxmlBackend.name: LxmlBackend, SelectorBackend.name: SelectorBackend}
+_instances = {}
+
+
+def get_backend(name):
+    """
+    Return the parser backend called `name`, creating it on first use.
+
+    Parameters
+    ----------
+    name : str
+        `lxml` or `scrapy`.
+
+    Returns
+    -------
+    LxmlBackend or SelectorBackend.
+
+    """
+    if name not in _instances:
+        if name not in BACKENDS:
+            raise ValueError(f'Unknown parser backend {name}. Use one of {list(BACKENDS)}.')
+        _instances[name] = BACKENDS[name]()
+    return _instances[name]
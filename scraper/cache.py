@@ -0,0 +1,198 @@
+from collections import Counter
+from hashlib import sha256
+from json import load
+from os import listdir, path, makedirs, remove
+from time import time
+
+from util import log
+from util.files import write_json
+
+
+# seconds after which a cached response of each kind is revalidated
+DEFAULT_TTLS = {'section': 3 * 3600, 'listing': 3 * 3600, 'ad': 24 * 3600, 'fx': 3 * 3600}
+# the index is written after this many stored responses, so that a run
+# that breaks loses at most these
+SAVE_EVERY = 100
+
+
+class ResponseCache:
+    """
+    Class that keeps fetched pages on disk.
+
+    Bodies are stored in files named after the SHA-256 digest of their
+    content, so identical pages are stored once. An index maps every url
+    to its body, the time it was stored and last used, and the ETag and
+    Last-Modified validators sent by the server.
+
+    The index is saved every `SAVE_EVERY` stored responses and when the
+    fetcher closes. Bodies stored after the last save of a run that broke
+    are not in the index; they are deleted when the cache is opened.
+    """
+    def __init__(self, folder, ttls=None, max_size=2 * 1024 ** 3, replay=False):
+        """
+        Parameters
+        ----------
+        folder : str
+            folder where the cache is kept. It is created if it does not exist.
+        ttls : dict or None
+            seconds during which a response of each kind (`section`,
+            `listing`, `ad`, `fx`) is used without asking the server.
+            Missing kinds use `DEFAULT_TTLS`.
+        max_size : int
+            maximum total size of the stored bodies in bytes. The least
+            recently used responses are evicted first.
+        replay : bool
+            if True, cached responses are used regardless of their age,
+            and the fetcher makes no request for pages that are missing.
+
+        """
+        self.folder = folder
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.max_size = max_size
+        self.replay = replay
+        self.hits = 0  # served from disk without a request
+        self.revalidated = 0  # confirmed unchanged by the server
+        self.misses = 0  # downloaded and stored
+        makedirs(folder, exist_ok=True)
+        self.index_path = path.join(folder, 'index.json')
+        self.index = {}
+        if path.isfile(self.index_path):
+            try:
+                with open(self.index_path, encoding='utf-8') as file:
+                    self.index = load(file)
+            except ValueError:
+                log('warn', f'{self.index_path} cannot be read, the cache starts empty.')
+        self._sweep()
+        self.unsaved = 0
+        self.references = Counter(entry['digest'] for entry in self.index.values())
+        self.sizes = {entry['digest']: entry['size'] for entry in self.index.values()}
+        self.total_size = sum(self.sizes.values())
+
+    def _sweep(self):
+        """Drop urls whose body is gone and delete bodies that no url uses."""
+        names = set(listdir(self.folder))
+        self.index = {url: entry for url, entry in self.index.items()
+                      if f'{entry["digest"]}.html' in names}
+        used = {f'{entry["digest"]}.html' for entry in self.index.values()}
+        orphans = [name for name in names if name.endswith('.html') and name not in used]
+        for name in orphans:
+            remove(path.join(self.folder, name))
+        if orphans:
+            log('info', f'{len(orphans)} cached responses missing from the index are deleted.')
+
+    def _body_path(self, digest):
+        return path.join(self.folder, f'{digest}.html')
+
+    def _read(self, entry):
+        entry['accessed'] = time()
+        with open(self._body_path(entry['digest']), encoding='utf-8') as file:
+            return file.read()
+
+    def fresh(self, url, kind):
+        """
+        Return the cached body of `url` if it can be used without asking
+        the server, otherwise None.
+        """
+        entry = self.index.get(url)
+        if entry is not None and not path.isfile(self._body_path(entry['digest'])):
+            self._forget(url)
+            entry = None
+        if entry is None:
+            return None
+
+        if self.replay or time() - entry['stored'] < self.ttls.get(kind, 0):
+            self.hits += 1
+            return self._read(entry)
+        return None
+
+    def validators(self, url):
+        """Return the conditional request headers for a stale `url`."""
+        entry = self.index.get(url)
+        headers = {}
+        if entry is not None:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def revalidate(self, url):
+        """
+        Mark a stale `url` as fresh after the server answered 304 and
+        return its body, or None if the response was evicted meanwhile.
+        """
+        entry = self.index.get(url)
+        if entry is not None and not path.isfile(self._body_path(entry['digest'])):
+            self._forget(url)
+            entry = None
+        if entry is None:
+            return None
+
+        entry['stored'] = time()
+        self.revalidated += 1
+        return self._read(entry)
+
+    def store(self, url, body, headers):
+        """
+        Store the body of `url` together with its validators.
+
+        Parameters
+        ----------
+        url : str
+            url of the fetched page.
+        body : str
+            decoded body of the response.
+        headers : mapping
+            headers of the response.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.misses += 1
+        data = body.encode('utf-8')
+        digest = sha256(data).hexdigest()
+        if url in self.index:
+            self._forget(url)
+        if self.references[digest] == 0:
+            with open(self._body_path(digest), 'wb') as file:
+                file.write(data)
+            self.sizes[digest] = len(data)
+            self.total_size += len(data)
+
+        now = time()
+        self.index[url] = {
+            'digest': digest, 'size': len(data), 'stored': now, 'accessed': now,
+            'etag': headers.get('ETag'), 'last_modified': headers.get('Last-Modified')
+        }
+        self.references[digest] += 1
+        if self.total_size > self.max_size:
+            self.evict()
+        self.unsaved += 1
+        if self.unsaved >= SAVE_EVERY:
+            self.save()
+
+    def _forget(self, url):
+        """Remove `url` from the index and delete its body if no other url uses it."""
+        digest = self.index.pop(url)['digest']
+        self.references[digest] -= 1
+        if self.references[digest] <= 0:
+            del self.references[digest]
+            self.total_size -= self.sizes.pop(digest, 0)
+            body_path = self._body_path(digest)
+            if path.isfile(body_path):
+                remove(body_path)
+
+    def evict(self):
+        """Remove the least recently used responses until the cache fits `max_size`."""
+        by_access = sorted(self.index.items(), key=lambda item: item[1]['accessed'])
+        for url, _ in by_access:
+            if self.total_size <= self.max_size * 0.9:
+                break
+            self._forget(url)
+
+    def save(self):
+        """Write the index to disk."""
+        write_json(self.index_path, self.index)
+        self.unsaved = 0
@@ -0,0 +1,125 @@
+from datetime import datetime, timedelta
+
+from numpy import append
+from pandas import NaT, DataFrame, DateOffset, Series, factorize, to_datetime
+
+from util.fx import usd_prices
+from .parser import AMENITIES
+from .records import RAW_COLUMNS
+
+
+MONTHS = {
+    'января': 1, 'февраля': 2, 'марта': 3, 'апреля': 4, 'мая': 5, 'июня': 6,
+    'июля': 7, 'августа': 8, 'сентября': 9, 'октября': 10, 'ноября': 11, 'декабря': 12
+}
+# `12 августа 2021 г.` as shown on an announcement page
+DATE_PATTERN = r'(\d{1,2}) (\w+) (\d{4})'
+# `12 авг.` as shown on a listing card, without the year
+SHORT_DATE_PATTERN = r'^(\d{1,2}) (\w{3})\w*\.?$'
+SHORT_MONTHS = {name[:3]: number for name, number in MONTHS.items()}
+
+
+def parse_dates(dates, today):
+    """
+    Convert the dates of announcements to datetimes.
+
+    Parameters
+    ----------
+    dates : pandas Series
+        dates as shown on OLX, e.g. `12 августа 2021 г.`, `Сегодня в 10:15`
+        or `Вчера в 18:40`, or on a listing card, e.g. `12 авг.`, which is
+        taken as the last such day up to today. Dates of the form
+        `dd-mm-yyyy` and datetimes,
+        such as those of announcements carried forward from the ad index,
+        are kept.
+    today : str
+        today's date of the form `dd-mm-yyyy`.
+
+    Returns
+    -------
+    pandas Series of datetime64.
+        NaT where the date cannot be read.
+
+    """
+    # the announcements of a section share a few dozen dates
+    codes, uniques = factorize(dates)
+    written = _parse_unique_dates(Series(uniques, dtype=object), today)
+    # missing dates have the code -1, which picks the appended NaT
+    return Series(append(written.to_numpy(), written.dtype.type('NaT'))[codes], index=dates.index)
+
+
+def _parse_unique_dates(dates, today):
+    # datetimes, e.g. of announcements carried forward from the ad index,
+    # are kept, and only the texts are parsed
+    is_datetime = dates.map(lambda value: isinstance(value, datetime)).to_numpy(dtype=bool)
+    written = Series(NaT, index=dates.index, dtype='datetime64[ns]')
+    if is_datetime.any():
+        written[is_datetime] = to_datetime(dates[is_datetime])
+    if not is_datetime.all():
+        texts = dates[~is_datetime]
+        written[~is_datetime] = _parse_texts(texts.astype(str).where(texts.notna()), today)
+    return written
+
+
+def _parse_texts(dates, today):
+    parts = dates.str.extract(DATE_PATTERN)
+    written = to_datetime(DataFrame({'year': parts[2].astype(float),
+                                     'month': parts[1].map(MONTHS),
+                                     'day': parts[0].astype(float)}), errors='coerce')
+    today = to_datetime(today, format='%d-%m-%Y')
+    written[dates.str.startswith('Сегодня', na=False)] = today
+    written[dates.str.startswith('Вчера', na=False)] = today - timedelta(days=1)
+    short = dates.str.extract(SHORT_DATE_PATTERN)
+    short_months = short[1].str.lower().map(SHORT_MONTHS)
+    if short_months.notna().any():
+        this_year = to_datetime(DataFrame({'year': today.year, 'month': short_months,
+                                           'day': short[0].astype(float)}), errors='coerce')
+        written = written.fillna(this_year.where(this_year <= today,
+                                                 this_year - DateOffset(years=1)))
+    if written.isna().any():
+        kept = to_datetime(dates.where(written.isna()), format='%d-%m-%Y', errors='coerce')
+        written = written.fillna(kept)
+    return written
+
+
+def derive_columns(df, today, usd_to_uzs):
+    """
+    Compute the columns that are derived from the text of the pages for
+    all announcements of a section at once, and drop `RAW_COLUMNS`.
+
+    `date` becomes a datetime, the amenity flags are looked up in
+    `close_things`, `price` is converted to USD from `raw_price` and
+    `currency`, and `price_m2` is recomputed. Announcements carried
+    forward from the ad index have no `close_things` or `raw_price` and
+    keep the values they were saved with.
+
+    Parameters
+    ----------
+    df : pandas DataFrame
+        frame returned by `records_to_frame`.
+    today : str
+        today's date of the form `dd-mm-yyyy`.
+    usd_to_uzs : float
+        exchange rate used to convert prices in UZS to USD.
+
+    Returns
+    -------
+    pandas DataFrame
+        frame with the columns of `COLUMN_NAMES`.
+
+    """
+    df = df.copy()
+    df['date'] = parse_dates(df['date'], today)
+
+    codes, close_things = factorize(df['close_things'])
+    close_things = Series(close_things, dtype=object)
+    with_text = Series(codes >= 0, index=df.index)
+    for column, amenity in AMENITIES.items():
+        found = close_things.str.contains(amenity, regex=False).to_numpy(dtype=bool)
+        # missing texts have the code -1, which picks the appended False;
+        # this also holds when no row has a text, as with listing cards
+        flags = Series(append(found, False)[codes], index=df.index)
+        df[column] = flags if with_text.all() else flags.where(with_text, df[column])
+
+    df['price'], df['price_m2'] = usd_prices(df, usd_to_uzs)
+    return df.drop(columns=RAW_COLUMNS)
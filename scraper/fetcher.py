@@ -0,0 +1,202 @@
+from asyncio import TimeoutError, sleep
+from urllib.parse import urlsplit
+
+from aiohttp import ClientError, ClientSession, ClientTimeout, TCPConnector
+
+from util import log, metrics
+from .policy import AdaptiveLimiter, CircuitBreaker, RequestPolicy
+
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class RequestBudgetExceeded(Exception):
+    """Raised when a fetcher has already made as many requests as allowed."""
+
+
+class FetchError(Exception):
+    """
+    Raised when a page could not be fetched. If `retryable` is True, the
+    page may be fetched successfully later.
+    """
+    def __init__(self, message, retryable=True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class AsyncFetcher:
+    """Class that fetches web pages over pooled keep-alive connections."""
+    def __init__(self, headers, limit_per_host=8, limit=32, max_requests=None, cache=None,
+                 policy=None):
+        """
+        Parameters
+        ----------
+        headers : dict
+            HTTP headers sent with every request.
+        limit_per_host : int
+            maximum number of simultaneous connections to a single host.
+        limit : int
+            maximum number of simultaneous connections in total.
+        max_requests : int or None
+            maximum number of requests the fetcher is allowed to make.
+            If None, the number of requests is not limited. Responses
+            served from the cache are not counted.
+        cache : ResponseCache or None
+            cache consulted before every request and filled with the
+            responses. If None, every page is downloaded.
+        policy : RequestPolicy or None
+            timeouts, retries and circuit breaker settings. If None, the
+            defaults of `RequestPolicy` are used.
+
+        """
+        self.headers = headers
+        self.limit_per_host = limit_per_host
+        self.limit = limit
+        self.max_requests = max_requests
+        self.num_requests = 0
+        self.cache = cache
+        self.policy = policy or RequestPolicy()
+        self.limiters = {}
+        self.breakers = {}
+        self.session = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        await self.close()
+
+    async def open(self):
+        """Create the connection pool shared by all requests."""
+        if self.session is None:
+            connector = TCPConnector(limit=self.limit,
+                                     limit_per_host=self.limit_per_host,
+                                     ttl_dns_cache=300)
+            timeout = ClientTimeout(sock_connect=self.policy.connect_timeout,
+                                    sock_read=self.policy.read_timeout)
+            self.session = ClientSession(headers=self.headers, connector=connector,
+                                         timeout=timeout)
+
+    async def close(self):
+        """Close the connection pool and save the cache index."""
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+        if self.cache is not None:
+            self.cache.save()
+
+    @property
+    def budget_exhausted(self):
+        """True if no more requests are allowed."""
+        return self.max_requests is not None and self.num_requests >= self.max_requests
+
+    def cooldown_remaining(self):
+        """Seconds until every host with an open circuit breaker is allowed again."""
+        return max([breaker.remaining() for breaker in self.breakers.values()], default=0)
+
+    def _host_controls(self, url):
+        """Return the limiter and circuit breaker of the host of `url`."""
+        host = urlsplit(url).netloc
+        if host not in self.limiters:
+            self.limiters[host] = AdaptiveLimiter(max(1, self.limit_per_host // 2),
+                                                  self.limit_per_host)
+            self.breakers[host] = CircuitBreaker(self.policy.breaker_threshold,
+                                                 self.policy.breaker_cooldown)
+        return self.limiters[host], self.breakers[host]
+
+    async def _request(self, url, kind, headers):
+        """Request `url` once and return the status, body and headers of the response."""
+        self.num_requests += 1
+        metrics.count(f'{kind}_requests')
+        async with self.session.get(url, headers=headers) as response:
+            body = await response.text(errors='replace') if response.status == 200 else None
+            return response.status, body, response.headers
+
+    async def get(self, url, kind='ad'):
+        """
+        Fetch the page at `url`, using the cache when it is fresh.
+
+        Parameters
+        ----------
+        url : str
+            url of the page to be fetched.
+        kind : str
+            kind of the page, `section`, `listing`, `ad` or `fx`, which
+            decides how long a cached copy is used.
+
+        Returns
+        -------
+        str
+            decoded body of the response.
+
+        Raises
+        ------
+        RequestBudgetExceeded
+            if `max_requests` requests have already been made.
+        FetchError
+            if the host keeps failing or answers with an error status, or
+            if the page is not cached during a replay.
+
+        """
+        headers = {}
+        if self.cache is not None:
+            body = self.cache.fresh(url, kind)
+            if body is not None:
+                metrics.count(f'{kind}_cached')
+                return body
+            if self.cache.replay:
+                raise FetchError(f'{url} is not cached, and a replay makes no requests.',
+                                 retryable=False)
+            headers = self.cache.validators(url)
+
+        limiter, breaker = self._host_controls(url)
+        for attempt in range(self.policy.max_retries + 1):
+            if not breaker.allow():
+                raise FetchError(f'{urlsplit(url).netloc} is failing, {url} is not requested.')
+            if self.budget_exhausted:
+                raise RequestBudgetExceeded(f'Request budget of {self.max_requests} is spent.')
+
+            retry_after = None
+            async with limiter:
+                try:
+                    status, body, response_headers = await self._request(url, kind, headers)
+                    if status == 304 and self.cache is not None:
+                        body = self.cache.revalidate(url)
+                        if body is None:
+                            # the response was evicted since its validators
+                            # were sent, so the page is downloaded again
+                            headers = {}
+                            status, body, response_headers = await self._request(url, kind,
+                                                                                 headers)
+                    if status == 200:
+                        if self.cache is not None:
+                            self.cache.store(url, body, response_headers)
+                    elif status in RETRY_STATUSES:
+                        error = f'{url} answered with status {status}.'
+                        retry_after = response_headers.get('Retry-After')
+                    elif body is None:
+                        raise FetchError(f'{url} answered with status {status}.',
+                                         retryable=False)
+                except (ClientError, TimeoutError) as exception:
+                    body = None
+                    error = f'{url} could not be fetched: {exception!r}.'
+
+            if body is not None:
+                limiter.increase()
+                breaker.success()
+                return body
+
+            limiter.decrease()
+            breaker.failure()
+            metrics.count(f'{kind}_failures')
+            if attempt < self.policy.max_retries:
+                if retry_after is not None and retry_after.isdigit():
+                    retry_after = int(retry_after)
+                else:
+                    retry_after = None
+                delay = self.policy.backoff(attempt, retry_after)
+                log('warn', f'{error} Retrying in {delay:.1f} s.')
+                await sleep(delay)
+
+        raise FetchError(error)
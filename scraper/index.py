@@ -0,0 +1,223 @@
+from datetime import date, datetime, timedelta
+from glob import glob
+from os import path
+from pickle import dump, load, HIGHEST_PROTOCOL
+
+from pandas import isna, read_pickle
+
+from util import log
+from util.files import atomic_write
+from util.schema import unpack_amenities
+from util.snapshots import SNAPSHOT_FOLDER, SnapshotStore
+from util.storage import dataset_exists, read_dataset
+from .parser import CURRENCIES
+from .records import COLUMN_NAMES, Announcement
+
+
+# labels of the currencies as shown on OLX, by ISO 4217 code
+CURRENCY_LABELS = {code: label for label, code in CURRENCIES.items()}
+# OLX shows an announcement for about two months, so announcements not
+# seen on a listing page for longer are dropped from the index
+MAX_AGE_DAYS = 90
+
+
+def ad_key(link):
+    """Return the url of an announcement without its query and fragment."""
+    return link.split('#')[0].split('?')[0]
+
+
+def parse_day(text):
+    """Convert a `dd-mm-yyyy` string or a datetime to a date, or return None."""
+    if isinstance(text, datetime):
+        return None if isna(text) else text.date()
+    try:
+        return datetime.strptime(text, '%d-%m-%Y').date()
+    except (TypeError, ValueError):
+        return None
+
+
+class AdIndex:
+    """
+    Class that remembers every announcement that has been scraped.
+
+    For every announcement the index keeps the price shown on the listing
+    page and the row scraped from the announcement page. Announcements
+    whose listing price has not changed since then are carried forward
+    from the index instead of being fetched again. Every entry records
+    the day the announcement was last seen, and announcements not seen
+    for `MAX_AGE_DAYS` are dropped when the index is saved.
+    """
+    def __init__(self, filename, today, yesterday):
+        """
+        Parameters
+        ----------
+        filename : str
+            pickle file where the index is kept.
+        today : str
+            today's date of the form `dd-mm-yyyy`.
+        yesterday : str
+            yesterday's date of the form `dd-mm-yyyy`.
+
+        """
+        self.filename = filename
+        self.today = today
+        self.yesterday = yesterday
+        self.entries = {}
+        self.pending = {}
+        self.carried = 0
+        if path.isfile(filename):
+            with open(filename, 'rb') as file:
+                self.entries = load(file)
+
+    def build(self, database_folder):
+        """
+        Fill the index from the `dd-mm-yyyy-merged.pkl` files, the
+        snapshots and the Parquet dataset of the `Database` folder. Newer
+        days override older ones, snapshots override the pickle files and
+        the dataset overrides both. Of every snapshot only the
+        announcements that are new or changed since the day before are
+        read.
+
+        Parameters
+        ----------
+        database_folder : str
+            path to the `Database` folder.
+
+        Returns
+        -------
+        None.
+
+        """
+        filenames = glob(path.join(database_folder, '*-merged.pkl'))
+        filenames = [name for name in filenames
+                     if parse_day(path.basename(name)[:10]) is not None]
+        filenames.sort(key=lambda name: parse_day(path.basename(name)[:10]))
+        for filename in filenames:
+            self.update(read_pickle(filename), parse_day(path.basename(filename)[:10]))
+        store = SnapshotStore(path.join(database_folder, SNAPSHOT_FOLDER))
+        for day in store.days:
+            self.update(store.new_rows(day), date.fromisoformat(day))
+        num_days = 0
+        if dataset_exists(database_folder):
+            dataset = read_dataset(database_folder, ['scraped', *COLUMN_NAMES])
+            for scraped, day in dataset.groupby('scraped', sort=True):
+                self.update(day.drop(columns='scraped'), date.fromisoformat(str(scraped)))
+                num_days += 1
+        log('info', f'Ad index built from {len(filenames)} files, {len(store.days)} snapshots'
+                    f' and {num_days} days of the dataset: {len(self.entries)} ads.')
+
+    def observe(self, card):
+        """
+        Remember the listing price of an announcement until it is saved,
+        and that it is still online.
+        """
+        key = ad_key(card.link)
+        if key in self.entries:
+            self.entries[key]['seen'] = parse_day(self.today)
+        if card.price is not None:
+            self.pending[key] = (card.price, card.currency)
+
+    def observe_listed(self, dataframe):
+        """
+        Remember the listing prices of rows that a shallow scrape took
+        from listing cards, before they are replaced by their full rows.
+        """
+        for link, raw_price, currency in dataframe[['link', 'raw_price', 'currency']].itertuples(
+                index=False):
+            key = ad_key(link)
+            if key in self.entries:
+                self.entries[key]['seen'] = parse_day(self.today)
+            if not isna(raw_price) and currency in CURRENCY_LABELS:
+                self.pending[key] = (raw_price, CURRENCY_LABELS[currency])
+
+    def carry_forward(self, card):
+        """
+        Return a record of the announcement from the index if it has not
+        changed since it was scraped, otherwise None.
+
+        An announcement is considered changed if its listing price or
+        currency differ from the stored ones, or if the listing page shows
+        that it was updated after the stored date.
+
+        Parameters
+        ----------
+        card : ListingCard
+            summary of the announcement on the listing page.
+
+        Returns
+        -------
+        Announcement or None.
+
+        """
+        entry = self.entries.get(ad_key(card.link))
+        if entry is None or card.price is None:
+            return None
+        if (card.price, card.currency) != (entry['price'], entry['currency']):
+            return None
+
+        listing_day = None
+        if card.date is not None:
+            if card.date.startswith('Сегодня'):
+                listing_day = parse_day(self.today)
+            elif card.date.startswith('Вчера'):
+                listing_day = parse_day(self.yesterday)
+        stored_day = parse_day(entry['row'].get('date'))
+        if listing_day is not None and stored_day is not None and listing_day > stored_day:
+            return None
+
+        self.carried += 1
+        return Announcement.from_row(entry['row'])
+
+    def update(self, dataframe, day=None):
+        """
+        Store the rows of a scraped DataFrame in the index.
+
+        Rows whose listing price was not observed are stored with the
+        price and currency shown on their announcement page, or with their
+        price in USD, as shown for announcements priced in у.е., if these
+        are missing.
+
+        Parameters
+        ----------
+        dataframe : pandas DataFrame
+            rows scraped from announcement pages.
+        day : date or None
+            day the rows were scraped on. If None, today.
+
+        Returns
+        -------
+        None.
+
+        """
+        seen = day or parse_day(self.today)
+        for row in unpack_amenities(dataframe).to_dict('records'):
+            key = ad_key(row['link'])
+            shown = (row['price'], 'у.е.')
+            if not isna(row.get('raw_price')) and row.get('currency') in CURRENCY_LABELS:
+                shown = (row['raw_price'], CURRENCY_LABELS[row['currency']])
+            price, currency = self.pending.pop(key, shown)
+            self.entries[key] = {'price': price, 'currency': currency, 'row': row, 'seen': seen}
+
+    def expire(self):
+        """
+        Drop the announcements not seen for `MAX_AGE_DAYS` and return their
+        number. Entries of older indexes, which have no day they were
+        seen, count as seen on the date of their row.
+        """
+        oldest = parse_day(self.today) - timedelta(days=MAX_AGE_DAYS)
+        expired = [key for key, entry in self.entries.items()
+                   if (entry.get('seen') or parse_day(entry['row'].get('date'))
+                       or parse_day(self.today)) < oldest]
+        for key in expired:
+            del self.entries[key]
+        return len(expired)
+
+    def save(self):
+        """Write the index to disk, without the announcements that have expired."""
+        expired = self.expire()
+        if expired:
+            log('info', f'{expired} ads not seen for {MAX_AGE_DAYS} days were dropped'
+                        f' from the ad index.')
+        with atomic_write(self.filename) as temporary:
+            with open(temporary, 'wb') as file:
+                dump(self.entries, file, protocol=HIGHEST_PROTOCOL)
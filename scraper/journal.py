@@ -0,0 +1,83 @@
+from os import path, remove
+from pickle import dump, load, UnpicklingError, HIGHEST_PROTOCOL
+
+from util import log
+from .records import RECORD_COLUMNS, Announcement
+
+
+class SectionJournal:
+    """
+    Class that collects the records of a section and appends each of them
+    to a journal file as soon as it is scraped.
+
+    Completed pages are written to the journal too. If the scraper stops
+    in the middle of a section, the journal is replayed on the next run,
+    so only unfinished pages are fetched again and announcements that
+    are already in the journal are not fetched at all.
+    """
+    def __init__(self, filename):
+        """
+        Parameters
+        ----------
+        filename : str
+            journal file. If it exists, its records and completed pages
+            are loaded.
+
+        """
+        self.filename = filename
+        self.records = []
+        self.links = set()
+        self.completed_pages = set()
+        good_size = 0
+        if path.isfile(filename):
+            with open(filename, 'rb') as file:
+                while True:
+                    try:
+                        kind, value = load(file)
+                    except (EOFError, UnpicklingError, TypeError, ValueError):
+                        break
+                    good_size = file.tell()
+                    if kind == 'ad':
+                        self._add(Announcement.from_row(dict(zip(RECORD_COLUMNS, value))))
+                    elif kind == 'page':
+                        self.completed_pages.add(value)
+            log('info', f'{filename}: replayed {len(self.records)} announcements and'
+                        f' {len(self.completed_pages)} pages.')
+
+        self.file = open(filename, 'ab')
+        # drop an entry that was cut off when the scraper stopped
+        self.file.truncate(good_size)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def _add(self, record):
+        self.records.append(record)
+        self.links.add(record.link)
+
+    def _write(self, entry):
+        dump(entry, self.file, protocol=HIGHEST_PROTOCOL)
+        self.file.flush()
+
+    def append(self, record):
+        """Add a record of an announcement and write it to the journal."""
+        self._add(record)
+        self._write(('ad', record.values()))
+
+    def complete_page(self, page_url):
+        """Write to the journal that every announcement of a listing page is scraped."""
+        self.completed_pages.add(page_url)
+        self._write(('page', page_url))
+
+    def close(self):
+        """Close the journal file, keeping it for the next run."""
+        if not self.file.closed:
+            self.file.close()
+
+    def remove(self):
+        """Close and delete the journal file once its section is saved."""
+        self.close()
+        remove(self.filename)
@@ -0,0 +1,287 @@
+from re import compile, findall
+
+from .backends import get_backend
+from .records import Announcement, ListingCard
+
+
+DISTRICT_PATTERN = compile(r'Продажа - (.*) район')
+# location of a listing card, e.g. `Ташкент, Чиланзарский район`
+CARD_DISTRICT_PATTERN = compile(r', (.*) район')
+INT_PATTERN = compile(r'\d+')
+YEAR_PATTERN = compile(r'.*(\d{4})')
+LISTING_PRICE_PATTERN = compile(r'(\d[\d\s]*?)\s?(у\.е\.|сум)')
+BOOLEANS = {'Да': True, 'Нет': False}
+# currencies of OLX prices as ISO 4217 codes
+CURRENCIES = {'у.е.': 'USD', 'сум': 'UZS'}
+
+
+def to_text(value):
+    """Return the value of a detail as it is."""
+    return value
+
+
+def to_int(value):
+    """Convert the leading digits of a detail such as `70 м²` to int."""
+    digits = INT_PATTERN.match(value)
+    if digits is None:
+        raise ValueError(f'{value} does not start with a number')
+    return int(digits.group())
+
+
+def to_year(value):
+    """Convert the last four digits of a detail to a year."""
+    year = YEAR_PATTERN.match(value)
+    if year is None:
+        raise ValueError(f'{value} does not contain a year')
+    return int(year.group(1))
+
+
+def to_bool(value):
+    """Convert `Да`/`Нет` to True/False. Other values become None."""
+    return BOOLEANS.get(value)
+
+
+def to_height(value):
+    """
+    Convert a ceiling height to metres. OLX users enter the height in
+    metres, decimetres or centimetres, e.g. `2.8`, `28` or `280`.
+    """
+    height = float(value)
+    if height > 150:
+        height /= 100
+    elif height >= 20:
+        height /= 10
+    return height
+
+
+# label shown on OLX -> (column of the record, converter of the value)
+DETAIL_FIELDS = {
+    'Тип жилья': ('home_type', to_text),
+    'Количество комнат': ('num_rooms', to_int),
+    'Общая площадь': ('area', to_int),
+    'Этаж': ('apart_floor', to_int),
+    'Этажность дома': ('home_floor', to_int),
+    'Тип строения': ('build_type', to_text),
+    'Планировка': ('build_plan', to_text),
+    'Год постройки': ('build_year', to_year),
+    'Год постройки/сдачи': ('build_year', to_year),
+    'Санузел': ('bathroom', to_text),
+    'Меблирована': ('furnished', to_bool),
+    'Высота потолков': ('ceil_height', to_height),
+    'Ремонт': ('condition', to_text),
+    'Комиссионные': ('commission', to_bool),
+}
+CLOSE_THINGS_LABEL = 'Рядом есть'
+AMENITIES = {
+    'hospital': 'Больница', 'playground': 'Детская площадка',
+    'kindergarten': 'Детский сад', 'park': 'Парк',
+    'recreation': 'Развлекательные заведения', 'restaurant': 'Рестораны',
+    'school': 'Школа', 'supermarket': 'Супермаркет'
+}
+
+
+def parse_details(other_details, record):
+    """
+    Fill the fields of `record` from the `Key: value` lines listed under
+    an OLX announcement in a single pass.
+
+    The first line whose value can be converted wins for each field.
+    Lines with unknown labels are ignored.
+
+    Parameters
+    ----------
+    other_details : list of str
+        text lines of the details list of an announcement.
+    record : Announcement
+        record whose fields will be filled.
+
+    Returns
+    -------
+    None.
+
+    """
+    filled = set()
+    close_things = ''
+    for item in other_details:
+        label, _, value = item.partition(': ')
+        if label == CLOSE_THINGS_LABEL and not close_things:
+            close_things = value
+            continue
+
+        field = DETAIL_FIELDS.get(label)
+        if field is None or field[0] in filled:
+            continue
+
+        column, converter = field
+        try:
+            setattr(record, column, converter(value))
+        except ValueError:
+            continue
+        filled.add(column)
+
+    # the amenities are derived from the text by `derive_columns`
+    record.close_things = close_things
+
+
+def first(strings):
+    """Return the first of `strings`, or None if there are none."""
+    return strings[0] if strings else None
+
+
+def parse_announcement(html, url, backend='lxml'):
+    """
+    Parse the page of an individual OLX announcement.
+
+    The function is self-contained so that it can run in a worker process.
+
+    Parameters
+    ----------
+    html : str
+        html of the announcement page.
+    url : str
+        url of the announcement.
+    backend : str
+        parser backend, `lxml` or `scrapy`.
+
+    Returns
+    -------
+    Announcement
+        record containing information gathered from the announcement.
+        The date, price and amenities are kept as shown on the page and
+        converted for the whole section by `derive_columns`.
+
+    """
+    parser = get_backend(backend)
+    document = parser.parse(html)
+    record = Announcement(url)
+
+    try:
+        district_list = parser.strings(document, 'district_links')
+        district = list(filter(DISTRICT_PATTERN.match, district_list))[0]
+        district = DISTRICT_PATTERN.sub(r'\1', district)
+        record.district = district
+    except:
+        pass
+
+    try:
+        record.date = first(parser.strings(document, 'date'))
+    except:
+        pass
+
+    try:
+        price_list = parser.strings(document, 'price')
+        currency = CURRENCIES.get(price_list[-1])
+        if currency is not None:
+            record.raw_price = float(price_list[0].replace(' ', ''))
+            record.currency = currency
+    except:
+        pass
+
+    # Other details
+    try:
+        other_details = parser.strings(document, 'details')
+    except:
+        other_details = ''
+
+    parse_details(other_details, record)
+
+    # Title and text parts
+    try:
+        record.title_text = first(parser.strings(document, 'title'))
+    except:
+        pass
+
+    try:
+        content = parser.strings(document, 'content')
+        if len(content) > 3:
+            content = content[:3]
+
+        content = '. '.join(content)
+        content = content.replace('\n', '')
+        record.post_text = content
+    except:
+        pass
+
+    return record
+
+
+def parse_listing(html, backend='lxml'):
+    """
+    Parse a listing page of an OLX section.
+
+    Parameters
+    ----------
+    html : str
+        html of the listing page.
+    backend : str
+        parser backend, `lxml` or `scrapy`.
+
+    Returns
+    -------
+    list of ListingCard
+        one card per announcement, in the order of the page. If the price,
+        date, title or district of an announcement cannot be read from the
+        page, they are None.
+
+    """
+    parser = get_backend(backend)
+    document = parser.parse(html)
+    cards = []
+    for card in parser.nodes(document, 'listing_cards'):
+        link = first(parser.strings(card, 'card_link'))
+        if link is None:
+            continue
+
+        listing_card = ListingCard(link)
+        price = LISTING_PRICE_PATTERN.search(first(parser.strings(card, 'card_price')) or '')
+        if price is not None:
+            listing_card.price = float(''.join(price.group(1).split()))
+            listing_card.currency = price.group(2)
+        listing_card.date = (first(parser.strings(card, 'card_date')) or '').strip() or None
+        listing_card.title = first(parser.strings(card, 'card_title'))
+        district = CARD_DISTRICT_PATTERN.search(first(parser.strings(card, 'card_location')) or '')
+        if district is not None:
+            listing_card.district = district.group(1)
+        cards.append(listing_card)
+
+    if not cards:
+        cards = [ListingCard(link) for link in parser.strings(document, 'ad_links')]
+    return cards
+
+
+def listing_record(card):
+    """
+    Return a record of an announcement with the fields its listing card
+    shows: link, title, raw price, currency, district and date. The other
+    fields are missing until the announcement page is scraped, and
+    `listing_only` is True until then.
+    """
+    record = Announcement(card.link)
+    record.listing_only = True
+    if card.title is not None:
+        record.title_text = card.title
+    if card.district is not None:
+        record.district = card.district
+    if card.date is not None:
+        record.date = card.date
+    currency = CURRENCIES.get(card.currency)
+    if card.price is not None and currency is not None:
+        record.raw_price = card.price
+        record.currency = currency
+    return record
+
+
+def parse_number_ads(html, backend='lxml'):
+    """Return the number of announcements shown on the first page of a section."""
+    parser = get_backend(backend)
+    number_ads = first(parser.strings(parser.parse(html), 'number_ads'))
+    number_ads = findall(r'[0-9]+\s?[0-9]*', number_ads)
+    number_ads = number_ads[0].replace(' ', '')
+    return int(number_ads)
+
+
+def parse_fx_rate(html, backend='lxml'):
+    """Return the USD to UZS exchange rate shown on the main page of www.cbu.uz."""
+    parser = get_backend(backend)
+    fx_rates = parser.strings(parser.parse(html), 'fx_rates')
+    return float(fx_rates[0].replace(' = ', ''))
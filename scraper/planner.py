@@ -0,0 +1,109 @@
+from asyncio import gather
+from math import ceil
+
+from util import log, metrics
+
+
+PAGE_SIZE = 39  # announcements on one listing page
+MAX_PAGES = 25  # OLX shows only 25 pages of a query
+MAX_ADS = PAGE_SIZE * MAX_PAGES
+# the first split of an oversized section, in USD. Upper halves without a
+# bound are split again at twice their lower bound.
+FIRST_SPLIT = 50000
+PRICE_FILTER = '&currency=USD&search%5Bfilter_float_price%3Afrom%5D={}'
+PRICE_TO_FILTER = '&search%5Bfilter_float_price%3Ato%5D={}'
+
+
+class PriceRange:
+    """
+    One query of a section, restricted to ads whose price in USD is
+    between `low` and `high`. `high` is None for a range without upper
+    bound. Both bounds are included, so an ad priced exactly at a bound
+    is shown by both neighbouring ranges.
+    """
+    __slots__ = ['section_url', 'low', 'high', 'number_ads']
+
+    def __init__(self, section_url, low=None, high=None, number_ads=None):
+        self.section_url = section_url
+        self.low = low
+        self.high = high
+        self.number_ads = number_ads
+
+    @property
+    def url(self):
+        """Url of the query, without a price filter for the whole section."""
+        url = self.section_url
+        if self.low is not None:
+            url += PRICE_FILTER.format(self.low)
+        if self.high is not None:
+            url += PRICE_TO_FILTER.format(self.high)
+        return url
+
+    @property
+    def num_pages(self):
+        """Number of listing pages OLX shows for the range."""
+        return min(ceil(self.number_ads / PAGE_SIZE), MAX_PAGES)
+
+    def split(self):
+        """Return the lower and the upper half of the range."""
+        if self.high is None:
+            middle = max(2 * (self.low or 0), FIRST_SPLIT)
+        else:
+            middle = (self.low or 0) + (self.high - (self.low or 0)) // 2
+        return (PriceRange(self.section_url, self.low or 0, middle),
+                PriceRange(self.section_url, middle, self.high))
+
+
+async def plan_ranges(section, count):
+    """
+    Split a section into price ranges that OLX shows completely.
+
+    A section with at most `MAX_ADS` announcements is one range and costs
+    no extra request. Larger sections are halved by price, and halves
+    that still have too many announcements are halved again, until every
+    range fits into `MAX_PAGES` pages. The halves of a range are counted
+    concurrently. A range of one dollar that is still too large, or one
+    that OLX does not narrow down, is kept as it is, and the announcements
+    beyond its last page are lost.
+
+    Parameters
+    ----------
+    section : Section
+        section whose number of announcements is known.
+    count : coroutine function
+        called with the url of a query to find its number of announcements.
+
+    Returns
+    -------
+    list of PriceRange
+        ranges that cover the section, ordered by price.
+
+    """
+    whole = PriceRange(section.url, number_ads=section.number_ads)
+    if section.number_ads <= MAX_ADS:
+        return [whole]
+
+    async def plan(price_range):
+        if price_range.number_ads <= MAX_ADS:
+            return [price_range]
+        if price_range.high is not None and price_range.high - (price_range.low or 0) <= 1:
+            log('warn', f'{section.filename}: {price_range.number_ads} ads cost'
+                        f' {price_range.low} USD, only {MAX_ADS} of them can be scraped.')
+            return [price_range]
+
+        halves = price_range.split()
+        counts = await gather(*[count(half.url) for half in halves])
+        if min(counts) == price_range.number_ads:
+            log('warn', f'{section.filename}: the price filter of OLX does not narrow'
+                        f' {price_range.url} down.')
+            return [price_range]
+        for half, number_ads in zip(halves, counts):
+            half.number_ads = number_ads
+        metrics.count('ranges_split')
+        lower, upper = await gather(*[plan(half) for half in halves])
+        return lower + upper
+
+    ranges = [price_range for price_range in await plan(whole) if price_range.number_ads]
+    log('info', f'{section.filename}: {section.number_ads} ads are split into'
+                f' {len(ranges)} price ranges.')
+    return ranges
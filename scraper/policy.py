@@ -0,0 +1,124 @@
+from asyncio import Condition
+from random import uniform
+from time import monotonic
+
+
+class RequestPolicy:
+    """Timeouts and retry settings shared by all requests of a scraper."""
+    def __init__(self, connect_timeout=10, read_timeout=30, max_retries=4,
+                 backoff_base=1, backoff_cap=60, breaker_threshold=8,
+                 breaker_cooldown=60, requeue_passes=2):
+        """
+        Parameters
+        ----------
+        connect_timeout : float
+            seconds to wait for a connection to be established.
+        read_timeout : float
+            seconds to wait for the next chunk of a response.
+        max_retries : int
+            number of times a request is repeated after a timeout, a
+            connection error or a 429/5xx response.
+        backoff_base : float
+            seconds to wait before the first retry. The wait doubles with
+            every retry and is jittered.
+        backoff_cap : float
+            maximum number of seconds to wait before a retry.
+        breaker_threshold : int
+            number of consecutive failures after which requests to a host
+            are stopped for `breaker_cooldown` seconds.
+        breaker_cooldown : float
+            seconds during which requests to a failing host are stopped.
+        requeue_passes : int
+            number of times the pages and ads that still failed are tried
+            again at the end of a section.
+
+        """
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.requeue_passes = requeue_passes
+
+    def backoff(self, attempt, retry_after=None):
+        """
+        Return the seconds to wait before retry number `attempt`, starting
+        from 0. A `Retry-After` value sent by the server is respected.
+        """
+        delay = min(self.backoff_cap, self.backoff_base * 2 ** attempt)
+        delay = uniform(delay / 2, delay)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_cap))
+        return delay
+
+
+class AdaptiveLimiter:
+    """
+    Class that limits the number of simultaneous requests to a host.
+
+    The limit grows by one after every `limit` successful responses and
+    is halved when the host throttles the scraper (additive increase,
+    multiplicative decrease).
+    """
+    def __init__(self, initial, maximum, minimum=1):
+        self.limit = initial
+        self.maximum = maximum
+        self.minimum = minimum
+        self.active = 0
+        self.successes = 0
+        self.condition = Condition()
+
+    async def __aenter__(self):
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.active < self.limit)
+            self.active += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        async with self.condition:
+            self.active -= 1
+            self.condition.notify_all()
+
+    def increase(self):
+        """Register a healthy response."""
+        self.successes += 1
+        if self.successes >= self.limit and self.limit < self.maximum:
+            self.limit += 1
+            self.successes = 0
+
+    def decrease(self):
+        """Register a throttled or failed response."""
+        self.limit = max(self.minimum, self.limit // 2)
+        self.successes = 0
+
+
+class CircuitBreaker:
+    """Class that stops requests to a host after repeated failures."""
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+
+    def remaining(self):
+        """Seconds until requests to the host are allowed again."""
+        if self.opened_at is None:
+            return 0
+        return max(0, self.cooldown - (monotonic() - self.opened_at))
+
+    def allow(self):
+        """True if a request to the host may be made."""
+        return self.remaining() == 0
+
+    def success(self):
+        """Register a successful response."""
+        self.failures = 0
+        self.opened_at = None
+
+    def failure(self):
+        """Register a failed request."""
+        self.failures += 1
+        if self.failures >= self.threshold:
+            self.opened_at = monotonic()
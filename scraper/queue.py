@@ -0,0 +1,162 @@
+from contextlib import contextmanager
+from sqlite3 import connect
+from time import time
+
+
+class Task:
+    """One listing page of a section, leased from a `TaskQueue`."""
+    __slots__ = ['id', 'section', 'url', 'page']
+
+    def __init__(self, id, section, url, page):
+        self.id = id
+        self.section = section
+        self.url = url
+        self.page = page
+
+
+class TaskQueue:
+    """
+    Class that shares the listing pages to be scraped between workers on
+    several machines, through an SQLite file on a shared volume.
+
+    A worker leases a batch of pending pages for `lease_seconds`, renews
+    its lease with `heartbeat` while it scrapes them and marks them as
+    done with `complete`. Pages whose lease expires, because their worker
+    stopped or lost the connection, are leased again to any worker, up
+    to `max_attempts` times; after that they are marked as failed.
+    """
+    def __init__(self, filename, lease_seconds=120, max_attempts=3):
+        """
+        Parameters
+        ----------
+        filename : str
+            SQLite file of the queue. It is created if it does not exist.
+        lease_seconds : float
+            seconds during which a leased page belongs to its worker
+            without a heartbeat.
+        max_attempts : int
+            number of times a page is leased before it is given up.
+
+        """
+        self.filename = filename
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        # transactions are started explicitly, so that a lease takes the
+        # write lock before it reads which pages are free
+        self.connection = connect(filename, timeout=60, isolation_level=None)
+        with self._transaction():
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS tasks ('
+                ' id INTEGER PRIMARY KEY, section TEXT NOT NULL, url TEXT NOT NULL,'
+                " page INTEGER NOT NULL, state TEXT NOT NULL DEFAULT 'pending',"
+                ' owner TEXT, expires REAL, attempts INTEGER NOT NULL DEFAULT 0,'
+                ' UNIQUE (url, page))')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+        return False
+
+    @contextmanager
+    def _transaction(self):
+        self.connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except BaseException:
+            self.connection.execute('ROLLBACK')
+            raise
+        self.connection.execute('COMMIT')
+
+    def _update(self, statement, owner, ids, *parameters):
+        marks = ', '.join('?' * len(ids))
+        with self._transaction():
+            cursor = self.connection.execute(
+                f"{statement} WHERE owner = ? AND state = 'leased' AND id IN ({marks})",
+                (*parameters, owner, *ids))
+        return cursor.rowcount
+
+    def add(self, section, url, num_pages):
+        """
+        Add the pages of a query of a section. Pages that are already in
+        the queue are left as they are, so a coordinator can be run again.
+
+        Returns
+        -------
+        int
+            number of pages added.
+
+        """
+        with self._transaction():
+            cursor = self.connection.executemany(
+                'INSERT OR IGNORE INTO tasks (section, url, page) VALUES (?, ?, ?)',
+                [(section, url, page) for page in range(1, num_pages + 1)])
+        return cursor.rowcount
+
+    def lease(self, owner, limit):
+        """
+        Lease up to `limit` pages to the worker `owner`, oldest first.
+
+        Returns
+        -------
+        list of Task
+            leased pages. Empty if no page is free at the moment.
+
+        """
+        now = time()
+        with self._transaction():
+            self.connection.execute(
+                "UPDATE tasks SET state = 'failed', owner = NULL"
+                " WHERE state = 'leased' AND expires < ? AND attempts >= ?",
+                (now, self.max_attempts))
+            rows = self.connection.execute(
+                "SELECT id, section, url, page FROM tasks WHERE state = 'pending'"
+                " OR state = 'leased' AND expires < ? ORDER BY id LIMIT ?",
+                (now, limit)).fetchall()
+            self.connection.executemany(
+                "UPDATE tasks SET state = 'leased', owner = ?, expires = ?,"
+                ' attempts = attempts + 1 WHERE id = ?',
+                [(owner, now + self.lease_seconds, row[0]) for row in rows])
+        return [Task(*row) for row in rows]
+
+    def heartbeat(self, owner, ids):
+        """Renew the lease of the pages `ids` that `owner` still holds."""
+        return self._update('UPDATE tasks SET expires = ?', owner, ids,
+                            time() + self.lease_seconds)
+
+    def complete(self, owner, ids):
+        """
+        Mark the pages `ids` as done. Pages whose lease `owner` has lost
+        are left to their new worker.
+
+        Returns
+        -------
+        int
+            number of pages marked as done.
+
+        """
+        return self._update("UPDATE tasks SET state = 'done', owner = NULL", owner, ids)
+
+    def release(self, owner, ids):
+        """
+        Give the pages `ids` back to the queue, to be leased again, or
+        mark them as failed if they have been leased `max_attempts` times.
+        """
+        return self._update("UPDATE tasks SET owner = NULL, state = CASE WHEN"
+                            " attempts >= ? THEN 'failed' ELSE 'pending' END",
+                            owner, ids, self.max_attempts)
+
+    def progress(self):
+        """Return the number of pages in every state."""
+        rows = self.connection.execute('SELECT state, COUNT(*) FROM tasks GROUP BY state')
+        return dict(rows.fetchall())
+
+    @property
+    def finished(self):
+        """True when no page is pending or leased."""
+        progress = self.progress()
+        return not progress.get('pending') and not progress.get('leased')
+
+    def close(self):
+        self.connection.close()
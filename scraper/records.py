@@ -0,0 +1,77 @@
+from numpy import nan
+from pandas import DataFrame, Series
+
+from util.schema import COLUMN_NAMES, RAW_COLUMNS
+
+
+RECORD_COLUMNS = COLUMN_NAMES + RAW_COLUMNS
+
+
+class Announcement:
+    """Lightweight record holding the information of one OLX announcement."""
+    __slots__ = RECORD_COLUMNS
+
+    def __init__(self, link):
+        for name in RECORD_COLUMNS:
+            setattr(self, name, nan)
+        self.link = link
+        self.listing_only = False
+
+    @classmethod
+    def from_row(cls, row):
+        """Create a record from a row of a previously scraped DataFrame."""
+        record = cls(row['link'])
+        for name in RECORD_COLUMNS:
+            if name in row:
+                setattr(record, name, row[name])
+        return record
+
+    def values(self):
+        """Return the fields of the record in the order of `RECORD_COLUMNS`."""
+        return [getattr(self, name) for name in RECORD_COLUMNS]
+
+
+class ListingCard:
+    """Summary of an announcement shown on a listing page of a section."""
+    __slots__ = ['link', 'price', 'currency', 'date', 'title', 'district']
+
+    def __init__(self, link, price=None, currency=None, date=None, title=None, district=None):
+        self.link = link
+        self.price = price
+        self.currency = currency
+        self.date = date
+        self.title = title
+        self.district = district
+
+
+def listing_only(df):
+    """
+    Return a boolean Series that is True for the rows of `df` that were
+    taken from listing cards only, as marked by their `listing_only`
+    column. Rows saved before the column was kept are full rows.
+    """
+    if 'listing_only' not in df:
+        return Series(False, index=df.index)
+    return df['listing_only'].fillna(False).astype(bool)
+
+
+def records_to_frame(records):
+    """
+    Build a DataFrame out of announcement records in a single step.
+
+    Parameters
+    ----------
+    records : list of Announcement
+        records gathered from the announcements of a section.
+
+    Returns
+    -------
+    pandas DataFrame
+        one row per record, with columns in the order of `RECORD_COLUMNS`.
+
+    """
+    if not records:
+        return DataFrame(columns=RECORD_COLUMNS)
+
+    columns = zip(*[record.values() for record in records])
+    return DataFrame(dict(zip(RECORD_COLUMNS, map(list, columns))), columns=RECORD_COLUMNS)
@@ -0,0 +1,55 @@
+from asyncio import Queue, gather
+
+
+class Section:
+    """
+    Parameters of one OLX section, the number of ads it contains and the
+    price ranges it is scraped in, once they are planned.
+    """
+    __slots__ = ['commission', 'furnished', 'home_type', 'district_code',
+                 'name', 'filename', 'url', 'number_ads', 'ranges']
+
+    def __init__(self, commission, furnished, home_type, district_code, name, filename, url):
+        self.commission = commission
+        self.furnished = furnished
+        self.home_type = home_type
+        self.district_code = district_code
+        self.name = name
+        self.filename = filename
+        self.url = url
+        self.number_ads = None
+        self.ranges = None
+
+
+async def schedule_sections(sections, scrape, workers):
+    """
+    Scrape independent sections with a bounded number of workers.
+
+    Sections are started from the largest to the smallest number of ads,
+    so that the longest sections do not end up running alone at the end.
+    Sections whose number of ads is unknown are started last.
+
+    Parameters
+    ----------
+    sections : list of Section
+        sections to be scraped.
+    scrape : coroutine function
+        called with a Section to scrape and save it.
+    workers : int
+        maximum number of sections scraped at the same time.
+
+    Returns
+    -------
+    None.
+
+    """
+    queue = Queue()
+    for section in sorted(sections, key=lambda section: section.number_ads or -1,
+                          reverse=True):
+        queue.put_nowait(section)
+
+    async def worker():
+        while not queue.empty():
+            await scrape(queue.get_nowait())
+
+    await gather(*[worker() for _ in range(min(workers, len(sections)))])
@@ -1,18 +1,116 @@
+from asyncio import run, create_task, gather, get_running_loop, sleep
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
 from datetime import date, timedelta
-from re import compile, sub, findall
-from pandas import DataFrame
-from numpy import nan
-from scrapy import Selector
-from requests import get
-from math import ceil
-from os import path, chdir, mkdir
-
-from util import log
+from os import path, chdir, getpid, mkdir
+from socket import gethostname
+from time import time_ns
+
+from numpy import isnan
+from pandas import Series, concat, read_pickle
+
+from util import log, metrics
+from util.files import atomic_write
+from util.jobs import JobCancelled
+from util.fx import FX_RATES_FILENAME, FxRates
+from util.schema import compact
+from util.storage import iso_date, partition_file, read_partition, write_partition
+from .fetcher import AsyncFetcher, FetchError, RequestBudgetExceeded
+from .policy import RequestPolicy
+from .cache import ResponseCache
+from .records import listing_only, records_to_frame
+from .derive import derive_columns
+from .parser import (listing_record, parse_announcement, parse_fx_rate, parse_listing,
+                     parse_number_ads)
+from .index import AdIndex, ad_key
+from .journal import SectionJournal
+from .planner import plan_ranges
+from .queue import TaskQueue
+from .scheduler import Section, schedule_sections
+
+
+# `home_type` as shown on announcement pages, by the home type of a section
+HOME_TYPES = {'novostroyki': 'Новостройки', 'vtorichnyy-rynok': 'Вторичный рынок'}
 
 
 class ScraperOLX:
-    """Class that scrapes the prices of all apartments in Tashkent."""
-    def __init__(self):
+    """
+    Class that scrapes the prices of all apartments in Tashkent.
+
+    Parameters
+    ----------
+    concurrency : int
+        maximum number of simultaneous connections to www.olx.uz.
+    section_workers : int
+        maximum number of sections scraped at the same time.
+    request_budget : int or None
+        maximum number of requests made by one call of `scrape_everything`.
+        Sections that are not finished within the budget are not saved
+        and will be scraped on the next call. If None, there is no limit.
+    use_cache : bool
+        if True, fetched pages are kept in the `cache` folder and reused
+        while they are fresh.
+    cache_ttls : dict or None
+        seconds during which cached `section`, `listing` and `ad` pages
+        are used without asking the server. Refer to `DEFAULT_TTLS`.
+    replay_cache : bool
+        if True, cached pages are used regardless of their age, e.g. to
+        scrape a run again offline, and no request is made: pages missing
+        from the cache fail.
+    incremental : bool
+        if True, announcements whose listing price has not changed since
+        a previous run are taken from `Database/ad-index.pkl` instead of
+        being fetched again. The index is built from the merged pickle
+        files of the `Database` folder when it does not exist yet.
+    policy : RequestPolicy or None
+        timeouts, retries and circuit breaker settings of all requests.
+        If None, the defaults of `RequestPolicy` are used.
+    parser_backend : str
+        `lxml` to parse pages with precompiled XPath expressions, or
+        `scrapy` to parse them with a Scrapy Selector.
+    olx_url : str
+        address of OLX. Useful to scrape a local copy of the site.
+    fx_rate_url : str
+        address of the page of www.cbu.uz that shows the exchange rate.
+        It is requested only when announcements are scraped, through the
+        fetcher and the cache like the pages of OLX. The rate is kept in
+        `Database/fx-rates.pkl`, and when the page cannot be fetched, the
+        latest rate kept there is used.
+    parse_workers : int
+        number of worker processes that parse announcement pages while
+        other pages are being fetched. If 0, pages are parsed in the main
+        process. Scripts that use worker processes must guard their entry
+        point with `if __name__ == '__main__':`.
+    storage : str
+        `pickle` to save every section as a pickle file, or `parquet` to
+        save it as a partition of the Parquet dataset in
+        `temporary_files/dataset`. Parquet needs pyarrow.
+    progress : callable or None
+        called with the number of sections done, the number of sections,
+        the number of announcements scraped and the number of
+        announcements left to scrape when the scrape started, whenever a
+        page or a section is finished. It is called from the thread that
+        runs `scrape_everything`.
+    shallow : bool
+        if True, announcements are not fetched one by one: their link,
+        title, price, currency, district and date are taken from the
+        listing cards, and their home type, furnishing and commission from
+        the filters of the section, which takes about 39 times fewer
+        requests. Announcements that are unchanged in the ad index are
+        still carried forward with all of their details, and `deep_fill`
+        fetches the pages of the others later.
+    control : JobControl or None
+        pauses and cancels the scrape before every request. Sections that
+        are cancelled are not saved, and their journals are kept to be
+        resumed on the next call from the first unfinished page.
+
+    """
+    def __init__(self, concurrency=8, section_workers=4, request_budget=None,
+                 use_cache=True, cache_ttls=None, replay_cache=False, incremental=True,
+                 policy=None,
+                 parser_backend='lxml', olx_url='https://www.olx.uz',
+                 fx_rate_url='https://cbu.uz/oz/', parse_workers=0, storage='pickle',
+                 shallow=False, progress=None, control=None):
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:66.0) Gecko/20100101 Firefox/66.0',
             'Accept-Encoding': '*',
@@ -22,292 +120,96 @@ class ScraperOLX:
         yesterday = today - timedelta(days=1)
         self.today = today.strftime('%d-%m-%Y')
         self.yesterday = yesterday.strftime('%d-%m-%Y')
-
-        # getting the exchange rate from www.cbu.uz
-        fx_rate_url = 'https://cbu.uz/oz/'
-        fx_rate_html = get(fx_rate_url, headers=self.headers).content
-        fx_rate_selector = Selector(text=fx_rate_html)
-        fx_rate_xpath = '//div[@class="exchange__content"]//div[@class="exchange__item_value"]'
-        fx_rates = fx_rate_selector.xpath(fx_rate_xpath)
-        fx_rates = fx_rates.xpath('./text()').extract()
-        self.usd_to_uzs = float(fx_rates[0].replace(' = ', ''))
+        self.concurrency = concurrency
+        self.section_workers = section_workers
+        self.request_budget = request_budget
+        self.use_cache = use_cache
+        self.cache_ttls = cache_ttls
+        self.replay_cache = replay_cache
+        self.incremental = incremental
+        self.policy = policy or RequestPolicy()
+        self.ad_index = None
+        self.parser_backend = parser_backend
+        self.olx_url = olx_url
+        self.parse_workers = parse_workers
+        if storage not in ('pickle', 'parquet'):
+            raise ValueError(f'Unknown storage {storage}. Use pickle or parquet.')
+        self.storage = storage
+        self.shallow = shallow
+        self.fetcher = None
+        self.parser_pool = None
+        # links being fetched, so that an ad shown by two price ranges is fetched once
+        self.pending_links = set()
+        self.fx_rate_url = fx_rate_url
+        # price of one US dollar in sums, set by `_load_usd_to_uzs`
+        self.usd_to_uzs = None
+        self.fx_rates = None
+        self.progress = progress
+        self.control = control
+        self.sections_done = self.sections_total = self.ads_done = self.ads_total = 0
         self.district_dict = {
             20: 'Olmazor', 18: 'Bektemir', 13: 'Mirobod', 12: 'Mirzo-Ulugbek',
             19: 'Sergeli', 21: 'Uchtepa', 23: 'Chilonzor', 24: 'Shayhontohur',
             25: 'Yunusobod', 26: 'Yakkasaroy', 22: 'Yashnobod'
         }
-        self.month_dict = {
-            ' г.': '', ' января ': '-01-', ' февраля ': '-02-', ' марта ': '-03-',
-            ' апреля ': '-04-', ' мая ': '-05-', ' июня ': '-06-',
-            ' июля ': '-07-', ' августа ': '-08-', ' сентября ': '-09-',
-            ' октября ': '-10-', ' ноября ': '-11-', ' декабря ': '-12-',
-            compile('^Сегодня.*'): self.today, compile('^Вчера.*'): self.yesterday
-        }
 
-    def scrape_announcement(self, dataframe, url):
+    @property
+    def cancelled(self):
+        """True if the running scrape has been cancelled through `control`."""
+        return self.control is not None and self.control.cancelled
+
+    def _report_progress(self):
+        if self.progress is not None:
+            self.progress(self.sections_done, self.sections_total,
+                          self.ads_done, self.ads_total)
+
+    async def scrape_announcement(self, url):
         """
         Scrape an individual OLX announcement given its url.
 
-        Adds a row to the end the dataframe that is passed as an argument. That
-        row will contain information gathered from the announcement.
-
         Parameters
         ----------
-        dataframe : pandas DataFrame
-            Dataframe whose rows contain information gathered from the
-            current and previous announcements.
         url : str
             url of the OLX announcement to be scraped.
 
         Returns
         -------
-        None.
+        Announcement
+            record containing information gathered from the announcement.
 
         """
-        html = get(url, headers=self.headers).content
-        html_selector = Selector(text=html)
-        row = dataframe.shape[0]
-        dataframe.at[row, 'link'] = url
-
-        try:
-            district_list = html_selector.xpath('//*[@id="root"]//a/text()').extract()
-            district_pattern = compile(r'Продажа - (.*) район')
-            district = list(filter(district_pattern.match, district_list))[0]
-            district = sub(district_pattern, r'\1', district)
-            dataframe.at[row, 'district'] = district
-        except:
-            pass
-
-        try:
-            date_xpath = '//*[@id="root"]/div[1]/div[3]/div[2]/div[1]/div[2]/div[1]/span/span'
-            announcement_date = html_selector.xpath(date_xpath)
-            announcement_date = announcement_date.xpath('.//text()').extract_first()
-            dataframe.at[row, 'date'] = announcement_date
-        except:
-            pass
-
-        try:
-            price_list = html_selector.xpath(
-                '//*[@id="root"]/div[1]/div[3]/div[2]/div[1]/div[2]/div[3]/h3')
-            price_list = price_list.xpath('.//text()').extract()
-            price = float(price_list[0].replace(' ', ''))
-            if price_list[-1] == 'сум':
-                price = price / self.usd_to_uzs
-            elif price_list[-1] != 'у.е.':
-                price = nan
-            dataframe.at[row, 'price'] = price
-        except:
-            pass
-
-        # Other details
-        try:
-            other_details = html_selector.xpath('//*[@id="root"]/div[1]/div[3]/div[2]/div[1]/div[2]/ul/li/p')
-            other_details = other_details.xpath('.//text()').extract()
-        except:
-            other_details = ''
-
-        try:
-            home_type_pattern = compile(r'Тип жилья: (.*)')
-            home_type = list(filter(home_type_pattern.match, other_details))[0]
-            home_type = sub(home_type_pattern, r'\1', home_type)
-            dataframe.at[row, 'home_type'] = home_type
-        except:
-            pass
-
-        try:
-            rooms_pattern = compile(r'Количество комнат: (\d+).*')
-            rooms = list(filter(rooms_pattern.match, other_details))[0]
-            rooms = sub(rooms_pattern, r'\1', rooms)
-            rooms = int(rooms)
-            dataframe.at[row, 'num_rooms'] = rooms
-        except:
-            pass
-
-        try:
-            area_pattern = compile(r'Общая площадь: (\d+).*')
-            area = list(filter(area_pattern.match, other_details))[0]
-            area = sub(area_pattern, r'\1', area)
-            area = int(area)
-            dataframe.at[row, 'area'] = area
-        except:
-            pass
-
-        try:
-            dataframe.at[row, 'price_m2'] = dataframe.at[row, 'price'] / dataframe.at[row, 'area']
-        except:
-            pass
-
-        try:
-            floor_pattern = compile(r'Этаж: (\d+).*')
-            floor = list(filter(floor_pattern.match, other_details))[0]
-            floor = sub(floor_pattern, r'\1', floor)
-            floor = int(floor)
-            dataframe.at[row, 'apart_floor'] = floor
-        except:
-            pass
-
-        try:
-            home_floor_pattern = compile(r'Этажность дома: (\d+).*')
-            home_floor = list(filter(home_floor_pattern.match, other_details))[0]
-            home_floor = sub(home_floor_pattern, r'\1', home_floor)
-            home_floor = int(home_floor)
-            dataframe.at[row, 'home_floor'] = home_floor
-        except:
-            pass
-
-        try:
-            building_type_pattern = compile(r'Тип строения: (.*)')
-            building_type = list(filter(building_type_pattern.match, other_details))[0]
-            building_type = sub(building_type_pattern, r'\1', building_type)
-            dataframe.at[row, 'build_type'] = building_type
-        except:
-            pass
-
-        try:
-            plan_pattern = compile(r'Планировка: (.*)')
-            plan = list(filter(plan_pattern.match, other_details))[0]
-            plan = sub(plan_pattern, r'\1', plan)
-            dataframe.at[row, 'build_plan'] = plan
-        except:
-            pass
-
-        try:
-            year_pattern = compile(r'Год постройки.*(\d{4})')
-            year = list(filter(year_pattern.match, other_details))[0]
-            year = sub(year_pattern, r'\1', year)
-            year = int(year)
-            dataframe.at[row, 'build_year'] = year
-        except:
-            pass
-
-        try:
-            bath_type_pattern = compile(r'Санузел: (.*)')
-            bath_type = list(filter(bath_type_pattern.match, other_details))[0]
-            bath_type = sub(bath_type_pattern, r'\1', bath_type)
-            dataframe.at[row, 'bathroom'] = bath_type
-        except:
-            pass
-
-        try:
-            furnished_pattern = compile(r'Меблирована: (.*)')
-            furnished = list(filter(furnished_pattern.match, other_details))[0]
-            furnished = sub(furnished_pattern, r'\1', furnished)
-            dataframe.at[row, 'furnished'] = {'Да': True, 'Нет': False}.get(furnished)
-        except:
-            pass
-
-        try:
-            height_pattern = compile(r'Высота потолков: (.*)')
-            height = list(filter(height_pattern.match, other_details))[0]
-            height = sub(height_pattern, r'\1', height)
-            height = float(height)
-            if height > 150:
-                height /= 100
-            elif height >= 20:
-                height /= 10
-
-            dataframe.at[row, 'ceil_height'] = height
-        except:
-            pass
-
-        try:
-            condition_pattern = compile(r'Ремонт: (.*)')
-            condition = list(filter(condition_pattern.match, other_details))[0]
-            condition = sub(condition_pattern, r'\1', condition)
-            dataframe.at[row, 'condition'] = condition
-        except:
-            pass
-
-        try:
-            commission_pattern = compile(r'Комиссионные: (.*)')
-            commission = list(filter(commission_pattern.match, other_details))[0]
-            commission = sub(commission_pattern, r'\1', commission)
-            dataframe.at[row, 'commission'] = {'Да': True, 'Нет': False}.get(commission)
-        except:
-            pass
-
-        # Title and text parts
-        try:
-            title = html_selector.xpath('//*[@id="root"]/div[1]/div[3]/div[2]/div[1]/div[2]/div[2]/h1')
-            title = title.xpath('.//text()').extract_first()
-            dataframe.at[row, 'title_text'] = title
-        except:
-            pass
-
-        try:
-            content = html_selector.xpath('//*[@id="root"]/div[1]/div[3]/div[2]/div[1]/div[2]/div[8]/div')
-            content = content.xpath('.//text()').extract()
-            if len(content) > 3:
-                content = content[:3]
-
-            content = '. '.join(content)
-            content = content.replace('\n', '')
-            dataframe.at[row, 'post_text'] = content
-        except:
-            pass
-
-        # Extra Details
-        try:
-            close_things_pattern = compile(r'Рядом есть:')
-            close_things = list(filter(close_things_pattern.match, other_details))[0]
-        except:
-            close_things = ''
-
-        if 'Больница' in close_things:
-            dataframe.at[row, 'hospital'] = True
-        else:
-            dataframe.at[row, 'hospital'] = False
-
-        if 'Детская площадка' in close_things:
-            dataframe.at[row, 'playground'] = True
-        else:
-            dataframe.at[row, 'playground'] = False
-
-        if 'Детский сад' in close_things:
-            dataframe.at[row, 'kindergarten'] = True
-        else:
-            dataframe.at[row, 'kindergarten'] = False
-
-        if 'Парк' in close_things:
-            dataframe.at[row, 'park'] = True
-        else:
-            dataframe.at[row, 'park'] = False
-
-        if 'Развлекательные заведения' in close_things:
-            dataframe.at[row, 'recreation'] = True
-        else:
-            dataframe.at[row, 'recreation'] = False
-
-        if 'Рестораны' in close_things:
-            dataframe.at[row, 'restaurant'] = True
-        else:
-            dataframe.at[row, 'restaurant'] = False
-
-        if 'Школа' in close_things:
-            dataframe.at[row, 'school'] = True
-        else:
-            dataframe.at[row, 'school'] = False
-
-        if 'Супермаркет' in close_things:
-            dataframe.at[row, 'supermarket'] = True
-        else:
-            dataframe.at[row, 'supermarket'] = False
-
-    def scrape_page(self, df, section_url, page):
+        if self.control is not None:
+            await self.control.checkpoint()
+        with metrics.timer('fetch'):
+            html = await self.fetcher.get(url, 'ad')
+        with metrics.timer('parse'):
+            if self.parser_pool is None:
+                return parse_announcement(html, url, self.parser_backend)
+
+            return await get_running_loop().run_in_executor(
+                self.parser_pool, parse_announcement, html, url, self.parser_backend)
+
+    async def scrape_page(self, records, section_url, page):
         """
         Scrape an OLX page that usually contains 39 individual announcements.
         If the page is the last page of the section, it may contain fewer than
         39 announcements.
 
-        Modifies the dataframe that is passed as an argument.
+        Nothing is fetched while the scrape is paused, and a page of a
+        cancelled scrape is left unfinished. Announcements of the page are
+        fetched concurrently. Announcements
+        that have not changed since they were added to the ad index are
+        taken from the index instead, and announcements that are already in
+        the journal or are being fetched for another page are skipped. The
+        page is marked as completed in the journal when all of its
+        announcements are scraped.
 
         Parameters
         ----------
-        df : pandas DataFrame
-            Dataframe whose rows will contain information gathered from
-            individual announcements.
+        records : SectionJournal
+            journal to which records of individual announcements are appended.
         section_url : str
-            url of the OLX section to be scraped.
+            url of the OLX section, or of one of its price ranges, to be scraped.
         page : int
             The page number of the section to be scraped. This number is
             shown at the bottom of a web-page when necessary filters are
@@ -315,33 +217,96 @@ class ScraperOLX:
 
         Returns
         -------
-        None.
+        list of str
+            urls of the announcements that could not be fetched but may be
+            fetched later.
 
         """
-        page_url = section_url + f'&page={page}'
-        html = get(page_url, headers=self.headers).content
-        html_selector = Selector(text=html)
-        ad_links_xpath = '//*[@id="offers_table"]//a[@class="marginright5 link linkWithHash detailsLink"]'
-        ad_links = html_selector.xpath(ad_links_xpath)
-        ad_links = ad_links.xpath('./@href').extract()
-        for advertisement in ad_links:
-            try:
-                self.scrape_announcement(df, advertisement)
-            except Exception as error:
-                log('error', f'{advertisement} could not be analyzed.')
-                log('error', f'{error}')
+        if self.control is not None:
+            await self.control.checkpoint()
 
-    def scrape_section(self, df, commission, furnished, home_type, district_code):
+        page_url = section_url + f'&page={page}'
+        with metrics.timer('fetch'):
+            html = await self.fetcher.get(page_url, 'listing')
+        with metrics.timer('parse'):
+            cards = parse_listing(html, self.parser_backend)
+        ad_links = []
+        for card in cards:
+            if self.ad_index is not None:
+                self.ad_index.observe(card)
+            if card.link in records.links or card.link in self.pending_links:
+                continue
+            if self.ad_index is not None:
+                record = self.ad_index.carry_forward(card)
+                if record is not None:
+                    records.append(record)
+                    self.ads_done += 1
+                    metrics.count('ads_carried')
+                    continue
+            if self.shallow:
+                records.append(listing_record(card))
+                self.ads_done += 1
+                metrics.count('ads_listed')
+                continue
+            ad_links.append(card.link)
+
+        failed_links = await self.scrape_announcements(records, ad_links)
+        if not failed_links and not self.cancelled:
+            records.complete_page(page_url)
+        self._report_progress()
+        return failed_links
+
+    async def scrape_announcements(self, records, ad_links):
         """
-        Scrape all announcements of an OLX section with the given parameters.
+        Scrape OLX announcements concurrently.
 
-        Modifies the dataframe that is passed as an argument.
+        Modifies the journal that is passed as an argument.
+
+        Parameters
+        ----------
+        records : SectionJournal
+            journal to which records of individual announcements are appended.
+        ad_links : list of str
+            urls of the announcements to be scraped.
+
+        Returns
+        -------
+        list of str
+            urls of the announcements that could not be fetched but may be
+            fetched later.
+
+        """
+        ad_links = [link for link in dict.fromkeys(ad_links) if link not in self.pending_links]
+        self.pending_links.update(ad_links)
+        try:
+            results = await gather(*[self.scrape_announcement(advertisement)
+                                     for advertisement in ad_links],
+                                   return_exceptions=True)
+        finally:
+            self.pending_links.difference_update(ad_links)
+        failed_links = []
+        num_scraped = 0
+        for advertisement, result in zip(ad_links, results):
+            if isinstance(result, JobCancelled):
+                continue
+            if isinstance(result, Exception):
+                log('error', f'{advertisement} could not be analyzed.')
+                log('error', f'{result}')
+                if isinstance(result, FetchError) and result.retryable:
+                    failed_links.append(advertisement)
+            else:
+                records.append(result)
+                num_scraped += 1
+        self.ads_done += num_scraped
+        metrics.count('ads_scraped', num_scraped)
+        return failed_links
+
+    def make_section(self, commission, furnished, home_type, district_code):
+        """
+        Describe the OLX section with the given parameters.
 
         Parameters
         ----------
-        df : pandas DataFrame
-            Dataframe whose rows will contain information gathered from
-            individual announcements.
         commission : str
             `yes` or `no` depending on if a broker commission is paid upon purchase.
         furnished : str
@@ -354,28 +319,115 @@ class ScraperOLX:
 
         Returns
         -------
-        None.
+        Section
+            section with its url and the name of its pickle or Parquet file.
 
         """
-        section_url = f'https://www.olx.uz/nedvizhimost/kvartiry/prodazha/{home_type}'\
+        section_url = f'{self.olx_url}/nedvizhimost/kvartiry/prodazha/{home_type}'\
             f'/tashkent/?search%5Bfilter_enum_furnished%5D%5B0%5D={furnished}&search'\
             f'%5Bfilter_enum_comission%5D%5B0%5D={commission}&search%5B'\
             f'district_id%5D={district_code}'
-        html = get(section_url, headers=self.headers).content
-        html_selector = Selector(text=html)
-        num_ads_xpath = '//*[@id="offers_table"]//div[@class="dontHasPromoted section clr rel"]/h2'
-        number_ads = html_selector.xpath(num_ads_xpath)
-        number_ads = number_ads.xpath('.//text()').extract_first()
-        number_ads = findall(r'[0-9]+\s?[0-9]*', number_ads)
-        number_ads = number_ads[0].replace(' ', '')
-        number_ads = int(number_ads)
-        num_pages = ceil(number_ads / 39)
-        num_pages = min(num_pages, 25)  # OLX shows only 25 pages per section
-        for page in range(1, num_pages + 1):
-            try:
-                self.scrape_page(df, section_url, page)
-            except Exception as error:
-                log('error', f'{error}')
+        name = f'{self.today}-{commission}-{furnished}-{home_type}-'\
+            f'{self.district_dict[district_code]}'
+        if self.storage == 'parquet':
+            filename = partition_file('.', self.today, commission, furnished, home_type,
+                                      self.district_dict[district_code])
+        else:
+            filename = name + '.pkl'
+        return Section(commission, furnished, home_type, district_code, name,
+                       filename, section_url)
+
+    async def count_ads(self, section):
+        """
+        Find the number of announcements in an OLX section.
+
+        Sets `number_ads` of the section that is passed as an argument.
+
+        Parameters
+        ----------
+        section : Section
+            section whose announcements are counted.
+
+        Returns
+        -------
+        int
+            number of announcements in the section.
+
+        """
+        section.number_ads = await self.count_url(section.url)
+        return section.number_ads
+
+    async def count_url(self, url):
+        """Return the number of announcements shown by an OLX query."""
+        with metrics.timer('fetch'):
+            html = await self.fetcher.get(url, 'section')
+        return parse_number_ads(html, self.parser_backend)
+
+    async def scrape_section(self, records, section):
+        """
+        Scrape all announcements of an OLX section.
+
+        OLX shows at most 25 pages of 39 announcements for a query, so a
+        larger section is first split into price ranges that fit, as
+        planned by `plan_ranges`. Pages of all ranges are fetched
+        concurrently, and an announcement shown by two ranges is scraped
+        once. Pages that are
+        already completed in the journal are skipped. Pages and
+        announcements that could not be fetched are tried again at the end
+        of the section, up to `requeue_passes` times of the request policy.
+        Modifies the journal that is passed as an argument.
+
+        Parameters
+        ----------
+        records : SectionJournal
+            journal to which records of individual announcements are appended.
+        section : Section
+            section to be scraped. If its number of announcements is not
+            known yet, it is counted first. Its price ranges are planned
+            if they are not planned yet.
+
+        Returns
+        -------
+        None.
+
+        """
+        if section.number_ads is None:
+            await self.count_ads(section)
+
+        if section.ranges is None:
+            section.ranges = await plan_ranges(section, self.count_url)
+
+        failed_pages = [(price_range.url, page) for price_range in section.ranges
+                        for page in range(1, price_range.num_pages + 1)
+                        if price_range.url + f'&page={page}' not in records.completed_pages]
+        failed_links = []
+        for attempt in range(self.policy.requeue_passes + 1):
+            if attempt > 0:
+                if not failed_pages and not failed_links or self.fetcher.budget_exhausted\
+                        or self.cancelled:
+                    break
+                log('info', f'Trying {len(failed_pages)} pages and {len(failed_links)}'
+                            f' announcements of {section.filename} again.')
+                await sleep(self.fetcher.cooldown_remaining())
+                failed_links = await self.scrape_announcements(records, failed_links)
+
+            pages, failed_pages = failed_pages, []
+            results = await gather(*[self.scrape_page(records, url, page)
+                                     for url, page in pages],
+                                   return_exceptions=True)
+            for page, result in zip(pages, results):
+                if isinstance(result, JobCancelled):
+                    continue
+                if isinstance(result, Exception):
+                    log('error', f'{result}')
+                    if isinstance(result, FetchError) and result.retryable:
+                        failed_pages.append(page)
+                else:
+                    failed_links.extend(result)
+
+        if failed_pages or failed_links:
+            log('warn', f'{len(failed_pages)} pages and {len(failed_links)} announcements'
+                        f' of {section.filename} are missing.')
 
     def scrape_everything(self):
         """
@@ -384,48 +436,514 @@ class ScraperOLX:
 
         Creates a `temporary_files` folder if it does not exist. There,
         scraped information will be saved as 88 pickle files of the form
-        `date-commission_type-furnished_type-home_type-district.pkl`.
+        `date-commission_type-furnished_type-home_type-district.pkl`, or
+        as 88 partitions of the `dataset` folder if `storage` is `parquet`.
+        Sections whose file already exists are skipped. Fetched pages
+        are cached in the `cache` folder unless `use_cache` is False. If
+        `incremental` is True, the ad index in the `Database` folder is
+        used and updated.
 
         Returns
         -------
         None.
 
         """
+        cache = self._open_cache()
+        self._open_index()
+        self._open_fx_rates()
         if not path.isdir('temporary_files'):
             mkdir('temporary_files')
 
         chdir('temporary_files')
-        column_names = ['link', 'date', 'price', 'home_type', 'district', 'price_m2',
-                        'furnished', 'commission', 'num_rooms', 'area', 'apart_floor',
-                        'home_floor', 'condition', 'build_type', 'build_plan',
-                        'build_year', 'bathroom', 'ceil_height', 'hospital',
-                        'playground', 'kindergarten', 'park', 'recreation', 'school',
-                        'restaurant', 'supermarket', 'title_text', 'post_text']
+        try:
+            run(self._scrape_everything(cache))
+        finally:
+            chdir('..')
+            self._close_index(save=True)
+
+        self._report_cache(cache)
+        metrics.report('scrape')
+
+    def _open_cache(self):
+        """Return the cache of fetched pages, or None if `use_cache` is False."""
+        if self.use_cache:
+            return ResponseCache(path.abspath('cache'), self.cache_ttls,
+                                 replay=self.replay_cache)
+        return None
+
+    def _report_cache(self, cache):
+        if cache is not None:
+            log('info', f'Cache: {cache.hits} hits, {cache.revalidated} revalidated,'
+                        f' {cache.misses} misses.')
+            metrics.count('cache_hits', cache.hits)
+            metrics.count('cache_revalidated', cache.revalidated)
+            metrics.count('cache_misses', cache.misses)
+
+    def _open_index(self):
+        """Load or build the ad index if `incremental` is True."""
+        if self.incremental:
+            if not path.isdir('Database'):
+                mkdir('Database')
+            index_filename = path.abspath(path.join('Database', 'ad-index.pkl'))
+            self.ad_index = AdIndex(index_filename, self.today, self.yesterday)
+            if not path.isfile(index_filename):
+                self.ad_index.build(path.abspath('Database'))
+
+    def _close_index(self, save):
+        if self.ad_index is not None:
+            if save:
+                self.ad_index.save()
+            log('info', f'{self.ad_index.carried} ads were carried forward from the ad index.')
+            self.ad_index = None
+
+    def _make_sections(self, existing=False):
+        """
+        Return the sections of the day whose file does not exist yet, or
+        those whose file exists if `existing` is True.
+        """
         commission_list = ['yes', 'no']
         furnished_list = ['yes', 'no']
         home_type_list = ['novostroyki', 'vtorichnyy-rynok']
         district_code_list = [20, 18, 13, 12, 19, 21, 23, 24, 25, 26, 22]
+        sections = []
         for commission in commission_list:
             for furnished in furnished_list:
                 for home_type in home_type_list:
                     for district_code in district_code_list:
-                        log('info', f'Analyzing commission={commission}, furnished={furnished},'
-                                    f' home_type={home_type} for {self.district_dict[district_code]}')
-                        filename_pkl = f'{self.today}-{commission}-{furnished}-{home_type}-'\
-                            f'{self.district_dict[district_code]}.pkl'
-                        if path.isfile(filename_pkl):
-                            log('info', f'{filename_pkl} already exists.')
-                            continue
-                        else:
-                            df = DataFrame(columns=column_names)
-                            try:
-                                self.scrape_section(df, commission, furnished, home_type, district_code)
-                                df.loc[:, 'date'] = df.loc[:, 'date'].replace(self.month_dict, regex=True)
-                                df.dropna(how='all', inplace=True,
-                                          subset=['price', 'num_rooms', 'area', 'apart_floor'])
-                                df.to_pickle(filename_pkl)
-                                log('success', f'Number of observations scraped: {len(df)}.')
-                            except Exception as error:
-                                log('error', f'{error}')
-                                log('error', f'{filename_pkl} could not be created.')
-        chdir('..')
+                        section = self.make_section(commission, furnished,
+                                                    home_type, district_code)
+                        if path.isfile(section.filename) == existing:
+                            sections.append(section)
+                        elif not existing:
+                            log('info', f'{section.filename} already exists.')
+        return sections
+
+    @asynccontextmanager
+    async def _session(self, cache, request_budget=None):
+        """
+        Open the pool of connections and of parser processes shared by all
+        sections, limited to `request_budget` requests, or to the budget of
+        the scraper if None.
+        """
+        self.fetcher = AsyncFetcher(self.headers, limit_per_host=self.concurrency,
+                                    max_requests=request_budget or self.request_budget,
+                                    cache=cache, policy=self.policy)
+        if self.parse_workers > 0:
+            self.parser_pool = ProcessPoolExecutor(max_workers=self.parse_workers)
+        try:
+            async with self.fetcher:
+                yield
+        finally:
+            if self.parser_pool is not None:
+                self.parser_pool.shutdown()
+                self.parser_pool = None
+
+    def _open_fx_rates(self):
+        """Load the table of exchange rates of the `Database` folder."""
+        if not path.isdir('Database'):
+            mkdir('Database')
+        self.fx_rates = FxRates(path.abspath(path.join('Database', FX_RATES_FILENAME)))
+
+    async def _load_usd_to_uzs(self):
+        """
+        Take the exchange rate from www.cbu.uz through the fetcher, so that
+        its page is retried and cached like those of OLX, or the latest
+        rate of `fx_rates` if the page cannot be fetched or read.
+        """
+        if self.usd_to_uzs is None:
+            today = iso_date(self.today)
+            try:
+                fx_rate_html = await self.fetcher.get(self.fx_rate_url, kind='fx')
+                self.usd_to_uzs = parse_fx_rate(fx_rate_html, self.parser_backend)
+            except (FetchError, RequestBudgetExceeded, IndexError, ValueError) as error:
+                latest = self.fx_rates.lookup([today])[0]
+                if isnan(latest):
+                    raise FetchError(f'The exchange rate is unknown: {error}') from error
+                log('warn', f'The exchange rate could not be fetched, the latest rate kept'
+                            f' is used instead: {error}')
+                self.usd_to_uzs = float(latest)
+            else:
+                self.fx_rates.add(today, self.usd_to_uzs)
+        log('info', f'Exchange rate: 1 USD = {self.usd_to_uzs} UZS.')
+
+    async def _count_sections(self, sections):
+        """Count the ads of all sections concurrently, logging the sections that fail."""
+        counts = await gather(*[self.count_ads(section) for section in sections],
+                              return_exceptions=True)
+        for section, error in zip(sections, counts):
+            if isinstance(error, Exception):
+                log('error', f'{section.filename}: {error}')
+
+    async def _scrape_everything(self, cache):
+        """Scrape all 88 sections sharing one pool of connections."""
+        sections = self._make_sections()
+        async with self._session(cache):
+            if sections:
+                await self._load_usd_to_uzs()
+            await self._count_sections(sections)
+            self.sections_done, self.sections_total = 0, len(sections)
+            self.ads_done = 0
+            self.ads_total = sum(section.number_ads or 0 for section in sections)
+            self._report_progress()
+            await schedule_sections(sections, self._scrape_and_save, self.section_workers)
+        if self.cancelled:
+            log('warn', f'The scrape has been cancelled after {self.sections_done}'
+                        f' of {self.sections_total} sections.')
+
+    def _build_frame(self, records, section=None):
+        """
+        Build the compact frame of scraped records, as it is saved. Rows
+        taken from listing cards get the home type, furnishing and
+        commission of `section`, if it is given.
+        """
+        with metrics.timer('record_build'):
+            df = records_to_frame(records)
+        with metrics.timer('derive'):
+            if section is not None:
+                listed = listing_only(df)
+                if listed.any():
+                    df['home_type'] = df['home_type'].where(~listed, HOME_TYPES[section.home_type])
+                    df['furnished'] = df['furnished'].where(~listed, section.furnished == 'yes')
+                    df['commission'] = df['commission'].where(~listed, section.commission == 'yes')
+            df = derive_columns(df, self.today, self.usd_to_uzs)
+            df.dropna(how='all', inplace=True,
+                      subset=['price', 'num_rooms', 'area', 'apart_floor'])
+        with metrics.timer('compact'):
+            return compact(df)
+
+    async def _scrape_and_save(self, section):
+        """
+        Scrape one section and save it as a pickle or Parquet file.
+
+        Records are journaled in a `.journal` file in `temporary_files`
+        while the section is scraped, and the journal is deleted once the
+        section is saved.
+        """
+        if self.cancelled:
+            return
+
+        log('info', f'Analyzing commission={section.commission}, furnished={section.furnished},'
+                    f' home_type={section.home_type} for {self.district_dict[section.district_code]}')
+        records = SectionJournal(section.name + '.journal')
+        # announcements replayed from the journal are not left to scrape
+        self.ads_total -= min(len(records), section.number_ads or 0)
+        try:
+            with metrics.section(section.name):
+                with metrics.timer('section'):
+                    await self.scrape_section(records, section)
+                if self.fetcher.budget_exhausted:
+                    log('warn', f'Request budget is spent, {section.filename} is not saved.')
+                    return
+                if self.cancelled:
+                    log('warn', f'The scrape is cancelled, {section.filename} is not saved.')
+                    return
+
+                df = self._build_frame(records, section)
+                if self.storage == 'parquet':
+                    with metrics.timer('to_parquet'):
+                        write_partition(df, section.filename)
+                else:
+                    with metrics.timer('to_pickle'):
+                        df.to_pickle(section.filename)
+                records.remove()
+                if self.ad_index is not None:
+                    # rows of listing cards lack the details that are carried forward
+                    self.ad_index.update(df[~listing_only(df)])
+                metrics.count('rows_saved', len(df))
+                log('success', f'Number of observations scraped: {len(df)}.')
+        except Exception as error:
+            log('error', f'{error}')
+            log('error', f'{section.filename} could not be created.')
+        finally:
+            records.close()
+            if not self.cancelled:
+                self.sections_done += 1
+                self._report_progress()
+
+    def enqueue_everything(self, queue_filename):
+        """
+        Put the listing pages of all sections into a shared task queue, to
+        be scraped by `work` on one or more machines.
+
+        Sections are counted and split into price ranges as in
+        `scrape_section`, and their pages are added from the largest to
+        the smallest section. Sections whose file already exists in
+        `temporary_files` are skipped, and pages that are already in the
+        queue are kept as they are, so the coordinator can be run again.
+
+        Parameters
+        ----------
+        queue_filename : str
+            SQLite file of the queue, on a volume shared by all workers.
+
+        Returns
+        -------
+        int
+            number of pages added to the queue.
+
+        """
+        cache = self._open_cache()
+        if not path.isdir('temporary_files'):
+            mkdir('temporary_files')
+
+        with TaskQueue(path.abspath(queue_filename)) as queue:
+            chdir('temporary_files')
+            try:
+                added = run(self._enqueue_everything(queue, cache))
+            finally:
+                chdir('..')
+            log('info', f'{added} pages have been added to {queue_filename}:'
+                        f' {queue.progress()}.')
+        self._report_cache(cache)
+        return added
+
+    async def _enqueue_everything(self, queue, cache):
+        sections = self._make_sections()
+        async with self._session(cache):
+            await self._count_sections(sections)
+            sections = [section for section in sections if section.number_ads is not None]
+            ranges = await gather(*[plan_ranges(section, self.count_url)
+                                    for section in sections])
+        for section, section_ranges in zip(sections, ranges):
+            section.ranges = section_ranges
+        added = 0
+        for section in sorted(sections, key=lambda section: section.number_ads, reverse=True):
+            for price_range in section.ranges:
+                added += queue.add(section.name, price_range.url, price_range.num_pages)
+        return added
+
+    def work(self, queue_filename, name=None, batch_size=2):
+        """
+        Scrape pages leased from a shared task queue until none is left.
+
+        Every worker saves the announcements of the pages it leases as
+        partial pickle files of the form
+        `date-commission_type-furnished_type-home_type-district-part-....pkl`
+        in `temporary_files`, which `merge_district_pickles` merges with
+        the other sections of the day. `temporary_files` must therefore be
+        on the shared volume too. The ad index, if `incremental` is True,
+        is only read, since several workers cannot write it at once.
+
+        Parameters
+        ----------
+        queue_filename : str
+            SQLite file of the queue filled by `enqueue_everything`.
+        name : str or None
+            name of the worker in the queue. If None, the host name and
+            the process id are used.
+        batch_size : int
+            number of pages leased at once. `section_workers` batches
+            are scraped at the same time.
+
+        Returns
+        -------
+        None.
+
+        """
+        name = name or f'{gethostname()}-{getpid()}'
+        cache = self._open_cache()
+        self._open_index()
+        self._open_fx_rates()
+        if not path.isdir('temporary_files'):
+            mkdir('temporary_files')
+
+        with TaskQueue(path.abspath(queue_filename)) as queue:
+            chdir('temporary_files')
+            try:
+                run(self._work(queue, name, cache, batch_size))
+            finally:
+                chdir('..')
+                self._close_index(save=False)
+            log('info', f'{name} has stopped: {queue.progress()}.')
+        self._report_cache(cache)
+        metrics.report('work')
+
+    async def _work(self, queue, name, cache, batch_size):
+        async with self._session(cache):
+            if not queue.finished:
+                await self._load_usd_to_uzs()
+            # several batches are scraped at once, so that the connections
+            # are not idle while the last pages of a batch are fetched
+            await gather(*[self._lease_batches(queue, name, batch_size)
+                           for _ in range(self.section_workers)])
+
+    async def _lease_batches(self, queue, name, batch_size):
+        """Lease and scrape batches of pages until the queue is finished."""
+        while not self.fetcher.budget_exhausted and not self.cancelled:
+            tasks = queue.lease(name, batch_size)
+            if not tasks:
+                if queue.finished:
+                    break
+                # other workers still hold pages that may be given back
+                await sleep(min(queue.lease_seconds / 4, 5))
+                continue
+
+            heartbeat = create_task(self._heartbeat(queue, name, [task.id for task in tasks]))
+            try:
+                sections = {}
+                for task in tasks:
+                    sections.setdefault(task.section, []).append(task)
+                await gather(*[self._scrape_part(queue, name, section, section_tasks)
+                               for section, section_tasks in sections.items()])
+            finally:
+                heartbeat.cancel()
+
+    @staticmethod
+    async def _heartbeat(queue, name, ids):
+        """Renew the lease of leased pages until cancelled."""
+        while True:
+            await sleep(queue.lease_seconds / 3)
+            queue.heartbeat(name, ids)
+
+    async def _scrape_part(self, queue, name, section_name, tasks):
+        """
+        Scrape leased pages of one section, save their announcements as a
+        partial pickle file and report the pages to the queue. Pages that
+        could not be scraped completely are given back to the queue.
+        """
+        # batches scraped at the same time lease different pages
+        records = SectionJournal(f'{section_name}-{name}-{tasks[0].id}.journal')
+        try:
+            with metrics.section(section_name):
+                with metrics.timer('section'):
+                    results = await gather(*[self.scrape_page(records, task.url, task.page)
+                                             for task in tasks],
+                                           return_exceptions=True)
+                done, failed = [], []
+                for task, result in zip(tasks, results):
+                    if isinstance(result, Exception) and not isinstance(result, JobCancelled):
+                        log('error', f'{result}')
+                    # pages skipped after a cancel are not completed either
+                    completed = task.url + f'&page={task.page}' in records.completed_pages
+                    (done if completed else failed).append(task.id)
+
+                if len(records):
+                    df = self._build_frame(records)
+                    # a page leased again after its lease expired is saved twice;
+                    # `merge_district_pickles` drops the second copy
+                    filename = f'{section_name}-part-{name}-{time_ns()}.pkl'
+                    with metrics.timer('to_pickle'), atomic_write(filename) as temporary:
+                        df.to_pickle(temporary)
+                    metrics.count('rows_saved', len(df))
+                queue.complete(name, done)
+                queue.release(name, failed)
+                records.remove()
+                metrics.count('pages_done', len(done))
+        except Exception as error:
+            log('error', f'{error}')
+            log('error', f'Pages of {section_name} could not be saved.')
+        finally:
+            records.close()
+
+    def deep_fill(self, request_budget=None):
+        """
+        Fetch the announcement pages of the ads that a shallow scrape took
+        from their listing cards only, and replace their rows in today's
+        section files with the full rows.
+
+        Announcements that are not in the ad index yet are fetched first,
+        then those whose price changed. At most `request_budget`
+        announcements are fetched; the others keep their rows from the
+        listing cards and are fetched by the next call. The ad index is
+        updated with the fetched rows if `incremental` is True.
+
+        Parameters
+        ----------
+        request_budget : int or None
+            maximum number of announcement pages fetched. If None, the
+            budget of the scraper is used, and without one every
+            announcement of a listing card is fetched.
+
+        Returns
+        -------
+        int
+            number of announcements whose rows have been filled.
+
+        """
+        if not path.isdir('temporary_files'):
+            return 0
+        cache = self._open_cache()
+        self._open_index()
+        self._open_fx_rates()
+
+        chdir('temporary_files')
+        try:
+            filled = run(self._deep_fill(cache, request_budget or self.request_budget))
+        finally:
+            chdir('..')
+            self._close_index(save=True)
+
+        self._report_cache(cache)
+        metrics.report('deep_fill')
+        return filled
+
+    def _read_section(self, section):
+        if self.storage == 'parquet':
+            return compact(read_partition(section.filename))
+        return read_pickle(section.filename)
+
+    def _save_section(self, df, section):
+        if self.storage == 'parquet':
+            write_partition(df, section.filename)
+        else:
+            df.to_pickle(section.filename)
+
+    async def _deep_fill(self, cache, request_budget):
+        sections = []
+        candidates = []
+        for section in self._make_sections(existing=True):
+            df = self._read_section(section)
+            links = df.loc[listing_only(df), 'link']
+            if len(links):
+                sections.append((section, df))
+                # announcements new to the index come before price changes
+                candidates.extend((self.ad_index is not None
+                                   and ad_key(link) in self.ad_index.entries,
+                                   len(sections) - 1, link) for link in links)
+        candidates.sort(key=lambda candidate: candidate[:2])
+        if request_budget is not None:
+            candidates = candidates[:request_budget]
+        log('info', f'{len(candidates)} announcements of listing cards will be fetched.')
+        if not candidates:
+            return 0
+
+        wanted = [[] for _ in sections]
+        for _, number, link in candidates:
+            wanted[number].append(link)
+        # the budget is of announcement pages, the exchange rate comes on top
+        fetcher_budget = None if request_budget is None else request_budget + 1
+        async with self._session(cache, fetcher_budget):
+            await self._load_usd_to_uzs()
+            filled = await gather(*[self._fill_section(section, df, links)
+                                    for (section, df), links in zip(sections, wanted)
+                                    if links])
+        return sum(filled)
+
+    async def _fill_section(self, section, df, links):
+        """Fetch `links` of one section and save the section with their rows replaced."""
+        records = []
+        try:
+            with metrics.section(section.name):
+                with metrics.timer('section'):
+                    await self.scrape_announcements(records, links)
+                if not records:
+                    return 0
+                filled = self._build_frame(records)
+                # the rows of the listing cards are replaced in place
+                positions = Series(df.index, index=df['link'])
+                filled.index = positions[filled['link']].to_numpy()
+                if self.ad_index is not None:
+                    # changes are detected against the prices of the cards
+                    self.ad_index.observe_listed(df.loc[filled.index])
+                df = compact(concat([df.drop(index=filled.index), filled]).sort_index())
+                self._save_section(df, section)
+                if self.ad_index is not None:
+                    self.ad_index.update(filled)
+                metrics.count('ads_filled', len(filled))
+                log('success', f'{section.filename}: {len(filled)} of {len(links)}'
+                               f' announcements have been filled.')
+                return len(filled)
+        except Exception as error:
+            log('error', f'{error}')
+            log('error', f'{section.filename} could not be filled.')
+            return 0
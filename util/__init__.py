@@ -1,6 +1,17 @@
 from colorama import init as colorama
 from .logger import log
-from .gui_helpers import *
+from .metrics import metrics
+
+
+def __getattr__(name):
+    # the GUI helpers import pandas, so they are loaded on first use
+    from importlib import import_module
+
+    gui_helpers = import_module('.gui_helpers', __name__)
+    try:
+        return getattr(gui_helpers, name)
+    except AttributeError:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}') from None
 
 
 def main():
@@ -0,0 +1,153 @@
+from .files import atomic_write
+from .storage import schema
+
+
+# rows of an Excel worksheet, the first of which is the header
+EXCEL_MAX_ROWS = 1048576
+
+
+class ExcelExporter:
+    """
+    Exporter that writes rows to an Excel file in constant memory with
+    XlsxWriter. Every row is flushed to disk as soon as the next one is
+    written, and a new worksheet is started when one is full.
+    """
+    extension = 'xlsx'
+
+    def __init__(self, filename, max_rows=EXCEL_MAX_ROWS):
+        from xlsxwriter import Workbook
+
+        self.workbook = Workbook(filename, {'constant_memory': True,
+                                            'strings_to_urls': False,
+                                            'strings_to_formulas': False,
+                                            'default_date_format': 'dd-mm-yyyy'})
+        self.header = self.workbook.add_format({'bold': True})
+        self.max_rows = max_rows
+        self.worksheet = None
+        self.row = 0
+        self.columns = None
+
+    def _add_worksheet(self):
+        self.worksheet = self.workbook.add_worksheet()
+        self.worksheet.write_row(0, 0, self.columns, self.header)
+        self.row = 1
+
+    def write(self, chunk):
+        if self.columns is None:
+            self.columns = list(chunk.columns)
+            self._add_worksheet()
+        chunk = chunk[self.columns]
+        # blank cells instead of NaN, which Excel does not accept
+        rows = chunk.astype(object).where(chunk.notna(), None)
+        for values in rows.itertuples(index=False, name=None):
+            if self.row == self.max_rows:
+                self._add_worksheet()
+            self.worksheet.write_row(self.row, 0, values)
+            self.row += 1
+
+    def close(self):
+        if self.columns is None:
+            self.workbook.add_worksheet()
+        self.workbook.close()
+
+
+class CsvExporter:
+    """Exporter that appends rows to a UTF-8 CSV file."""
+    extension = 'csv'
+
+    def __init__(self, filename, max_rows=None):
+        self.file = open(filename, 'w', encoding='utf-8', newline='')
+        self.columns = None
+
+    def write(self, chunk):
+        header = self.columns is None
+        if header:
+            self.columns = list(chunk.columns)
+        chunk[self.columns].to_csv(self.file, header=header, index=False)
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetExporter:
+    """Exporter that appends rows to a Parquet file as row groups."""
+    extension = 'parquet'
+
+    def __init__(self, filename, max_rows=None):
+        self.filename = filename
+        self.writer = None
+
+    def write(self, chunk):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if self.writer is None:
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            # a column that is empty in the first chunk, e.g. `currency` of
+            # rows scraped before it was kept, gets the type of the sections
+            known = schema()
+            for position, field in enumerate(table.schema):
+                if field.name in known.names and chunk[field.name].isna().all():
+                    table = table.set_column(position, field.name,
+                                             pa.nulls(len(table), known.field(field.name).type))
+            self.writer = pq.ParquetWriter(self.filename, table.schema, compression='zstd')
+        else:
+            # later chunks may hold a column as int where the first held floats
+            table = pa.Table.from_pandas(chunk, schema=self.writer.schema,
+                                         preserve_index=False, safe=False)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+EXPORTERS = {exporter.extension: exporter
+             for exporter in [ExcelExporter, CsvExporter, ParquetExporter]}
+
+
+def export_chunks(chunks, filename, file_format='xlsx', max_rows=EXCEL_MAX_ROWS, columns=None):
+    """
+    Write DataFrames one after another into one file, holding only one
+    of them in memory at a time.
+
+    The file is written under a temporary name first and replaces
+    `filename` only when it is complete.
+
+    Parameters
+    ----------
+    chunks : iterable of pandas DataFrame
+        rows to export.
+    filename : str
+        file to create.
+    file_format : str
+        `xlsx`, `csv` or `parquet`.
+    max_rows : int
+        rows of an Excel worksheet, including its header. When a worksheet
+        is full, the rows continue on a new worksheet.
+    columns : list of str or None
+        columns of the file. Every chunk is reindexed to them, so columns
+        a chunk lacks, e.g. of rows scraped before they were kept, are
+        left empty. If None, all chunks must have the columns of the first.
+
+    Returns
+    -------
+    int
+        number of rows written.
+
+    """
+    if file_format not in EXPORTERS:
+        raise ValueError(f'Unknown format {file_format}. Use one of {list(EXPORTERS)}.')
+
+    num_rows = 0
+    with atomic_write(filename) as temporary:
+        exporter = EXPORTERS[file_format](temporary, max_rows)
+        try:
+            for chunk in chunks:
+                if columns is not None:
+                    chunk = chunk.reindex(columns=columns)
+                exporter.write(chunk)
+                num_rows += len(chunk)
+        finally:
+            exporter.close()
+    return num_rows
@@ -0,0 +1,47 @@
+from contextlib import contextmanager
+from json import dump
+from os import listdir, path, remove, replace
+
+
+def temporary_path(filename):
+    """
+    Return the file next to `filename` that it is written to first. Its
+    name starts with a dot, so the Parquet dataset and the globs of the
+    daily files ignore it.
+    """
+    return path.join(path.dirname(filename), f'.{path.basename(filename)}.tmp')
+
+
+@contextmanager
+def atomic_write(filename):
+    """
+    Yield the temporary path to write `filename` to, and move it over
+    `filename` when the block ends, so that `filename` is always either
+    the old or the new file, never a part of one. If the block raises,
+    the temporary file is deleted and `filename` is left as it was.
+    """
+    temporary = temporary_path(filename)
+    try:
+        yield temporary
+    except BaseException:
+        if path.isfile(temporary):
+            remove(temporary)
+        raise
+    replace(temporary, filename)
+
+
+def write_json(filename, data, indent=None):
+    """Write `data` to the JSON file `filename` with `atomic_write`."""
+    with atomic_write(filename) as temporary:
+        with open(temporary, 'w', encoding='utf-8') as file:
+            dump(data, file, indent=indent)
+
+
+def remove_unrecorded(folder, recorded):
+    """
+    Delete the files of `folder` whose names are not in `recorded`, e.g.
+    those of writes that stopped before their manifest was replaced.
+    """
+    for name in listdir(folder):
+        if name not in recorded:
+            remove(path.join(folder, name))
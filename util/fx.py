@@ -0,0 +1,203 @@
+from concurrent.futures import ThreadPoolExecutor
+from os import path
+from pickle import dump, load, HIGHEST_PROTOCOL
+
+from numpy import array, isnan, isnat, nan, searchsorted, where
+from .files import atomic_write
+from .logger import log
+from .metrics import metrics
+from .storage import ad_dates
+
+
+FX_ARCHIVE_URL = 'https://cbu.uz/uz/arkhiv-kursov-valyut/json/USD/{day}/'
+FX_RATES_FILENAME = 'fx-rates.pkl'
+
+
+def ad_days(df):
+    """Return the dates of the announcements of `df` as `datetime64[D]`, NaT if unknown."""
+    return ad_dates(df['date']).to_numpy('datetime64[D]')
+
+
+class FxRates:
+    """
+    Table of the daily USD to UZS exchange rates of the Central Bank of
+    Uzbekistan, kept in a pickle file so that every day is requested from
+    www.cbu.uz only once.
+    """
+    def __init__(self, filename=FX_RATES_FILENAME, url=FX_ARCHIVE_URL, workers=8, timeout=10):
+        """
+        Parameters
+        ----------
+        filename : str
+            pickle file where the rates are kept.
+        url : str
+            address of the rate of one day in the JSON archive of www.cbu.uz,
+            with `{day}` in place of the date of the form `yyyy-mm-dd`.
+        workers : int
+            number of days requested at the same time.
+        timeout : float
+            seconds to wait for the answer of one request.
+
+        """
+        self.filename = filename
+        self.url = url
+        self.workers = workers
+        self.timeout = timeout
+        self.rates = {}
+        self.failed = set()
+        if path.isfile(filename):
+            with open(filename, 'rb') as file:
+                self.rates = load(file)
+
+    def _fetch(self, day):
+        from requests import get
+
+        try:
+            response = get(self.url.format(day=day), timeout=self.timeout)
+            response.raise_for_status()
+            return float(response.json()[0]['Rate'])
+        except Exception as error:
+            return error
+
+    def update(self, days):
+        """
+        Fetch the rates of the days that are not in the table yet and save
+        the table. Days that fail are not requested again by this object.
+
+        Parameters
+        ----------
+        days : array of datetime64[D]
+            dates of announcements. NaT values are ignored.
+
+        Returns
+        -------
+        int
+            number of rates added.
+
+        """
+        days = array(days, dtype='datetime64[D]')
+        missing = sorted({str(day) for day in days[~isnat(days)]}
+                         - set(self.rates) - self.failed)
+        if not missing:
+            return 0
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            rates = list(executor.map(self._fetch, missing))
+        errors = []
+        for day, rate in zip(missing, rates):
+            if isinstance(rate, Exception):
+                self.failed.add(day)
+                errors.append(rate)
+            else:
+                self.rates[day] = rate
+        added = len(missing) - len(errors)
+        if added:
+            self.save()
+        log('info', f'Exchange rates: {added} of {len(missing)} days fetched from www.cbu.uz.')
+        if errors:
+            log('warn', f'Exchange rates of {len(errors)} days could not be fetched: {errors[0]}')
+        return added
+
+    def add(self, day, rate):
+        """Keep `rate` as the rate of `day`, of the form `yyyy-mm-dd`, and save the table."""
+        self.rates[day] = rate
+        self.save()
+
+    def save(self):
+        with atomic_write(self.filename) as temporary:
+            with open(temporary, 'wb') as file:
+                dump(self.rates, file, protocol=HIGHEST_PROTOCOL)
+
+    def lookup(self, days):
+        """
+        Return the rate of every day, or of the latest earlier day in the
+        table when the day itself is missing, e.g. on weekends.
+
+        Parameters
+        ----------
+        days : array of datetime64[D]
+            dates of announcements.
+
+        Returns
+        -------
+        numpy array of float
+            rates, NaN where the day is NaT or earlier than the table.
+
+        """
+        days = array(days, dtype='datetime64[D]')
+        if not self.rates:
+            return array([nan] * len(days))
+        table_days = array(sorted(self.rates), dtype='datetime64[D]')
+        table_rates = array([self.rates[str(day)] for day in table_days])
+        positions = searchsorted(table_days, days, side='right') - 1
+        known = (positions >= 0) & ~isnat(days)
+        return where(known, table_rates[positions.clip(0)], nan)
+
+
+def usd_prices(df, usd_to_uzs):
+    """
+    Convert `raw_price` to USD and compute the price per square metre.
+
+    Parameters
+    ----------
+    df : pandas DataFrame
+        announcements with `raw_price`, `currency`, `price` and `area`.
+    usd_to_uzs : float or numpy array of float
+        price of one US dollar in sums, for all rows or for every row.
+
+    Returns
+    -------
+    tuple of numpy arrays of float
+        `price` and `price_m2`. Rows in another currency or without a
+        rate keep their `price`, and rows without an area have no
+        `price_m2`.
+
+    """
+    raw_price = df['raw_price'].to_numpy(dtype=float, na_value=nan)
+    currency = df['currency'].to_numpy(dtype=object)
+    usd = where(currency == 'UZS', raw_price / usd_to_uzs,
+                where(currency == 'USD', raw_price, nan))
+    price = where(isnan(usd), df['price'].to_numpy(dtype=float, na_value=nan), usd)
+    area = df['area'].to_numpy(dtype=float, na_value=nan)
+    with_area = area > 0
+    return price, where(with_area, price / where(with_area, area, 1), nan)
+
+
+def reprice(df, fx_rates):
+    """
+    Convert `raw_price` to USD with the rate of the day of every
+    announcement and recompute `price` and `price_m2`.
+
+    Rows without `raw_price`, such as those scraped before it was kept,
+    or whose day has no rate, keep their `price`.
+
+    Parameters
+    ----------
+    df : pandas DataFrame
+        scraped announcements.
+    fx_rates : FxRates
+        table of exchange rates.
+
+    Returns
+    -------
+    pandas DataFrame
+        copy of `df` with the new prices.
+
+    """
+    if 'raw_price' not in df or 'currency' not in df:
+        return df
+
+    price, price_m2 = usd_prices(df, fx_rates.lookup(ad_days(df)))
+    return df.assign(price=price, price_m2=price_m2)
+
+
+def iter_repriced(chunks, fx_rates):
+    """
+    Yield every chunk of announcements repriced by `reprice`, fetching
+    the rates of the days that are not in `fx_rates` yet first.
+    """
+    for chunk in chunks:
+        if 'currency' in chunk:
+            fx_rates.update(ad_days(chunk[chunk['currency'] == 'UZS']))
+        with metrics.timer('reprice'):
+            yield reprice(chunk, fx_rates)
@@ -1,12 +1,30 @@
-from os import path, chdir, mkdir, getcwd, listdir, rename
-from re import compile
+from os import path, chdir, mkdir, getcwd, remove, rename
 from pandas import DataFrame, concat, read_pickle
-from tkinter import messagebox
+
+from .export import export_chunks
+from .fx import FxRates, iter_repriced
+from .logger import log
+from .master import MasterTable
+from .merge import find_files, daily_files, iter_month_pickles
+from .metrics import metrics
+from .schema import COLUMN_NAMES, compact, unpack_amenities
+from .snapshots import SnapshotStore, changed_fields
+from .storage import compact_partitions, iso_date, rename_partitions, scraped_folder
+
+
+# set to False by entry points without a window, such as `cli.py`
+use_messagebox = True
+# set by a window that runs the jobs in a background thread, e.g. to
+# `JobRunner.message`, so that messages are shown by the window's thread
+message_handler = None
 
 
 def create_messagebox(text, is_error=True):
     """
-    Display a message box with the given `text`.
+    Display a message box with the given `text`, or log it when
+    `use_messagebox` is False or Tk is not available. If
+    `message_handler` is set, the message is passed to it instead and
+    the calling thread does not wait for the message box.
 
     Parameters
     ----------
@@ -21,40 +39,37 @@ def create_messagebox(text, is_error=True):
     None.
 
     """
-    if is_error:
+    if message_handler is not None:
+        message_handler(text, is_error)
+        return
+
+    messagebox = None
+    if use_messagebox:
+        try:
+            from tkinter import messagebox
+        except ImportError:
+            pass
+    if messagebox is None:
+        log('error' if is_error else 'info', text)
+    elif is_error:
         messagebox.showerror(title='Saving Request', message=text)
     else:
         messagebox.showinfo(title='Saving Request', message=text)
 
 
-def find_files(pattern):
-    """
-    Find all filenames in the current folder that match the pattern.
-
-    Parameters
-    ----------
-    pattern : str
-        regex pattern to use to match the filenames.
-
-    Returns
-    -------
-    filenames : list
-        list of filenames that match the pattern.
-
-    """
-    filenames_pattern = compile(pattern)
-    filenames = list(filter(filenames_pattern.match, listdir('./')))
-    return filenames
-
-
 def merge_district_pickles(date):
     """
     Merge pickle files in the `temporary_files` folder of the form
     `date-commission_type-furnished_type-home_type-district.pkl`
-    into one pickle file with the name `date-merged.pkl`.
+    into the day `date` of the `util.snapshots.SnapshotStore`, in the
+    compact schema of `util.schema.compact`. Partial files of a section
+    written by distributed workers are merged too, and announcements that
+    were saved more than once are kept once.
 
-    Creates a `Database` folder if it does not exist and saves the
-    merged pickle file there.
+    Creates a `Database` folder if it does not exist and saves the day
+    in its `snapshots` folder, mostly as the changes since the day
+    before. Sections saved in the Parquet dataset of `temporary_files`
+    are written as one file of the dataset of `Database` instead.
 
     Parameters
     ----------
@@ -70,71 +85,154 @@ def merge_district_pickles(date):
         create_messagebox('temporary_files folder does not exist.')
         return
 
+    num_sections = 0
+    if path.isdir(scraped_folder('temporary_files', date)):
+        if not path.isdir('Database'):
+            mkdir('Database')
+        with metrics.section(f'{date}-dataset'):
+            with metrics.timer('compact_parquet'):
+                num_sections = compact_partitions('temporary_files', 'Database', date)
+        create_messagebox(f'{num_sections} sections have been added to the dataset'
+                          f' in Database.', False)
+
     chdir('temporary_files')
     filenames_pattern = f'{date}-' + r'(yes|no)-.*\.pkl$'
     all_filenames = find_files(filenames_pattern)
     if not all_filenames:
-        create_messagebox(f'Pickle files do not exist in {getcwd()}')
+        if not num_sections:
+            create_messagebox(f'Pickle files do not exist in {getcwd()}')
         chdir('..')
         return
 
     create_messagebox(f'Found {len(all_filenames)} files to merge.', False)
-    merged_data = concat([read_pickle(file) for file in all_filenames])
+    with metrics.section(f'{date}-merged'):
+        with metrics.timer('read_pickle'):
+            frames = [read_pickle(file) for file in all_filenames]
+        with metrics.timer('concat'):
+            # sections have categoricals of different categories
+            merged_data = compact(concat(frames))
+            # partial files of distributed workers may share announcements
+            merged_data.drop_duplicates(subset='link', inplace=True)
+        chdir('..')
+
+        if not path.isdir('Database'):
+            mkdir('Database')
+        chdir('Database')
+        with metrics.timer('write_snapshot'):
+            kind = SnapshotStore().write(iso_date(date), merged_data)
+        metrics.count('rows_merged', len(merged_data))
+    create_messagebox(f'{date} has been saved in Database/snapshots as a {kind}.', False)
     chdir('..')
+    metrics.report('merge districts')
+
+
+def pack_merged_pickles():
+    """
+    Move the pickle files in the `Database` folder of the form
+    `dd-mm-yyyy-merged.pkl` into its `util.snapshots.SnapshotStore`,
+    oldest first, so that unchanged announcements are stored once.
+
+    A file is deleted only after the view of its day has been read back
+    from the store and holds the same rows; announcements of the same
+    link are kept once, as by `merge_district_pickles`.
 
+    Returns
+    -------
+    None.
+
+    """
     if not path.isdir('Database'):
-        mkdir('Database')
+        create_messagebox('Database folder does not exist.')
+        return
+
     chdir('Database')
-    merged_filename = f'{date}-merged.pkl'
-    merged_data.to_pickle(merged_filename)
-    create_messagebox(f'{merged_filename} has been created.', False)
+    filenames = sorted(find_files(r'\d{2}-\d{2}-\d{4}-merged\.pkl$'),
+                       key=lambda filename: iso_date(filename[:10]))
+    if not filenames:
+        create_messagebox(f'Pickle files do not exist in {getcwd()}')
+        chdir('..')
+        return
+
+    store = SnapshotStore()
+    num_packed = 0
+    with metrics.section('pack'):
+        for filename in filenames:
+            day = iso_date(filename[:10])
+            with metrics.timer('read_pickle'):
+                expected = compact(read_pickle(filename)).drop_duplicates(subset='link')
+            with metrics.timer('write_snapshot'):
+                store.write(day, expected)
+            view = store.view(day).sort_values('link', ignore_index=True)
+            expected = expected.sort_values('link', ignore_index=True)
+            if list(view.columns) != list(expected.columns) or len(view) != len(expected) \
+                    or any(changed_fields(view[column], expected[column]).any()
+                           for column in view):
+                log('error', f'{filename} differs from its snapshot and is kept.')
+                continue
+            remove(filename)
+            num_packed += 1
+    create_messagebox(f'{num_packed} of {len(filenames)} files have been moved to'
+                      f' Database/snapshots.', False)
     chdir('..')
+    metrics.report('pack')
 
 
-def merge_month_pickles():
+def merge_month_pickles(columns=None):
     """
     Merge all pickle files in the current folder of the form
-    `dd-mm-yyyy-merged.pkl` into one pandas DataFrame, dropping
-    duplicated rows.
+    `dd-mm-yyyy-merged.pkl`, the days of its `snapshots` and the Parquet
+    dataset of the current folder, if any, into one pandas DataFrame,
+    dropping duplicated rows.
+    Files are read one at a time by `iter_month_pickles`. The result has
+    the compact schema of `util.schema.compact`, with the amenity flags
+    unpacked.
+
+    Parameters
+    ----------
+    columns : list of str or None
+        columns of the result besides `day`, `month` and `year`.
+        If None, all columns are kept.
 
     Returns
     -------
     pandas DataFrame.
 
     """
-    filenames_pattern = r'\d{2}-\d{2}-\d{4}-merged\.pkl$'
-    all_filenames = find_files(filenames_pattern)
-    if not all_filenames:
+    num_files = len(daily_files())
+    if not num_files:
         return DataFrame()
 
-    create_messagebox(f'Found {len(all_filenames)} files to merge.', False)
-    merged_data = concat([read_pickle(file) for file in all_filenames])
-    merged_data.drop_duplicates(
-        subset=['price', 'num_rooms', 'area', 'home_type', 'district', 'post_text'],
-        inplace=True
-    )
-
-    # data pre-processing
-    filter_conditions = '(area >= 30) and (area <= 310) and (price_m2 >= 300)'\
-        ' and (apart_floor <= home_floor) and (num_rooms <= 8)'
-    merged_data = merged_data.query(filter_conditions)
-    merged_data[['day', 'month', 'year']] = merged_data.date.str.split(
-        pat="-", expand=True)
-    return merged_data
-
-
-def create_excel(date):
+    create_messagebox(f'Found {num_files} files to merge.', False)
+    chunks = list(iter_month_pickles(columns))
+    with metrics.timer('concat'):
+        return unpack_amenities(compact(concat(chunks)))
+
+
+def create_excel(date, rebuild=False, formats=('xlsx',), reprice=True):
     """
     Merge all pickle files in the `Database` folder of the form
-    `dd-mm-yyyy-merged.pkl` into one Excel file, dropping duplicates.
+    `dd-mm-yyyy-merged.pkl`, its snapshots and its Parquet dataset into
+    one Excel file, dropping duplicates.
 
-    Creates an Excel file with the name `date-merged.xlsx` and
-    saves it in the `Database` folder.
+    Daily files are merged into the master table of the `Database`
+    folder only once, so only files that are new since the previous call
+    are read. Creates an Excel file with the name `date-merged.xlsx` and
+    saves it in the `Database` folder. The rows are exported one part of
+    the master table at a time, and rows that do not fit in one worksheet
+    continue on the next one. Prices in UZS are converted to USD with the
+    rate of the day of each announcement, kept in `Database/fx-rates.pkl`.
 
     Parameters
     ----------
     date : str
         date of the form `dd-mm-yyyy`.
+    rebuild : bool
+        if True, the master table is built again from all daily files.
+    formats : tuple of str
+        formats of the files to create: `xlsx`, `csv` and/or `parquet`.
+    reprice : bool
+        if False, prices are exported as they were converted when they
+        were scraped.
 
     Returns
     -------
@@ -146,16 +244,36 @@ def create_excel(date):
         return
 
     chdir('Database')
-    df = merge_month_pickles()
-    if df.empty:
-        create_messagebox(f'Pickle files do not exist in {getcwd()}')
-        chdir('..')
-        return
-
-    filename = f'{date}-merged.xlsx'
-    df.to_excel(filename, index=False, encoding='utf-8')
-    create_messagebox(f'{filename} has been created.', False)
+    with metrics.section(f'{date}-merged'):
+        master = MasterTable()
+        num_files = len(master.pending_files())
+        if rebuild or num_files:
+            create_messagebox(f'Found {num_files} new files to merge.', False)
+        if rebuild:
+            master.rebuild()
+        else:
+            master.ingest()
+        if not master.num_rows:
+            create_messagebox(f'Pickle files do not exist in {getcwd()}')
+            chdir('..')
+            return
+
+        # parts of the table merged from older files may lack columns
+        columns = [*COLUMN_NAMES, 'day', 'month', 'year']
+        fx_rates = FxRates() if reprice else None
+        filenames = [f'{date}-merged.{file_format}' for file_format in formats]
+        for filename, file_format in zip(filenames, formats):
+            chunks = master.iter_parts()
+            if fx_rates is not None:
+                chunks = iter_repriced(chunks, fx_rates)
+            chunks = map(unpack_amenities, chunks)
+            with metrics.timer(f'to_{file_format}'):
+                num_rows = export_chunks(chunks, filename, file_format, columns=columns)
+            metrics.count('rows_exported', num_rows)
+    verb = 'has' if len(filenames) == 1 else 'have'
+    create_messagebox(f'{", ".join(filenames)} {verb} been created.', False)
     chdir('..')
+    metrics.report('make excel')
 
 
 def update_yesterday(yesterday, today):
@@ -163,6 +281,8 @@ def update_yesterday(yesterday, today):
     Rename all filenames in the `temporary_files` folder of the form
     `yesterday-commission_type-furnished_type-home_type-district.pkl`
     as `today-commission_type-furnished_type-home_type-district.pkl`.
+    Sections of the Parquet dataset scraped yesterday are moved to
+    today's partition in the same way.
 
     Parameters
     ----------
@@ -180,10 +300,10 @@ def update_yesterday(yesterday, today):
         create_messagebox('temporary_files folder does not exist.')
         return
 
+    num_renamed = rename_partitions('temporary_files', yesterday, today)
     chdir('temporary_files')
     yesterday_pattern = f'{yesterday}-' + r'(yes|no)-.*\.pkl$'
     yesterday_files = find_files(yesterday_pattern)
-    num_renamed = 0
     for filename in yesterday_files:
         new_filename = filename.replace(f'{yesterday}', f'{today}')
         if not path.isfile(new_filename):
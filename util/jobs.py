@@ -0,0 +1,163 @@
+from asyncio import sleep
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from queue import Queue
+from threading import Event
+from time import perf_counter
+
+from .logger import log
+
+
+class JobCancelled(Exception):
+    """Raised inside a job that has been cancelled through its `JobControl`."""
+
+
+class JobControl:
+    """
+    Class through which a window pauses and cancels a running job.
+
+    The scraper checks it before every request, so a paused scrape
+    waits and a cancelled one stops after the requests in flight. Pages
+    that are not finished are not marked as completed in the journal of
+    their section, which is kept to be resumed later.
+    """
+    def __init__(self):
+        self._running = Event()
+        self._running.set()
+        self._cancelled = Event()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    @property
+    def paused(self):
+        return not self._running.is_set()
+
+    def pause(self):
+        self._running.clear()
+
+    def resume(self):
+        self._running.set()
+
+    def cancel(self):
+        self._cancelled.set()
+        # a paused job has to wake up to stop
+        self._running.set()
+
+    def reset(self):
+        """Prepare the control for the next job."""
+        self._cancelled.clear()
+        self._running.set()
+
+    async def checkpoint(self):
+        """
+        Sleep while the job is paused, without blocking the event loop,
+        and raise `JobCancelled` if it is cancelled.
+        """
+        while not self._running.is_set():
+            await sleep(0.2)
+        if self.cancelled:
+            raise JobCancelled()
+
+
+class Progress:
+    """Progress of a scrape, with its rate and the expected time left."""
+    __slots__ = ['sections_done', 'sections_total', 'ads_done', 'ads_total', 'seconds']
+
+    def __init__(self, sections_done, sections_total, ads_done, ads_total, seconds):
+        self.sections_done = sections_done
+        self.sections_total = sections_total
+        self.ads_done = ads_done
+        self.ads_total = ads_total
+        self.seconds = seconds
+
+    @property
+    def rate(self):
+        """Announcements per second since the job started."""
+        return self.ads_done / self.seconds if self.seconds > 0 else 0.0
+
+    @property
+    def eta(self):
+        """Expected time left as a timedelta, or None before the first ad."""
+        if not self.rate:
+            return None
+        return timedelta(seconds=round(max(self.ads_total - self.ads_done, 0) / self.rate))
+
+    def __str__(self):
+        eta = self.eta
+        return (f'{self.sections_done}/{self.sections_total} sections,'
+                f' {self.ads_done}/{self.ads_total} ads, {self.rate:.1f} ads/s,'
+                f' ETA {eta if eta is not None else "unknown"}')
+
+
+class JobRunner:
+    """
+    Class that runs the jobs of a window one at a time in a background
+    thread, so that the window keeps responding.
+
+    Jobs report back through `events`, a queue the window polls, e.g.
+    with Tk's `after`, since Tk may only be used from its own thread:
+
+    - (`started`, name) when a job starts;
+    - (`progress`, Progress) when a page or section of a scrape is done;
+    - (`message`, text, is_error) for every message of `create_messagebox`;
+    - (`finished`, name, error) when a job ends, with the exception that
+      stopped it or None.
+
+    Only one job runs at a time, because the jobs change the working
+    directory of the process.
+    """
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='job')
+        self.events = Queue()
+        self.control = JobControl()
+        self.running = None
+        self._started = None
+
+    def submit(self, name, function, *args):
+        """
+        Start `function(*args)` in the background unless a job is running.
+
+        Returns
+        -------
+        bool
+            True if the job has been started.
+
+        """
+        if self.running is not None:
+            return False
+
+        self.running = name
+        self.control.reset()
+        self._started = perf_counter()
+        self.events.put(('started', name))
+        self.executor.submit(self._run, name, function, *args)
+        return True
+
+    def _run(self, name, function, *args):
+        try:
+            function(*args)
+        except Exception as error:
+            log('error', f'{name} has stopped: {error}')
+            self.events.put(('finished', name, error))
+        else:
+            self.events.put(('finished', name, None))
+
+    def finish(self):
+        """Mark the running job as finished, once its `finished` event is read."""
+        self.running = None
+
+    def message(self, text, is_error=True):
+        """Pass a message of a job to the window."""
+        self.events.put(('message', text, is_error))
+
+    def progress(self, sections_done, sections_total, ads_done, ads_total):
+        """Pass the progress of a scrape to the window."""
+        self.events.put(('progress', Progress(sections_done, sections_total, ads_done,
+                                              ads_total, perf_counter() - self._started)))
+
+    def shutdown(self):
+        """Cancel the running job and wait until it stops."""
+        self.control.cancel()
+        self.executor.shutdown(wait=True)
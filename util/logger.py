@@ -1,5 +1,7 @@
 from colorama import Fore, Back, Style
 
+from .metrics import metrics
+
 
 def log(state, logs):
     if state.lower() == "warn":
@@ -12,4 +14,4 @@ def log(state, logs):
         print(Fore.GREEN + Style.NORMAL + "[SUCCESS]" + Style.RESET_ALL + " " + logs)
     else:
         print(Back.RED + Back.WHITE + Style.NORMAL + "[MODE NOT SPECIFIED]" + Style.RESET_ALL)
-    pass
+    metrics.event('log', level=state.lower(), message=logs)
@@ -0,0 +1,220 @@
+from json import load
+from os import path, mkdir, stat
+from shutil import rmtree
+
+from numpy import array, load as load_array, save as save_array, uint64
+from pandas import DataFrame, concat, read_pickle
+
+from .files import remove_unrecorded, write_json
+from .logger import log
+from .merge import daily_files, iter_month_pickles
+from .metrics import metrics
+from .schema import compact, select
+from .storage import DATASET_FOLDER, PART_FILENAME
+
+
+MASTER_FOLDER = 'master'
+MANIFEST_FILENAME = 'manifest.json'
+# version of the rows of the table. A table of another version is
+# rebuilt, e.g. after dates became datetimes in version 2 and the
+# compact schema of `util.schema` was applied in version 3.
+MASTER_VERSION = 3
+
+
+def file_signature(day, filename):
+    """
+    Return the name, size and modification time of a daily file as
+    returned by `daily_files`, or None if it does not exist.
+    """
+    if filename is None:
+        name = path.join(DATASET_FOLDER, f'scraped={day}')
+        filename = path.join(name, PART_FILENAME)
+    else:
+        name = filename
+    if not path.isfile(filename):
+        return None
+    status = stat(filename)
+    return {'name': name, 'size': status.st_size, 'modified': status.st_mtime}
+
+
+class KeySet(set):
+    """Set of row hashes that remembers which hashes were added to it."""
+    def __init__(self, keys=()):
+        super().__init__(keys)
+        self.added = []
+
+    def add(self, key):
+        if key not in self:
+            self.added.append(key)
+            super().add(key)
+
+
+class MasterTable:
+    """
+    Class that keeps the merged, deduplicated and filtered history of the
+    `Database` folder, so that daily files are merged only once.
+
+    The `master` folder holds one pickle file of rows and one file of
+    row hashes per ingestion, and `manifest.json`, which lists them with
+    the daily files that were ingested. Rows are dropped as duplicates
+    by the hashes of every row ingested before, as in
+    `iter_month_pickles`. An ingestion counts only once `manifest.json`
+    is replaced, so a run that stops halfway leaves the table as it was.
+
+    The current folder must be the `Database` folder.
+    """
+    def __init__(self):
+        self.folder = MASTER_FOLDER
+        self.manifest = self._empty_manifest()
+        manifest_filename = path.join(self.folder, MANIFEST_FILENAME)
+        if path.isfile(manifest_filename):
+            with open(manifest_filename, encoding='utf-8') as file:
+                manifest = load(file)
+            if manifest.get('version', 1) == MASTER_VERSION:
+                self.manifest = manifest
+            else:
+                # the files of the old table are removed by the next ingestion
+                log('info', 'The master table was written by an older version'
+                            ' and will be rebuilt.')
+
+    @staticmethod
+    def _empty_manifest():
+        return {'version': MASTER_VERSION, 'files': {}, 'parts': []}
+
+    def _path(self, name):
+        return path.join(self.folder, name)
+
+    def pending_files(self):
+        """
+        Return the daily files that are not ingested yet, or that changed
+        since they were ingested, e.g. because more districts were merged
+        into them, oldest first.
+        """
+        pending = []
+        for day, filename in daily_files():
+            signature = file_signature(day, filename)
+            if signature is None:
+                continue
+            if self.manifest['files'].get(signature['name']) != signature:
+                pending.append((day, filename))
+        return pending
+
+    def keys(self):
+        """Return the `KeySet` of hashes of every row ingested so far."""
+        seen = KeySet()
+        for part in self.manifest['parts']:
+            seen.update(load_array(self._path(part['keys'])).tolist())
+        return seen
+
+    def ingest(self):
+        """
+        Merge the daily files that are not ingested yet into the table.
+
+        Returns
+        -------
+        int
+            number of rows added to the table.
+
+        """
+        pending = self.pending_files()
+        if not pending:
+            return 0
+        if not path.isdir(self.folder):
+            mkdir(self.folder)
+        self._remove_orphans()
+
+        with metrics.timer('load_keys'):
+            seen = self.keys()
+        chunks = list(iter_month_pickles(seen=seen, files=pending))
+
+        number = max([part['number'] for part in self.manifest['parts']], default=0) + 1
+        part = {'number': number, 'rows': f'part-{number:05d}.pkl',
+                'keys': f'keys-{number:05d}.npy'}
+        rows = compact(concat(chunks)) if chunks else DataFrame()
+        with metrics.timer('to_pickle'):
+            rows.to_pickle(self._path(part['rows']))
+            save_array(self._path(part['keys']), array(seen.added, dtype=uint64))
+        part['num_rows'] = len(rows)
+
+        manifest = {'version': MASTER_VERSION, 'files': dict(self.manifest['files']),
+                    'parts': self.manifest['parts'] + [part]}
+        for day, filename in pending:
+            signature = file_signature(day, filename)
+            manifest['files'][signature['name']] = signature
+        self._save_manifest(manifest)
+        log('info', f'Master table: {len(pending)} daily files ingested,'
+                    f' {len(rows)} rows added.')
+        return len(rows)
+
+    def _save_manifest(self, manifest):
+        write_json(self._path(MANIFEST_FILENAME), manifest, indent=1)
+        self.manifest = manifest
+
+    def _remove_orphans(self):
+        """Delete the files of an ingestion that stopped before it was recorded."""
+        recorded = {MANIFEST_FILENAME}
+        for part in self.manifest['parts']:
+            recorded.update([part['rows'], part['keys']])
+        remove_unrecorded(self.folder, recorded)
+
+    @property
+    def num_rows(self):
+        """Number of rows in the table."""
+        return sum(part['num_rows'] for part in self.manifest['parts'])
+
+    def iter_parts(self, columns=None):
+        """
+        Yield the rows of the table one ingestion at a time.
+
+        Parameters
+        ----------
+        columns : list of str or None
+            columns to return. If None, all columns are returned.
+
+        Yields
+        ------
+        pandas DataFrame.
+
+        """
+        for part in self.manifest['parts']:
+            if not part['num_rows']:
+                continue
+            with metrics.timer('read_pickle'):
+                frame = read_pickle(self._path(part['rows']))
+            yield frame if columns is None else select(frame, columns)
+
+    def read(self, columns=None):
+        """
+        Return the rows of the table.
+
+        Parameters
+        ----------
+        columns : list of str or None
+            columns to return. If None, all columns are returned.
+
+        Returns
+        -------
+        pandas DataFrame.
+
+        """
+        frames = list(self.iter_parts(columns))
+        if not frames:
+            return DataFrame()
+        with metrics.timer('concat'):
+            return compact(concat(frames))
+
+    def rebuild(self):
+        """
+        Delete the table, its hashes and its manifest, and ingest every
+        daily file again.
+
+        Returns
+        -------
+        int
+            number of rows in the table.
+
+        """
+        if path.isdir(self.folder):
+            rmtree(self.folder)
+        self.manifest = self._empty_manifest()
+        return self.ingest()
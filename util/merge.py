@@ -0,0 +1,142 @@
+from os import listdir, path
+from re import compile
+from pandas import read_pickle
+from pandas.util import hash_pandas_object
+
+from .metrics import metrics
+from .schema import compact, select, stored_columns
+from .snapshots import SNAPSHOT_FOLDER, SnapshotStore
+from .storage import ad_dates, dataset_days, dataset_exists, iso_date, month_filter, read_dataset
+
+
+# rows that agree on these columns are duplicates
+DUPLICATE_SUBSET = ['price', 'num_rooms', 'area', 'home_type', 'district', 'post_text']
+FILTER_CONDITIONS = '(area >= 30) and (area <= 310) and (price_m2 >= 300)'\
+    ' and (apart_floor <= home_floor) and (num_rooms <= 8)'
+
+
+def find_files(pattern):
+    """
+    Find all filenames in the current folder that match the pattern.
+
+    Parameters
+    ----------
+    pattern : str
+        regex pattern to use to match the filenames.
+
+    Returns
+    -------
+    filenames : list
+        list of filenames that match the pattern.
+
+    """
+    filenames_pattern = compile(pattern)
+    filenames = list(filter(filenames_pattern.match, listdir('./')))
+    return filenames
+
+
+def row_hashes(df):
+    """
+    Return a 64-bit hash of the `DUPLICATE_SUBSET` columns of every row
+    of `df`. Numbers are hashed as floats, so that rows read from pickle
+    files and from the Parquet dataset hash alike.
+    """
+    subset = df[DUPLICATE_SUBSET].astype({'price': 'float64', 'num_rooms': 'float64',
+                                          'area': 'float64'})
+    return hash_pandas_object(subset, index=False, categorize=False).to_numpy()
+
+
+def daily_files():
+    """
+    Return the daily files of the current folder, oldest first: the pickle
+    files of the form `dd-mm-yyyy-merged.pkl`, the files of the days of the
+    `SnapshotStore` and the days of the Parquet dataset, as (`yyyy-mm-dd`,
+    filename or None) tuples.
+    """
+    filenames_pattern = r'\d{2}-\d{2}-\d{4}-merged\.pkl$'
+    days = [(iso_date(filename[:10]), filename) for filename in find_files(filenames_pattern)]
+    store = SnapshotStore()
+    days.extend((day, store.filename(day)) for day in store.days)
+    if dataset_exists('.'):
+        days.extend((day, None) for day in dataset_days('.'))
+    return sorted(days, key=lambda day: (day[0], day[1] is None))
+
+
+def iter_month_pickles(columns=None, seen=None, files=None):
+    """
+    Read the daily files of the current folder one at a time, oldest
+    first, and yield the rows of each that have not been seen in an
+    earlier file and meet `FILTER_CONDITIONS`.
+
+    Duplicates are found by the `row_hashes` of the rows, which are kept
+    in `seen`, so memory depends on one daily file and the set of hashes
+    rather than on the whole history. Of a day of the `SnapshotStore`,
+    only the announcements that are new or changed since the day before
+    are read, since the others are duplicates of that day. Only the needed
+    columns of the Parquet dataset are read, and its rows are filtered
+    while they are read. Chunks are converted to the compact schema of
+    `compact`, with the amenity flags packed in `amenities`.
+
+    Parameters
+    ----------
+    columns : list of str or None
+        columns of the chunks besides `day`, `month` and `year`.
+        If None, all columns are kept.
+    seen : set or None
+        hashes of the rows that are already merged. It is updated with
+        the hashes of every file read.
+    files : list of tuple or None
+        daily files to read, as returned by `daily_files`. If None, all
+        daily files are read.
+
+    Yields
+    ------
+    pandas DataFrame
+        new rows of one daily file.
+
+    """
+    seen = set() if seen is None else seen
+    # the store keeps the last view it read, so days are read one delta at a time
+    store = None
+    needed = None
+    if columns is not None:
+        needed = [*columns, *DUPLICATE_SUBSET, 'date', 'price_m2', 'apart_floor', 'home_floor']
+        needed = list(dict.fromkeys(needed))
+
+    for day, filename in daily_files() if files is None else files:
+        if filename is None:
+            with metrics.timer('read_parquet'):
+                stored = None if needed is None else stored_columns(needed)
+                chunk = read_dataset('.', stored, month_filter(), day)
+        elif path.dirname(filename) == SNAPSHOT_FOLDER:
+            store = store or SnapshotStore()
+            with metrics.timer('read_snapshot'):
+                chunk = store.new_rows(day)
+        else:
+            with metrics.timer('read_pickle'):
+                chunk = read_pickle(filename)
+        with metrics.timer('compact'):
+            chunk = compact(chunk)
+        if needed is not None:
+            chunk = select(chunk, needed)
+
+        with metrics.timer('drop_duplicates'):
+            new_rows = []
+            for value in row_hashes(chunk).tolist():
+                new_rows.append(value not in seen)
+                seen.add(value)
+            chunk = chunk[new_rows]
+
+        # data pre-processing
+        with metrics.timer('query'):
+            chunk = chunk.query(FILTER_CONDITIONS)
+        if columns is not None:
+            chunk = select(chunk, list(dict.fromkeys([*columns, 'date'])))
+        chunk = chunk.copy()
+        chunk['date'] = ad_dates(chunk['date'])
+        chunk['day'] = chunk.date.dt.day
+        chunk['month'] = chunk.date.dt.month
+        chunk['year'] = chunk.date.dt.year
+        if columns is not None and 'date' not in columns:
+            chunk = chunk.drop(columns='date')
+        yield chunk
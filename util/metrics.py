@@ -0,0 +1,242 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from cProfile import Profile
+from json import dumps
+from os import path
+from threading import Lock
+from time import perf_counter, time
+
+
+TOTAL = 'total'
+_section = ContextVar('section', default=None)
+
+
+class _NullTimer:
+    """Timer that does nothing, returned while metrics are disabled."""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+
+class _Timer:
+    """Timer that adds its duration to a stage of the current section."""
+    __slots__ = ['metrics', 'stage', 'section', 'begin']
+
+    def __init__(self, metrics, stage, section):
+        self.metrics = metrics
+        self.stage = stage
+        self.section = section
+
+    def __enter__(self):
+        self.begin = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.metrics.add_time(self.stage, perf_counter() - self.begin, self.section)
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Metrics:
+    """
+    Class that collects timers and counters of the scraper and the merge
+    utilities, broken down by section.
+
+    Metrics are disabled by default, and then `timer`, `count` and
+    `event` return immediately. Once `enable` is called, timings are
+    aggregated in memory, events are written as JSON lines to the log
+    file and `report` logs a summary of every stage.
+
+    The section is taken from the innermost `section` block, which is
+    also inherited by the asyncio tasks started inside it.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.log_file = None
+        self.profile_section = None
+        self.profile_folder = None
+        self.timings = {}
+        self.counters = {}
+        self.lock = Lock()
+
+    def enable(self, log_file=None, profile_section=None, profile_folder='.'):
+        """
+        Start collecting metrics.
+
+        Parameters
+        ----------
+        log_file : str or None
+            file to which events and summaries are appended as JSON lines.
+            If None, metrics are only reported with `log`.
+        profile_section : str or None
+            the first section whose name contains this text is run under
+            cProfile. Everything the event loop runs meanwhile is profiled
+            too, so use `section_workers=1` for a clean profile.
+        profile_folder : str
+            folder in which the `.prof` file of the profiled section is saved.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.log_file = path.abspath(log_file) if log_file else None
+        self.profile_section = profile_section
+        self.profile_folder = path.abspath(profile_folder)
+        self.enabled = True
+
+    def disable(self):
+        """Stop collecting metrics and forget those collected so far."""
+        self.enabled = False
+        self.reset()
+
+    def reset(self):
+        """Forget the timings and counters collected so far."""
+        with self.lock:
+            self.timings = {}
+            self.counters = {}
+
+    @contextmanager
+    def section(self, name):
+        """Attribute the timers and counters of the block to section `name`."""
+        token = _section.set(name)
+        try:
+            with self.profile(name):
+                yield
+        finally:
+            _section.reset(token)
+
+    def timer(self, stage):
+        """
+        Return a context manager that adds the time spent in its block to
+        `stage` of the current section.
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, stage, _section.get())
+
+    def add_time(self, stage, seconds, section=None):
+        """Add `seconds` spent in `stage` of `section`."""
+        if not self.enabled:
+            return
+        with self.lock:
+            stages = self.timings.setdefault(section or TOTAL, {})
+            timing = stages.get(stage)
+            if timing is None:
+                stages[stage] = [1, seconds, seconds]
+            else:
+                timing[0] += 1
+                timing[1] += seconds
+                timing[2] = max(timing[2], seconds)
+
+    def count(self, name, value=1):
+        """Add `value` to counter `name` of the current section."""
+        if not self.enabled:
+            return
+        with self.lock:
+            counters = self.counters.setdefault(_section.get() or TOTAL, {})
+            counters[name] = counters.get(name, 0) + value
+
+    def event(self, kind, **fields):
+        """Write an event with the given fields to the JSON log file."""
+        if not self.enabled or self.log_file is None:
+            return
+        record = {'time': round(time(), 3), 'event': kind}
+        section = _section.get()
+        if section is not None:
+            record['section'] = section
+        record.update(fields)
+        line = dumps(record, ensure_ascii=False, default=str)
+        with self.lock:
+            with open(self.log_file, 'a', encoding='utf-8') as file:
+                file.write(line + '\n')
+
+    @contextmanager
+    def profile(self, name):
+        """Run the block under cProfile if `name` is the section to be profiled."""
+        if not self.enabled or not self.profile_section or self.profile_section not in name:
+            yield
+            return
+
+        self.profile_section = None  # profile only the first matching section
+        profiler = Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            filename = path.join(self.profile_folder, f'{path.basename(name)}.prof')
+            profiler.dump_stats(filename)
+            self.event('profile', file=filename)
+
+    def summary(self):
+        """
+        Return the collected metrics.
+
+        Returns
+        -------
+        dict
+            `stages` maps each section, and `total`, to its stages, each
+            with its `count`, `seconds` and `max_seconds`. `counters` maps
+            each section, and `total`, to its counters.
+
+        """
+        with self.lock:
+            stages = {TOTAL: {}}
+            for section, section_stages in self.timings.items():
+                stages[section] = {}
+                for stage, (count, seconds, maximum) in section_stages.items():
+                    stages[section][stage] = {'count': count, 'seconds': round(seconds, 4),
+                                              'max_seconds': round(maximum, 4)}
+                    if section != TOTAL:
+                        total = stages[TOTAL].setdefault(
+                            stage, {'count': 0, 'seconds': 0, 'max_seconds': 0})
+                        total['count'] += count
+                        total['seconds'] = round(total['seconds'] + seconds, 4)
+                        total['max_seconds'] = max(total['max_seconds'], round(maximum, 4))
+
+            counters = {TOTAL: {}}
+            for section, section_counters in self.counters.items():
+                counters[section] = dict(section_counters)
+                if section != TOTAL:
+                    for name, value in section_counters.items():
+                        counters[TOTAL][name] = counters[TOTAL].get(name, 0) + value
+        return {'stages': stages, 'counters': counters}
+
+    def report(self, title):
+        """
+        Log the totals of every stage and counter, write the full summary
+        to the JSON log file and start collecting anew.
+
+        Parameters
+        ----------
+        title : str
+            name of the job that is reported, e.g. `scrape`.
+
+        Returns
+        -------
+        dict or None
+            the summary, or None if metrics are disabled.
+
+        """
+        if not self.enabled:
+            return None
+        from .logger import log
+
+        summary = self.summary()
+        self.event('summary', job=title, **summary)
+        for stage, timing in sorted(summary['stages'][TOTAL].items(),
+                                    key=lambda item: -item[1]['seconds']):
+            log('info', f'{title}: {stage} took {timing["seconds"]:.2f} s in'
+                        f' {timing["count"]} calls, the longest {timing["max_seconds"]:.3f} s.')
+        for name, value in sorted(summary['counters'][TOTAL].items()):
+            log('info', f'{title}: {name} = {value}')
+        self.reset()
+        return summary
+
+
+metrics = Metrics()
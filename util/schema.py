@@ -0,0 +1,112 @@
+from numpy import iinfo, uint8, zeros
+
+
+# columns of a scraped section, in the order they are saved
+COLUMN_NAMES = ['link', 'date', 'price', 'home_type', 'district', 'price_m2',
+                'furnished', 'commission', 'num_rooms', 'area', 'apart_floor',
+                'home_floor', 'condition', 'build_type', 'build_plan',
+                'build_year', 'bathroom', 'ceil_height', 'hospital',
+                'playground', 'kindergarten', 'park', 'recreation', 'school',
+                'restaurant', 'supermarket', 'title_text', 'post_text',
+                'raw_price', 'currency', 'listing_only']
+# text scraped from the page that columns are derived from by
+# `derive_columns`, and that is not saved
+RAW_COLUMNS = ['close_things']
+# columns with a few distinct values, kept as pandas categoricals
+CATEGORY_COLUMNS = ['home_type', 'district', 'condition', 'build_type', 'build_plan',
+                    'bathroom', 'currency']
+# nullable integers of the smallest type that holds every sensible value.
+# Values out of range are typing errors on OLX and become missing.
+SMALL_INT_COLUMNS = {'num_rooms': 'Int8', 'area': 'Int16', 'apart_floor': 'Int8',
+                     'home_floor': 'Int8', 'build_year': 'Int16'}
+FLOAT32_COLUMNS = ['price_m2', 'ceil_height']
+FLAG_COLUMNS = ['furnished', 'commission', 'listing_only']
+# amenities packed as the bits of the `amenities` column, in this order
+AMENITY_COLUMNS = ['hospital', 'playground', 'kindergarten', 'park', 'recreation',
+                   'school', 'restaurant', 'supermarket']
+
+
+def compact(df):
+    """
+    Convert a frame of scraped announcements to the compact schema.
+
+    Categoricals replace repeated strings, counts and floors become
+    nullable small integers, `price_m2` and `ceil_height` float32 and
+    `furnished`, `commission` and `listing_only` nullable booleans. The eight amenity
+    flags are packed into the bits of one uint8 `amenities` column when
+    all of them are present. `price` keeps float64, since duplicates are
+    found by its exact value. Columns that are already compact are left
+    as they are, so frames can be compacted again after `concat`.
+
+    Parameters
+    ----------
+    df : pandas DataFrame
+        scraped announcements, compact or not.
+
+    Returns
+    -------
+    pandas DataFrame
+        compact copy of `df`.
+
+    """
+    from pandas import to_numeric
+
+    columns = {}
+    for name in CATEGORY_COLUMNS:
+        if name in df and df[name].dtype != 'category':
+            columns[name] = df[name].astype('category')
+    for name, dtype in SMALL_INT_COLUMNS.items():
+        if name in df and df[name].dtype != dtype:
+            values = to_numeric(df[name], errors='coerce')
+            bounds = iinfo(dtype.lower())
+            columns[name] = values.where(values.between(bounds.min, bounds.max)).astype(dtype)
+    for name in FLOAT32_COLUMNS:
+        if name in df and df[name].dtype != 'float32':
+            columns[name] = to_numeric(df[name], errors='coerce').astype('float32')
+    for name in FLAG_COLUMNS:
+        if name in df and df[name].dtype != 'boolean':
+            columns[name] = df[name].map({True: True, False: False}).astype('boolean')
+    df = df.assign(**columns)
+
+    if all(name in df for name in AMENITY_COLUMNS):
+        packed = zeros(len(df), dtype=uint8)
+        for bit, name in enumerate(AMENITY_COLUMNS):
+            packed |= df[name].fillna(False).to_numpy(dtype=bool).astype(uint8) << bit
+        position = df.columns.get_loc(AMENITY_COLUMNS[0])
+        df = df.drop(columns=AMENITY_COLUMNS)
+        df.insert(position, 'amenities', packed)
+    return df
+
+
+def unpack_amenities(df):
+    """
+    Replace the `amenities` column of a compact frame with the eight
+    boolean amenity columns. Frames without it are returned as they are.
+    """
+    if 'amenities' not in df:
+        return df
+
+    packed = df['amenities'].to_numpy()
+    position = df.columns.get_loc('amenities')
+    df = df.drop(columns='amenities')
+    for bit, name in enumerate(AMENITY_COLUMNS):
+        df.insert(position + bit, name, (packed >> bit & 1).astype(bool))
+    return df
+
+
+def stored_columns(columns):
+    """Return `columns` with `amenities` replaced by the amenity columns it packs."""
+    stored = []
+    for name in columns:
+        stored.extend(AMENITY_COLUMNS if name == 'amenities' else [name])
+    return list(dict.fromkeys(stored))
+
+
+def select(df, columns):
+    """
+    Return `columns` of a compact frame, unpacking the amenities if one
+    of them is requested.
+    """
+    if 'amenities' in df and any(name in AMENITY_COLUMNS for name in columns):
+        df = unpack_amenities(df)
+    return df[columns]
@@ -0,0 +1,321 @@
+from json import load
+from os import mkdir, path
+
+from numpy import flatnonzero, int32, zeros
+from pandas import CategoricalDtype, concat, read_pickle, to_pickle
+
+from .files import atomic_write, remove_unrecorded, write_json
+from .logger import log
+from .metrics import metrics
+from .schema import compact
+
+
+SNAPSHOT_FOLDER = 'snapshots'
+MANIFEST_FILENAME = 'manifest.json'
+SNAPSHOT_VERSION = 1
+# a day is stored whole after this many deltas in a row, so that a view
+# is rebuilt from one base and at most this many deltas
+REBASE_EVERY = 30
+# or when more than this share of its announcements is added or removed
+REBASE_SHARE = 0.5
+
+
+def contains(index, other):
+    """
+    Return a boolean array that is True where a link of `index` is in the
+    index `other` of unique links. This is much faster than `isin` for
+    the string arrays of pandas.
+    """
+    return other.get_indexer(index) >= 0
+
+
+def changed_fields(new, old):
+    """
+    Return a boolean array that is True where `new` differs from `old`,
+    two Series with the same index. Missing values equal each other, and
+    categoricals are compared by their values.
+    """
+    if isinstance(new.dtype, CategoricalDtype):
+        new = new.astype(object)
+    if isinstance(old.dtype, CategoricalDtype):
+        old = old.astype(object)
+    equal = new.eq(old).fillna(False).astype(bool) | (new.isna() & old.isna())
+    return ~equal.to_numpy()
+
+
+def encode_delta(previous, current):
+    """
+    Return the delta that turns the view `previous` into `current`, two
+    frames indexed by link.
+
+    The delta is a dict of the `added` rows, the `removed` links and the
+    `changed` fields of the announcements in both views: the `links` of
+    the announcements with a changed field, and for every changed column
+    the positions of its changed announcements in `links` and their new
+    values.
+    """
+    is_new = ~contains(current.index, previous.index)
+    kept = current.index[~is_new]
+    old = previous.loc[kept]
+    new = current.loc[kept]
+    masks = {}
+    for column in current.columns:
+        if column in previous:
+            mask = changed_fields(new[column], old[column])
+        else:
+            mask = ~zeros(len(kept), dtype=bool)
+        if mask.any():
+            masks[column] = mask
+
+    any_changed = zeros(len(kept), dtype=bool)
+    for mask in masks.values():
+        any_changed |= mask
+    columns = {column: (flatnonzero(mask[any_changed]).astype(int32),
+                        new[column][mask].reset_index(drop=True))
+               for column, mask in masks.items()}
+    return {'added': current[is_new],
+            'removed': previous.index[~contains(previous.index, current.index)],
+            'changed': {'links': kept[any_changed], 'columns': columns}}
+
+
+def apply_delta(view, delta, columns):
+    """
+    Return the view that `delta` of `encode_delta` makes of `view`, with
+    the columns `columns` besides `link`, in the compact schema.
+    """
+    view = view.drop(index=delta['removed'])
+    links = delta['changed']['links']
+    for column, (positions, values) in delta['changed']['columns'].items():
+        values = values.set_axis(links[positions])
+        if column not in view:
+            # a new column is changed for every announcement kept
+            view[column] = values.reindex(view.index)
+            continue
+        if isinstance(view[column].dtype, CategoricalDtype) or view[column].dtype != values.dtype:
+            view[column] = view[column].astype(object)
+            view.loc[values.index, column] = values.astype(object)
+            view[column] = view[column].infer_objects()
+        else:
+            view.loc[values.index, column] = values
+    if len(delta['added']):
+        view = concat([view, delta['added']])
+    return compact(view[[column for column in columns if column != 'link']])
+
+
+class SnapshotStore:
+    """
+    Class that keeps the merged announcements of every scrape day as a
+    base, the whole day, and deltas against the day before it.
+
+    Most announcements stay online for weeks, so consecutive days share
+    most of their rows. A delta holds only the announcements that were
+    added or removed and the fields that changed, keyed by the link of
+    the announcement. After `REBASE_EVERY` deltas in a row, or when more
+    than `REBASE_SHARE` of the announcements of a day are new or gone, the
+    day is stored whole as a new base, so that a view is rebuilt from a
+    few files.
+
+    The folder holds one pickle file per day and `manifest.json`, which
+    lists for every day its file, the day its delta applies to and its
+    columns. A day counts only once `manifest.json` is replaced, so a
+    write that stops halfway leaves the store as it was.
+    """
+    def __init__(self, folder=SNAPSHOT_FOLDER):
+        """
+        Parameters
+        ----------
+        folder : str
+            folder of the snapshots. It is created by the first `write`.
+
+        """
+        self.folder = folder
+        self.manifest = {'version': SNAPSHOT_VERSION, 'next': 1, 'days': {}}
+        manifest_filename = self._path(MANIFEST_FILENAME)
+        if path.isfile(manifest_filename):
+            with open(manifest_filename, encoding='utf-8') as file:
+                self.manifest = load(file)
+        # the last view that was read, as (day, frame indexed by link), and
+        # the links its delta added or changed, as (day, parent, links)
+        self._last_view = None
+        self._last_changes = None
+
+    def _path(self, name):
+        return path.join(self.folder, name)
+
+    @property
+    def days(self):
+        """Days of the store of the form `yyyy-mm-dd`, oldest first."""
+        return sorted(self.manifest['days'])
+
+    def filename(self, day):
+        """Return the file of `day`."""
+        return self._path(self.manifest['days'][day]['file'])
+
+    def _previous_day(self, day, days=None):
+        days = self.manifest['days'] if days is None else days
+        earlier = [other for other in days if other < day]
+        return max(earlier, default=None)
+
+    def _read_view(self, day):
+        """Return the view of `day` indexed by link."""
+        if self._last_view is not None and self._last_view[0] == day:
+            return self._last_view[1]
+
+        entry = self.manifest['days'][day]
+        if entry['parent'] is None:
+            with metrics.timer('read_pickle'):
+                view = compact(read_pickle(self.filename(day))).set_index('link')
+        else:
+            parent = self._read_view(entry['parent'])
+            with metrics.timer('read_pickle'):
+                delta = read_pickle(self.filename(day))
+            with metrics.timer('apply_delta'):
+                view = apply_delta(parent, delta, entry['columns'])
+            links = delta['added'].index.append(delta['changed']['links'])
+            self._last_changes = (day, entry['parent'], links)
+        self._last_view = (day, view)
+        return view
+
+    def view(self, day):
+        """
+        Return the announcements of `day` as they were written, with
+        announcements of the same link kept once.
+
+        Parameters
+        ----------
+        day : str
+            date of the form `yyyy-mm-dd`.
+
+        Returns
+        -------
+        pandas DataFrame
+            rows of the day in the compact schema of `util.schema.compact`.
+
+        """
+        if day not in self.manifest['days']:
+            raise KeyError(f'There is no snapshot of {day}.')
+        return self._read_view(day).reset_index()[self.manifest['days'][day]['columns']]
+
+    def new_rows(self, day):
+        """
+        Return the announcements of `day` that are not in the day before
+        it as they are: new announcements and those with a changed field.
+
+        Read day after day, oldest first, every day costs the reading of
+        its delta only. Together the new rows of all days hold every
+        distinct row of the history.
+        """
+        if day not in self.manifest['days']:
+            raise KeyError(f'There is no snapshot of {day}.')
+        previous = self._previous_day(day)
+        if previous is None:
+            return self.view(day)
+
+        previous_view = self._read_view(previous)
+        view = self._read_view(day)
+        if self._last_changes is not None and self._last_changes[:2] == (day, previous):
+            links = self._last_changes[2]
+        else:
+            # a base, or a delta that does not apply to the day before
+            with metrics.timer('encode_delta'):
+                delta = encode_delta(previous_view, view)
+            links = delta['added'].index.append(delta['changed']['links'])
+        rows = view[contains(view.index, links)]
+        return rows.reset_index()[self.manifest['days'][day]['columns']]
+
+    def _depth(self, days, day):
+        depth = 0
+        while days[day]['parent'] is not None:
+            day = days[day]['parent']
+            depth += 1
+        return depth
+
+    def _dump(self, data, name):
+        with metrics.timer('to_pickle'), atomic_write(self._path(name)) as temporary:
+            to_pickle(data, temporary)
+
+    def _put(self, manifest, day, view, columns, parent, parent_view):
+        """Write `view` of `day` as a delta against `parent` or as a base."""
+        number = manifest['next']
+        manifest['next'] += 1
+        entry = {'parent': None, 'columns': columns, 'rows': len(view)}
+        if parent is not None and self._depth(manifest['days'], parent) + 1 <= REBASE_EVERY:
+            with metrics.timer('encode_delta'):
+                delta = encode_delta(parent_view, view)
+            churn = len(delta['added']) + len(delta['removed'])
+            if churn <= REBASE_SHARE * len(view):
+                entry.update(parent=parent, file=f'delta-{day}-{number:05d}.pkl',
+                             added=len(delta['added']), removed=len(delta['removed']),
+                             changed=len(delta['changed']['links']))
+                self._dump(delta, entry['file'])
+        if entry['parent'] is None:
+            entry['file'] = f'base-{day}-{number:05d}.pkl'
+            self._dump(view.reset_index()[columns], entry['file'])
+        manifest['days'][day] = entry
+        return entry
+
+    def write(self, day, df):
+        """
+        Store the announcements of `day`, replacing the ones stored before.
+
+        The day is stored as a delta against the latest day before it, or
+        as a base. Deltas of later days that applied to the replaced
+        announcements are written again.
+
+        Parameters
+        ----------
+        day : str
+            date of the form `yyyy-mm-dd`.
+        df : pandas DataFrame
+            merged announcements of the day. Announcements of the same
+            link are kept once.
+
+        Returns
+        -------
+        str
+            `base` or `delta`.
+
+        """
+        if not path.isdir(self.folder):
+            mkdir(self.folder)
+        self._remove_orphans()
+
+        view = compact(df)
+        num_rows = len(view)
+        view = view.drop_duplicates(subset='link')
+        if len(view) < num_rows:
+            log('warn', f'{num_rows - len(view)} announcements of {day} are kept once.')
+        columns = list(view.columns)
+        view = view.set_index('link')
+        # later days whose deltas applied to the old rows of the day
+        children = {child: self._read_view(child)
+                    for child, entry in self.manifest['days'].items() if entry['parent'] == day}
+
+        manifest = {'version': SNAPSHOT_VERSION, 'next': self.manifest['next'],
+                    'days': dict(self.manifest['days'])}
+        manifest['days'].pop(day, None)
+        parent = self._previous_day(day, manifest['days'])
+        parent_view = None if parent is None else self._read_view(parent)
+        entry = self._put(manifest, day, view, columns, parent, parent_view)
+        for child, child_view in children.items():
+            self._put(manifest, child, child_view, manifest['days'][child]['columns'], day, view)
+
+        self._save_manifest(manifest)
+        self._remove_orphans()
+        self._last_view = (day, view)
+        self._last_changes = None
+        kind = 'base' if entry['parent'] is None else 'delta'
+        log('info', f'Snapshot of {day}: {len(view)} announcements stored as a {kind}.')
+        return kind
+
+    def _save_manifest(self, manifest):
+        write_json(self._path(MANIFEST_FILENAME), manifest, indent=1)
+        self.manifest = manifest
+
+    def _remove_orphans(self):
+        """Delete the files of writes that stopped or that were replaced."""
+        if not path.isdir(self.folder):
+            return
+        recorded = {MANIFEST_FILENAME}
+        recorded.update(entry['file'] for entry in self.manifest['days'].values())
+        remove_unrecorded(self.folder, recorded)
@@ -0,0 +1,304 @@
+from datetime import datetime
+from os import path, listdir, makedirs, rename
+from shutil import rmtree
+
+from .files import atomic_write
+from .schema import COLUMN_NAMES, unpack_amenities
+
+
+# folder of the partitioned dataset inside `temporary_files` and `Database`
+DATASET_FOLDER = 'dataset'
+# partition keys: the date of the scrape and the filters of the OLX section.
+# `temporary_files` has a folder per section, `Database` a folder per date
+# holding one file, because every file and row group costs about as much
+# to read as thousands of rows.
+PARTITIONS = ['scraped', 'section_commission', 'section_furnished',
+              'section_home_type', 'section_district']
+PART_FILENAME = 'part-0.parquet'
+TEXT_COLUMNS = ['link', 'date', 'home_type', 'district', 'condition', 'build_type',
+                'build_plan', 'bathroom', 'title_text', 'post_text', 'currency']
+FLOAT_COLUMNS = ['price', 'price_m2', 'ceil_height', 'raw_price']
+INT_COLUMNS = ['num_rooms', 'area', 'apart_floor', 'home_floor', 'build_year']
+BOOL_COLUMNS = ['furnished', 'commission', 'hospital', 'playground', 'kindergarten',
+                'park', 'recreation', 'school', 'restaurant', 'supermarket', 'listing_only']
+
+
+def iso_date(date):
+    """Convert a `dd-mm-yyyy` date to `yyyy-mm-dd`, which sorts and compares as text."""
+    return datetime.strptime(date, '%d-%m-%Y').strftime('%Y-%m-%d')
+
+
+def ad_dates(dates):
+    """
+    Return the dates of announcements as datetimes. Files scraped before
+    dates were parsed hold them as `dd-mm-yyyy` text, later ones as
+    datetimes. Dates that cannot be read become NaT.
+    """
+    from pandas import to_datetime
+
+    return to_datetime(dates, format='%d-%m-%Y', errors='coerce')
+
+
+def partition_file(folder, date, commission, furnished, home_type, district):
+    """
+    Return the Parquet file of one section in the dataset of `folder`.
+
+    Parameters
+    ----------
+    folder : str
+        `temporary_files` or `Database` folder.
+    date : str
+        date of the scrape of the form `dd-mm-yyyy`.
+    commission : str
+        `yes` or `no`.
+    furnished : str
+        `yes` or `no`.
+    home_type : str
+        `novostroyki` or `vtorichnyy-rynok`.
+    district : str
+        name of the district.
+
+    Returns
+    -------
+    str
+        path of the form
+        `folder/dataset/scraped=.../section_commission=.../.../part-0.parquet`.
+
+    """
+    values = [iso_date(date), commission, furnished, home_type, district]
+    keys = [f'{name}={value}' for name, value in zip(PARTITIONS, values)]
+    return path.join(folder, DATASET_FOLDER, *keys, PART_FILENAME)
+
+
+def partition_keys(filename):
+    """Return the partition keys in the folders of `filename` as a dict."""
+    keys = {}
+    for folder in filename.replace('\\', '/').split('/'):
+        name, _, value = folder.partition('=')
+        if name in PARTITIONS:
+            keys[name] = value
+    return keys
+
+
+_schema = None
+
+
+def schema():
+    """
+    Return the Arrow schema of a section: the columns of the scraped
+    DataFrame followed by the filters of the section.
+    """
+    global _schema
+    if _schema is None:
+        import pyarrow as pa
+
+        types = {}
+        types.update({name: pa.string() for name in TEXT_COLUMNS})
+        types.update({name: pa.float64() for name in FLOAT_COLUMNS})
+        types.update({name: pa.int32() for name in INT_COLUMNS})
+        types.update({name: pa.bool_() for name in BOOL_COLUMNS})
+        types.update({name: pa.string() for name in PARTITIONS[1:]})
+        _schema = pa.schema([(name, types[name]) for name in COLUMN_NAMES + PARTITIONS[1:]])
+    return _schema
+
+
+def write_partition(df, filename):
+    """
+    Write the DataFrame of one section as a compressed Parquet file.
+
+    The filters of the section are taken from the folders of `filename`
+    and stored as columns too. Dates are stored as `dd-mm-yyyy` text, as
+    in files written before they were parsed, and packed amenities as
+    Parquet booleans, which are bit-packed on disk anyway. The file is
+    written under a temporary name first, so a partition is either
+    complete or missing.
+
+    Parameters
+    ----------
+    df : pandas DataFrame
+        scraped announcements of the section.
+    filename : str
+        file returned by `partition_file`.
+
+    Returns
+    -------
+    None.
+
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    makedirs(path.dirname(filename), exist_ok=True)
+    df = unpack_amenities(df).assign(**{name: value
+                                        for name, value in partition_keys(filename).items()
+                                        if name != PARTITIONS[0]})
+    if df['date'].dtype.kind == 'M':
+        df['date'] = df['date'].dt.strftime('%d-%m-%Y')
+    table = pa.Table.from_pandas(df, schema=schema(), preserve_index=False, safe=False)
+    with atomic_write(filename) as temporary:
+        pq.write_table(table, temporary, compression='zstd')
+
+
+def read_partition(filename):
+    """
+    Read the Parquet file of one section, as written by `write_partition`,
+    with `date` as datetimes. Columns added after the file was written
+    are read as nulls.
+    """
+    import pyarrow.dataset as ds
+
+    dataset = ds.dataset(filename, format='parquet', schema=schema())
+    df = dataset.to_table(columns=COLUMN_NAMES).to_pandas()
+    df['date'] = ad_dates(df['date'])
+    return df
+
+
+def dataset_exists(folder):
+    """True if `folder` contains a partitioned dataset."""
+    return path.isdir(path.join(folder, DATASET_FOLDER))
+
+
+def dataset_days(folder):
+    """Return the scrape dates (`yyyy-mm-dd`) in the dataset of `folder`, oldest first."""
+    prefix = f'{PARTITIONS[0]}='
+    return sorted(name[len(prefix):] for name in listdir(path.join(folder, DATASET_FOLDER))
+                  if name.startswith(prefix))
+
+
+def read_dataset(folder, columns=None, filters=None, day=None):
+    """
+    Read the partitioned dataset of `folder` into one DataFrame.
+
+    Only the requested columns are read, and row groups and partitions
+    that cannot match `filters` are skipped without being decoded. The
+    section filters are available as the columns `section_commission`,
+    `section_furnished`, `section_home_type` and `section_district`, and
+    the date of the scrape as `scraped`. `date` is returned as datetimes.
+
+    Parameters
+    ----------
+    folder : str
+        `temporary_files` or `Database` folder.
+    columns : list of str or None
+        columns to read. If None, the columns of the scraped DataFrames
+        are read.
+    filters : pyarrow.compute.Expression or None
+        condition the rows must meet, e.g. `month_filter()`.
+    day : str or None
+        if given, only the sections scraped on this date (`yyyy-mm-dd`)
+        are read.
+
+    Returns
+    -------
+    pandas DataFrame.
+
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    # the other keys are stored in the files, so only the date is read from the folders
+    partition_field = pa.field(PARTITIONS[0], pa.string())
+    partitioning = ds.partitioning(pa.schema([partition_field]), flavor='hive')
+    # columns added after a file was written are read as nulls
+    dataset = ds.dataset(path.join(folder, DATASET_FOLDER), format='parquet',
+                         schema=schema().append(partition_field),
+                         partitioning=partitioning, ignore_prefixes=['.', '_'])
+    if columns is None:
+        columns = COLUMN_NAMES
+    if day is not None:
+        day_filter = ds.field(PARTITIONS[0]) == day
+        filters = day_filter if filters is None else day_filter & filters
+    table = dataset.to_table(columns=columns, filter=filters)
+    df = table.to_pandas()
+    if 'date' in df:
+        df['date'] = ad_dates(df['date'])
+    return df
+
+
+def month_filter():
+    """
+    Return the conditions of `merge_month_pickles` as a dataset filter:
+    30 <= area <= 310, price_m2 >= 300, apart_floor <= home_floor and
+    num_rooms <= 8.
+    """
+    import pyarrow.dataset as ds
+
+    return ((ds.field('area') >= 30) & (ds.field('area') <= 310)
+            & (ds.field('price_m2') >= 300)
+            & (ds.field('apart_floor') <= ds.field('home_floor'))
+            & (ds.field('num_rooms') <= 8))
+
+
+def scraped_folder(folder, date):
+    """Return the folder holding every section scraped on `date` (`dd-mm-yyyy`)."""
+    return path.join(folder, DATASET_FOLDER, f'{PARTITIONS[0]}={iso_date(date)}')
+
+
+def compact_partitions(source, destination, date):
+    """
+    Write the sections scraped on `date` in the dataset of `source` as one
+    file of the dataset of `destination`. The file of that date is
+    replaced if it exists.
+
+    Returns
+    -------
+    int
+        number of sections written.
+
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    source_folder = scraped_folder(source, date)
+    partitions = _partition_folders(source_folder) if path.isdir(source_folder) else []
+    if not partitions:
+        return 0
+
+    target = path.join(scraped_folder(destination, date), PART_FILENAME)
+    makedirs(path.dirname(target), exist_ok=True)
+    table = pa.concat_tables([pq.read_table(path.join(partition, PART_FILENAME),
+                                            schema=schema())
+                              for partition in partitions])
+    with atomic_write(target) as temporary:
+        pq.write_table(table, temporary, compression='zstd')
+    return len(partitions)
+
+
+def rename_partitions(folder, yesterday, today):
+    """
+    Move the sections scraped `yesterday` to the partition of `today`
+    unless today's partition of the same section already exists.
+
+    Returns
+    -------
+    int
+        number of sections renamed.
+
+    """
+    yesterday_folder = scraped_folder(folder, yesterday)
+    if not path.isdir(yesterday_folder):
+        return 0
+
+    partitions = _partition_folders(yesterday_folder)
+    renamed = 0
+    for partition in partitions:
+        target = path.join(scraped_folder(folder, today),
+                           path.relpath(partition, yesterday_folder))
+        if not path.isdir(target):
+            makedirs(path.dirname(target), exist_ok=True)
+            rename(partition, target)
+            renamed += 1
+    if renamed == len(partitions):
+        rmtree(yesterday_folder)
+    return renamed
+
+
+def _partition_folders(folder):
+    """Return the innermost partition folders below `folder`."""
+    if path.isfile(path.join(folder, PART_FILENAME)):
+        return [folder]
+    folders = []
+    for name in sorted(listdir(folder)):
+        if path.isdir(path.join(folder, name)):
+            folders.extend(_partition_folders(path.join(folder, name)))
+    return folders